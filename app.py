@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify,render_template,  redirect, url_for
+from flask import Flask, Response, request, jsonify,render_template,  redirect, url_for
 from flask_cors import CORS
 import psycopg2
 from psycopg2.extras import RealDictCursor
@@ -8,15 +8,36 @@ from dotenv import load_dotenv
 import jwt
 import datetime
 from functools import wraps
-from r2_utils import r2_upload_file, r2_delete_file,r2_client
-from db_init import db_init, get_db_connection , db_reset
+from werkzeug.exceptions import ClientDisconnected
+from r2_utils import r2_pool_stats
+from blob_store import UploadExpiredError, HashingRequest, upload_file, discard_uploads, claim_uploads
+from direct_upload import UploadError, presign, finalize, stream_upload, uploaded_urls
+from image_utils import upload_images, upload_image, variant_urls, attach_srcset
+from jobs import enqueue_r2_delete, enqueue_image_variants
+from db_init import db_init, db_reset
+from db_pool import get_db, get_pool, init_app as init_db_pool
+from pagination import PaginationError, wants_keyset, keyset_page, wants_page, offset_page, invalidate_count
+from response_cache import cached, invalidate as invalidate_cache, on_invalidate, cache as response_cache
+from http_cache import conditional
+from json_provider import init_app as init_json_provider, json_cursor
+from export import ExportError, export_stream
+from site_import import SiteImportError, read_rows, import_sites
+from site_search import SearchError, search_sites
+from text_search import search_text
+from site_map import site_features, site_clusters
+from expiry_report import expiry_report, expiring_sites, report_csv
 import json
 
 app = Flask(__name__)
+app.request_class = HashingRequest  # 上傳檔案在 multipart 解析時就算好 SHA-256（blob_store 去重用）
+# 整個 request body 的上限（multipart 表單與 /api/uploads/stream 都適用），超過回 413
+app.config["MAX_CONTENT_LENGTH"] = int(float(os.getenv("MAX_CONTENT_LENGTH_MB", "210")) * 1024 * 1024)
 CORS(app)
+init_db_pool(app)
+init_json_provider(app)
+on_invalidate(invalidate_count)
 
 load_dotenv()
-r2_client()
 # PostgreSQL 資料庫連線設定
 
 
@@ -52,7 +73,7 @@ def login_api():
         if not username or not password:
             return jsonify(message="請提供帳號與密碼"), 400
 
-        conn = get_db_connection()
+        conn = get_db()
         cur = conn.cursor()
         cur.execute("SELECT password_hash FROM users WHERE username = %s", (username,))
         row = cur.fetchone()
@@ -78,8 +99,6 @@ def login_api():
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
 
 def jwt_required(f):
     @wraps(f)
@@ -106,52 +125,60 @@ def jwt_required(f):
 
 # ✅ 取得所有空氣淨化區
 @app.get("/api/purification_zones")
+@conditional("purification_zones")
+@cached("purification_zones")
 def get_all_zones():
     year = request.args.get("year")
     district = request.args.get("district")
 
-    sql = "SELECT * FROM purification_zones WHERE 1=1"
+    where_sql = "1=1"
     params = []
 
     if year:
-        sql += " AND year = %s"
+        where_sql += " AND year = %s"
         params.append(year)
     if district:
-        sql += " AND district = %s"
+        where_sql += " AND district = %s"
         params.append(district)
 
-    sql += " ORDER BY created_at DESC"
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
+        # 預設 ?limit=&cursor= → {items, next_cursor, total}；?all=1 才回舊的整包陣列
+        if wants_keyset(request.args):
+            page = keyset_page(cursor, "purification_zones", where_sql, params, request.args)
+            page["items"] = [attach_srcset(row) for row in page["items"]]
+            return jsonify(page), 200
+
+        cursor.execute(f"SELECT * FROM purification_zones WHERE {where_sql} ORDER BY created_at DESC", params)
+        rows = [attach_srcset(row) for row in cursor.fetchall()]
         return jsonify(rows), 200
 
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
 
 
 # ✅ 取得單一資料
 @app.get("/api/purification_zones/<int:id>")
+@conditional("purification_zones")
+@cached("purification_zones")
 def get_zone(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
         cursor.execute("SELECT * FROM purification_zones WHERE id = %s;", (id,))
         row = cursor.fetchone()
 
         if row:
-            if row.get("image_urls"):
-                if isinstance(row["image_urls"], str):
-                    row["image_urls"] = json.loads(row["image_urls"])
-            return jsonify(row), 200
+            # image_urls 轉成 list，並附上 srcset 用的 images
+            return jsonify(attach_srcset(row)), 200
         else:
             return jsonify({"error": "Not found"}), 404
 
@@ -160,25 +187,24 @@ def get_zone(id):
 
     finally:
         cursor.close()
-        conn.close()
 
 # ✅ 新增資料
 @app.post("/api/purification_zones")
 @jwt_required
 def create_zone():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
+    # 取得圖片（若有上傳）：先平行上傳完，再跟 pool 借 DB 連線
+    new_urls, image_variants = upload_images(request.files.getlist("images"), folder="purification_zones")
+    # 瀏覽器已經直接傳到 R2 的圖（/api/uploads），衍生圖由 worker 補；
+    # 引用在存檔時才認領，失敗時不還（保留到期由 r2_gc.py 收回，表單可以重送）
+    direct_urls = uploaded_urls(request.form.getlist("uploaded_images"), "purification_zones")
+    image_urls = new_urls + direct_urls
+
+    # 借連線失敗（pool 逾時）也要把剛上傳的圖還回去，所以 get_db() 放在 try 裡
+    conn = cursor = None
     try:
-        # 取得圖片（若有上傳）
-        images = request.files.getlist("images")
-        image_urls = []
+        conn = get_db()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
 
-        for img in images:
-            if img and img.filename:
-                url = r2_upload_file(img, folder="purification_zones")
-                if url:
-                    image_urls.append(url)
         # 取得表單欄位資料
 
         image_urls_value = json.dumps(image_urls) if image_urls else None
@@ -189,11 +215,11 @@ def create_zone():
                 serial, year, district, type, project_name,
                 maintain_unit, adopt_unit, area, length, maintain_start_date,
                 maintain_end_date, gps,annotation,
-                subsidy_source, image_urls
+                subsidy_source, image_urls, image_variants
             ) VALUES (%s, %s, %s, %s, %s,
                       %s, %s, %s, %s, %s,
-                      %s, %s, %s, %s, %s
-                      )
+                      %s, %s, %s, %s, %s,
+                      %s)
             RETURNING *;
         """, (
             data.get("serial"),
@@ -211,47 +237,64 @@ def create_zone():
             data.get("annotation"),
             data.get("subsidy_source"),
         
-            image_urls_value
+            image_urls_value,
+            json.dumps(image_variants) if image_variants else None
         ))
 
         new_record = cursor.fetchone()
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "purification_zones", "purification_zones", direct_urls)
         conn.commit()
+        invalidate_cache("purification_zones")
         return jsonify(new_record), 201
 
+    except UploadExpiredError as e:
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(image_variants))
+        return jsonify({"error": str(e)}), 410
+
     except Exception as e:
-        conn.rollback()
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(image_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
 
 
 # ✅ 修改資料
 @app.put("/api/purification_zones/<int:id>")
 @jwt_required
 def update_zone(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        form = request.form
-        files = request.files
+    form = request.form
+
+    # ✅ Step 1: Get existing images that user decided to keep
+    existing_images = form.getlist("existing_images")  # frontend must send this as hidden inputs or FormData
 
-        # ✅ Step 1: Get existing images that user decided to keep
-        existing_images = form.getlist("existing_images")  # frontend must send this as hidden inputs or FormData
-        image_urls = existing_images[:]  # start with these
+    # ✅ Step 2: Handle new uploads（平行上傳，完成後才借 DB 連線）
+    new_urls, new_variants = upload_images(request.files.getlist("images"), folder="purification_zones")
+    direct_urls = uploaded_urls(form.getlist("uploaded_images"), "purification_zones")
+    image_urls = existing_images + new_urls + direct_urls
 
-        # ✅ Step 2: Handle new uploads
-        new_files = request.files.getlist("images")
-        for img in new_files:
-            if img and img.filename:
-                url = r2_upload_file(img, folder="purification_zones")
-                if url:
-                    image_urls.append(url)
+    conn = cursor = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
 
         # ✅ Step 3: Convert to JSON for Postgres JSONB
         image_urls_value = json.dumps(image_urls) if image_urls else None
 
+        # 原本的圖片中沒被保留的，更新後要從 R2 刪掉
+        cursor.execute("SELECT image_urls, image_variants FROM purification_zones WHERE id = %s FOR UPDATE;", (id,))
+        current = cursor.fetchone()
+        old_urls = (current or {}).get("image_urls") or []
+        old_variants = (current or {}).get("image_variants") or {}
+        image_variants = {url: old_variants[url] for url in existing_images if url in old_variants}
+        image_variants.update(new_variants)
+
         cursor.execute("""
             UPDATE purification_zones SET
                 serial = %s,
@@ -268,7 +311,8 @@ def update_zone(id):
                 gps = %s,
                 subsidy_source = %s,
                 annotation = %s,
-                image_urls = %s
+                image_urls = %s,
+                image_variants = %s
             WHERE id = %s
             RETURNING *;
         """, (
@@ -287,32 +331,53 @@ def update_zone(id):
             form.get("subsidy_source"),
             form.get("annotation"),
             image_urls_value,
+            json.dumps(image_variants) if image_variants else None,
             id
         ))
 
         updated = cursor.fetchone()
+        if not updated:
+            # 不存在的 id：這次上傳拿到的引用也要還回去
+            conn.rollback()
+            discard_uploads(new_urls + variant_urls(new_variants))
+            return jsonify({"error": "ID not found"}), 404
+
+        # 新上傳的圖各自已經算過一次引用，所以這裡只看舊圖有沒有被保留（重傳同一張也要扣掉舊的引用）
+        removed = [url for url in old_urls if url not in existing_images]
+        enqueue_r2_delete(cursor, removed + variant_urls(old_variants, removed))
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "purification_zones", "purification_zones", direct_urls)
         conn.commit()
-        return jsonify(updated), 200 if updated else (jsonify({"error": "ID not found"}), 404)
+        invalidate_cache("purification_zones")
+        return jsonify(updated), 200
+
+    except UploadExpiredError as e:
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(new_variants))
+        return jsonify({"error": str(e)}), 410
 
     except Exception as e:
-        conn.rollback()
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(new_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
 
 
 # ✅ 刪除資料
 @app.delete("/api/purification_zones/<int:id>")
 @jwt_required
 def delete_zone(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)  # ✅ use dict-like rows
 
     try:
         # Step 1: Fetch the record first (to get image_urls)
-        cursor.execute("SELECT image_urls FROM purification_zones WHERE id = %s;", (id,))
+        cursor.execute("SELECT image_urls, image_variants FROM purification_zones WHERE id = %s;", (id,))
         record = cursor.fetchone()
 
         if not record:
@@ -329,11 +394,11 @@ def delete_zone(id):
         # Step 2: Delete DB row
         cursor.execute("DELETE FROM purification_zones WHERE id = %s RETURNING *;", (id,))
         deleted = cursor.fetchone()
-        conn.commit()
 
-        # Step 3: Delete images from R2
-        for url in image_urls:
-            r2_delete_file(url)
+        # Step 3: Delete images from R2：跟刪除同一個 transaction 排進 jobs，由 worker 執行
+        enqueue_r2_delete(cursor, image_urls + variant_urls(record["image_variants"]))
+        conn.commit()
+        invalidate_cache("purification_zones")
 
         return jsonify({
             "deleted": deleted,
@@ -346,11 +411,11 @@ def delete_zone(id):
 
     finally:
         cursor.close()
-        conn.close()
 
 @app.route("/api/purification_zones/visibility", methods=["GET"])
+@conditional("settings")
 def get_visibility():
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
     try:
@@ -366,12 +431,11 @@ def get_visibility():
 
     finally:
         cursor.close()
-        conn.close()
 
 @app.route("/api/purification_zones/visibility", methods=["PUT"])
 @jwt_required
 def update_visibility():
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
     try:
@@ -381,6 +445,7 @@ def update_visibility():
         cursor.execute("UPDATE settings SET visible = %s WHERE section = %s RETURNING *;", (visible, 'greenifications'))
         state = cursor.fetchone()
         conn.commit()
+        invalidate_cache("settings")
 
         if state:
             return jsonify({"success": True, "visible": state['visible']})
@@ -391,59 +456,66 @@ def update_visibility():
 
     finally:
         cursor.close()
-        conn.close()
 
 
 ## ---------------------------------空氣綠牆區 區塊 -------------------------------------------##
 
 # ✅ 取得所有空氣綠牆區
 @app.get("/api/green_walls")
+@conditional("green_walls")
+@cached("green_walls")
 def get_all_greenWalls():
     year = request.args.get("year")
     district = request.args.get("district")
 
-    sql = "SELECT * FROM green_walls WHERE 1=1"
+    where_sql = "1=1"
     params = []
 
     if year:
-        sql += " AND year = %s"
+        where_sql += " AND year = %s"
         params.append(year)
     if district:
-        sql += " AND district = %s"
+        where_sql += " AND district = %s"
         params.append(district)
 
-    sql += " ORDER BY created_at DESC"
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
+        # 預設 ?limit=&cursor= → {items, next_cursor, total}；?all=1 才回舊的整包陣列
+        if wants_keyset(request.args):
+            page = keyset_page(cursor, "green_walls", where_sql, params, request.args)
+            page["items"] = [attach_srcset(row) for row in page["items"]]
+            return jsonify(page), 200
+
+        cursor.execute(f"SELECT * FROM green_walls WHERE {where_sql} ORDER BY created_at DESC", params)
+        rows = [attach_srcset(row) for row in cursor.fetchall()]
         return jsonify(rows), 200
 
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
 
 
 # ✅ 取得單一資料
 @app.get("/api/green_walls/<int:id>")
+@conditional("green_walls")
+@cached("green_walls")
 def get_greenWall(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
         cursor.execute("SELECT * FROM green_walls WHERE id = %s;", (id,))
         row = cursor.fetchone()
 
         if row:
-            if row.get("image_urls"):
-                if isinstance(row["image_urls"], str):
-                    row["image_urls"] = json.loads(row["image_urls"])
-            return jsonify(row), 200
+            # image_urls 轉成 list，並附上 srcset 用的 images
+            return jsonify(attach_srcset(row)), 200
         else:
             return jsonify({"error": "Not found"}), 404
 
@@ -452,26 +524,25 @@ def get_greenWall(id):
 
     finally:
         cursor.close()
-        conn.close()
 
 
 # ✅ 新增資料
 @app.post("/api/green_walls")
 @jwt_required
 def create_greenWall():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
+    # 取得圖片（若有上傳）：先平行上傳完，再跟 pool 借 DB 連線
+    new_urls, image_variants = upload_images(request.files.getlist("images"), folder="green_walls")
+    # 瀏覽器已經直接傳到 R2 的圖（/api/uploads），衍生圖由 worker 補；
+    # 引用在存檔時才認領，失敗時不還（保留到期由 r2_gc.py 收回，表單可以重送）
+    direct_urls = uploaded_urls(request.form.getlist("uploaded_images"), "green_walls")
+    image_urls = new_urls + direct_urls
+
+    # 借連線失敗（pool 逾時）也要把剛上傳的圖還回去，所以 get_db() 放在 try 裡
+    conn = cursor = None
     try:
-        # 取得圖片（若有上傳）
-        images = request.files.getlist("images")
-        image_urls = []
+        conn = get_db()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
 
-        for img in images:
-            if img and img.filename:
-                url = r2_upload_file(img, folder="green_walls")
-                if url:
-                    image_urls.append(url)
         # 取得表單欄位資料
 
         image_urls_value = json.dumps(image_urls) if image_urls else None
@@ -482,11 +553,11 @@ def create_greenWall():
                 serial, year, district, type, project_name,
                 maintain_unit, adopt_unit, area, length, maintain_start_date,
                 maintain_end_date, gps,annotation,
-                subsidy_source, image_urls
+                subsidy_source, image_urls, image_variants
             ) VALUES (%s, %s, %s, %s, %s,
                       %s, %s, %s, %s, %s,
-                      %s, %s, %s, %s, %s
-                      )
+                      %s, %s, %s, %s, %s,
+                      %s)
             RETURNING *;
         """, (
             data.get("serial"),
@@ -504,47 +575,64 @@ def create_greenWall():
             data.get("annotation"),
             data.get("subsidy_source"),
         
-            image_urls_value
+            image_urls_value,
+            json.dumps(image_variants) if image_variants else None
         ))
 
         new_record = cursor.fetchone()
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "green_walls", "green_walls", direct_urls)
         conn.commit()
+        invalidate_cache("green_walls")
         return jsonify(new_record), 201
 
+    except UploadExpiredError as e:
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(image_variants))
+        return jsonify({"error": str(e)}), 410
+
     except Exception as e:
-        conn.rollback()
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(image_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
 
 
 # ✅ 修改資料
 @app.route("/api/green_walls/<int:id>", methods=["PUT"])
 @jwt_required
 def update_greenWall(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        form = request.form
-        files = request.files
+    form = request.form
 
-        # ✅ Step 1: Get existing images that user decided to keep
-        existing_images = form.getlist("existing_images")  # frontend must send this as hidden inputs or FormData
-        image_urls = existing_images[:]  # start with these
+    # ✅ Step 1: Get existing images that user decided to keep
+    existing_images = form.getlist("existing_images")  # frontend must send this as hidden inputs or FormData
 
-        # ✅ Step 2: Handle new uploads
-        new_files = request.files.getlist("images")
-        for img in new_files:
-            if img and img.filename:
-                url = r2_upload_file(img, folder="green_walls")
-                if url:
-                    image_urls.append(url)
+    # ✅ Step 2: Handle new uploads（平行上傳，完成後才借 DB 連線）
+    new_urls, new_variants = upload_images(request.files.getlist("images"), folder="green_walls")
+    direct_urls = uploaded_urls(form.getlist("uploaded_images"), "green_walls")
+    image_urls = existing_images + new_urls + direct_urls
+
+    conn = cursor = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
 
         # ✅ Step 3: Convert to JSON for Postgres JSONB
         image_urls_value = json.dumps(image_urls) if image_urls else None
 
+        # 原本的圖片中沒被保留的，更新後要從 R2 刪掉
+        cursor.execute("SELECT image_urls, image_variants FROM green_walls WHERE id = %s FOR UPDATE;", (id,))
+        current = cursor.fetchone()
+        old_urls = (current or {}).get("image_urls") or []
+        old_variants = (current or {}).get("image_variants") or {}
+        image_variants = {url: old_variants[url] for url in existing_images if url in old_variants}
+        image_variants.update(new_variants)
+
         cursor.execute("""
             UPDATE green_walls SET
                 serial = %s,
@@ -561,7 +649,8 @@ def update_greenWall(id):
                 gps = %s,
                 subsidy_source = %s,
                 annotation = %s,
-                image_urls = %s
+                image_urls = %s,
+                image_variants = %s
             WHERE id = %s
             RETURNING *;
         """, (
@@ -580,31 +669,52 @@ def update_greenWall(id):
             form.get("subsidy_source"),
             form.get("annotation"),
             image_urls_value,
+            json.dumps(image_variants) if image_variants else None,
             id
         ))
 
         updated = cursor.fetchone()
+        if not updated:
+            # 不存在的 id：這次上傳拿到的引用也要還回去
+            conn.rollback()
+            discard_uploads(new_urls + variant_urls(new_variants))
+            return jsonify({"error": "ID not found"}), 404
+
+        # 新上傳的圖各自已經算過一次引用，所以這裡只看舊圖有沒有被保留（重傳同一張也要扣掉舊的引用）
+        removed = [url for url in old_urls if url not in existing_images]
+        enqueue_r2_delete(cursor, removed + variant_urls(old_variants, removed))
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "green_walls", "green_walls", direct_urls)
         conn.commit()
-        return jsonify(updated), 200 if updated else (jsonify({"error": "ID not found"}), 404)
+        invalidate_cache("green_walls")
+        return jsonify(updated), 200
+
+    except UploadExpiredError as e:
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(new_variants))
+        return jsonify({"error": str(e)}), 410
 
     except Exception as e:
-        conn.rollback()
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(new_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
 
 # ✅ 刪除資料
 @app.delete("/api/green_walls/<int:id>")
 @jwt_required
 def delete_greenWall(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)  # ✅ use dict-like rows
 
     try:
         # Step 1: Fetch the record first (to get image_urls)
-        cursor.execute("SELECT image_urls FROM green_walls WHERE id = %s;", (id,))
+        cursor.execute("SELECT image_urls, image_variants FROM green_walls WHERE id = %s;", (id,))
         record = cursor.fetchone()
 
         if not record:
@@ -621,11 +731,11 @@ def delete_greenWall(id):
         # Step 2: Delete DB row
         cursor.execute("DELETE FROM green_walls WHERE id = %s RETURNING *;", (id,))
         deleted = cursor.fetchone()
-        conn.commit()
 
-        # Step 3: Delete images from R2
-        for url in image_urls:
-            r2_delete_file(url)
+        # Step 3: Delete images from R2：跟刪除同一個 transaction 排進 jobs，由 worker 執行
+        enqueue_r2_delete(cursor, image_urls + variant_urls(record["image_variants"]))
+        conn.commit()
+        invalidate_cache("green_walls")
 
         return jsonify({
             "deleted": deleted,
@@ -638,58 +748,65 @@ def delete_greenWall(id):
 
     finally:
         cursor.close()
-        conn.close()
 
 ## ---------------------------------綠美化 區塊 -------------------------------------------##
 
 # ✅ 取得所有綠美化
 @app.get("/api/greenifications")
+@conditional("greenifications")
+@cached("greenifications")
 def get_all_greenifications():
     year = request.args.get("year")
     district = request.args.get("district")
 
-    sql = "SELECT * FROM greenifications WHERE 1=1"
+    where_sql = "1=1"
     params = []
 
     if year:
-        sql += " AND year = %s"
+        where_sql += " AND year = %s"
         params.append(year)
     if district:
-        sql += " AND district = %s"
+        where_sql += " AND district = %s"
         params.append(district)
 
-    sql += " ORDER BY created_at DESC"
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
+        # 預設 ?limit=&cursor= → {items, next_cursor, total}；?all=1 才回舊的整包陣列
+        if wants_keyset(request.args):
+            page = keyset_page(cursor, "greenifications", where_sql, params, request.args)
+            page["items"] = [attach_srcset(row) for row in page["items"]]
+            return jsonify(page), 200
+
+        cursor.execute(f"SELECT * FROM greenifications WHERE {where_sql} ORDER BY created_at DESC", params)
+        rows = [attach_srcset(row) for row in cursor.fetchall()]
         return jsonify(rows), 200
 
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
 
 
 # ✅ 取得單一資料
 @app.get("/api/greenifications/<int:id>")
+@conditional("greenifications")
+@cached("greenifications")
 def get_greenification(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
         cursor.execute("SELECT * FROM greenifications WHERE id = %s;", (id,))
         row = cursor.fetchone()
 
         if row:
-            if row.get("image_urls"):
-                if isinstance(row["image_urls"], str):
-                    row["image_urls"] = json.loads(row["image_urls"])
-            return jsonify(row), 200
+            # image_urls 轉成 list，並附上 srcset 用的 images
+            return jsonify(attach_srcset(row)), 200
         else:
             return jsonify({"error": "Not found"}), 404
 
@@ -698,25 +815,24 @@ def get_greenification(id):
 
     finally:
         cursor.close()
-        conn.close()
 
 # ✅ 新增資料
 @app.post("/api/greenifications")
 @jwt_required
 def create_greenification():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
+    # 取得圖片（若有上傳）：先平行上傳完，再跟 pool 借 DB 連線
+    new_urls, image_variants = upload_images(request.files.getlist("images"), folder="greenifications")
+    # 瀏覽器已經直接傳到 R2 的圖（/api/uploads），衍生圖由 worker 補；
+    # 引用在存檔時才認領，失敗時不還（保留到期由 r2_gc.py 收回，表單可以重送）
+    direct_urls = uploaded_urls(request.form.getlist("uploaded_images"), "greenifications")
+    image_urls = new_urls + direct_urls
+
+    # 借連線失敗（pool 逾時）也要把剛上傳的圖還回去，所以 get_db() 放在 try 裡
+    conn = cursor = None
     try:
-        # 取得圖片（若有上傳）
-        images = request.files.getlist("images")
-        image_urls = []
+        conn = get_db()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
 
-        for img in images:
-            if img and img.filename:
-                url = r2_upload_file(img, folder="greenifications")
-                if url:
-                    image_urls.append(url)
         # 取得表單欄位資料
 
         image_urls_value = json.dumps(image_urls) if image_urls else None
@@ -727,11 +843,11 @@ def create_greenification():
                 serial, year, district, type, project_name,
                 maintain_unit, adopt_unit, area, length, maintain_start_date,
                 maintain_end_date, gps,annotation,
-                subsidy_source, image_urls
+                subsidy_source, image_urls, image_variants
             ) VALUES (%s, %s, %s, %s, %s,
                       %s, %s, %s, %s, %s,
-                      %s, %s, %s, %s, %s
-                      )
+                      %s, %s, %s, %s, %s,
+                      %s)
             RETURNING *;
         """, (
             data.get("serial"),
@@ -749,47 +865,64 @@ def create_greenification():
             data.get("annotation"),
             data.get("subsidy_source"),
         
-            image_urls_value
+            image_urls_value,
+            json.dumps(image_variants) if image_variants else None
         ))
 
         new_record = cursor.fetchone()
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "greenifications", "greenifications", direct_urls)
         conn.commit()
+        invalidate_cache("greenifications")
         return jsonify(new_record), 201
 
+    except UploadExpiredError as e:
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(image_variants))
+        return jsonify({"error": str(e)}), 410
+
     except Exception as e:
-        conn.rollback()
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(image_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
 
 
 # ✅ 修改資料
 @app.put("/api/greenifications/<int:id>")
 @jwt_required
 def update_greenification(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        form = request.form
-        files = request.files
+    form = request.form
 
-        # ✅ Step 1: Get existing images that user decided to keep
-        existing_images = form.getlist("existing_images")  # frontend must send this as hidden inputs or FormData
-        image_urls = existing_images[:]  # start with these
+    # ✅ Step 1: Get existing images that user decided to keep
+    existing_images = form.getlist("existing_images")  # frontend must send this as hidden inputs or FormData
 
-        # ✅ Step 2: Handle new uploads
-        new_files = request.files.getlist("images")
-        for img in new_files:
-            if img and img.filename:
-                url = r2_upload_file(img, folder="green_walls")
-                if url:
-                    image_urls.append(url)
+    # ✅ Step 2: Handle new uploads（平行上傳，完成後才借 DB 連線）
+    new_urls, new_variants = upload_images(request.files.getlist("images"), folder="greenifications")
+    direct_urls = uploaded_urls(form.getlist("uploaded_images"), "greenifications")
+    image_urls = existing_images + new_urls + direct_urls
+
+    conn = cursor = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
 
         # ✅ Step 3: Convert to JSON for Postgres JSONB
         image_urls_value = json.dumps(image_urls) if image_urls else None
 
+        # 原本的圖片中沒被保留的，更新後要從 R2 刪掉
+        cursor.execute("SELECT image_urls, image_variants FROM greenifications WHERE id = %s FOR UPDATE;", (id,))
+        current = cursor.fetchone()
+        old_urls = (current or {}).get("image_urls") or []
+        old_variants = (current or {}).get("image_variants") or {}
+        image_variants = {url: old_variants[url] for url in existing_images if url in old_variants}
+        image_variants.update(new_variants)
+
         cursor.execute("""
             UPDATE greenifications SET
                 serial = %s,
@@ -806,7 +939,8 @@ def update_greenification(id):
                 gps = %s,
                 subsidy_source = %s,
                 annotation = %s,
-                image_urls = %s
+                image_urls = %s,
+                image_variants = %s
             WHERE id = %s
             RETURNING *;
         """, (
@@ -825,35 +959,53 @@ def update_greenification(id):
             form.get("subsidy_source"),
             form.get("annotation"),
             image_urls_value,
+            json.dumps(image_variants) if image_variants else None,
             id
         ))
 
         updated = cursor.fetchone()
-        conn.commit()
-        if updated:
-            return jsonify(updated), 200
-        else:
+        if not updated:
+            # 不存在的 id：這次上傳拿到的引用也要還回去
+            conn.rollback()
+            discard_uploads(new_urls + variant_urls(new_variants))
             return jsonify({"error": "ID not found"}), 404
 
+        # 新上傳的圖各自已經算過一次引用，所以這裡只看舊圖有沒有被保留（重傳同一張也要扣掉舊的引用）
+        removed = [url for url in old_urls if url not in existing_images]
+        enqueue_r2_delete(cursor, removed + variant_urls(old_variants, removed))
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "greenifications", "greenifications", direct_urls)
+        conn.commit()
+        invalidate_cache("greenifications")
+        return jsonify(updated), 200
+
+    except UploadExpiredError as e:
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(new_variants))
+        return jsonify({"error": str(e)}), 410
+
     except Exception as e:
-        conn.rollback()
+        if conn is not None:
+            conn.rollback()
+        discard_uploads(new_urls + variant_urls(new_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
 
 
 # ✅ 刪除資料
 @app.delete("/api/greenifications/<int:id>")
 @jwt_required
 def delete_greenification(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)  # ✅ use dict-like rows
 
     try:
         # Step 1: Fetch the record first (to get image_urls)
-        cursor.execute("SELECT image_urls FROM greenifications WHERE id = %s;", (id,))
+        cursor.execute("SELECT image_urls, image_variants FROM greenifications WHERE id = %s;", (id,))
         record = cursor.fetchone()
 
         if not record:
@@ -870,11 +1022,11 @@ def delete_greenification(id):
         # Step 2: Delete DB row
         cursor.execute("DELETE FROM greenifications WHERE id = %s RETURNING *;", (id,))
         deleted = cursor.fetchone()
-        conn.commit()
 
-        # Step 3: Delete images from R2
-        for url in image_urls:
-            r2_delete_file(url)
+        # Step 3: Delete images from R2：跟刪除同一個 transaction 排進 jobs，由 worker 執行
+        enqueue_r2_delete(cursor, image_urls + variant_urls(record["image_variants"]))
+        conn.commit()
+        invalidate_cache("greenifications")
 
         return jsonify({
             "deleted": deleted,
@@ -887,33 +1039,35 @@ def delete_greenification(id):
 
     finally:
         cursor.close()
-        conn.close()
 
     
 ## ---------------------------------樹種介紹  ------------------------------------------
 @app.post("/api/tree_intros")
 @jwt_required
 def create_tree_intro():
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
+    image_url, image_variants, direct_urls = None, {}, []
     try:
         image = request.files.get("image")
-        image_url = None
 
         if image and image.filename:
-            url = r2_upload_file(image, folder="tree_intros")
-            if url:
-                image_url = url
+            image_url, image_variants = upload_image(image, folder="tree_intros")
+
+        # 沒有附檔時，看是不是已經直接傳到 R2（/api/uploads）
+        direct_urls = [] if image_url else uploaded_urls([request.form.get("uploaded_image", "")], "tree_intros")
+        if direct_urls:
+            image_url = direct_urls[0]
 
         # 取得表單欄位資料 
         data = request.form
 
         cursor.execute("""
             INSERT INTO tree_intros (title, scientific_name ,plant_phenology,features,
-            natural_distribution, usage, other_usage, breeding_intro, source,  image_url)
+            natural_distribution, usage, other_usage, breeding_intro, source,  image_url, image_variants)
             VALUES (%s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s)
+                    %s, %s, %s, %s, %s, %s, %s)
             RETURNING *;
         """, (
             data.get("title"),
@@ -925,49 +1079,89 @@ def create_tree_intro():
             data.get("other_usage"),
             data.get("breeding_intro"),
             data.get("source"),
-            image_url
+            image_url,
+            json.dumps(image_variants) if image_variants else None
         ))
 
         new_data = cursor.fetchone()
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "tree_intros", "tree_intros", direct_urls)
         conn.commit()
+        invalidate_cache("tree_intros")
         return jsonify(new_data), 201
 
+    except UploadExpiredError as e:
+        conn.rollback()
+        discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
+        return jsonify({"error": str(e)}), 410
+
     except Exception as e:
         conn.rollback()
+        discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
 
 @app.get("/api/tree_intros")
+@conditional("tree_intros")
+@cached("tree_intros")
 def get_tree_intros():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
+        # ?page=&limit= → {items, total, page, pages}，列表只取輕量欄位
+        if wants_page(request.args):
+            page = offset_page(cursor, "tree_intros", "id, title, scientific_name, image_url, image_variants", "id DESC", request.args, default_limit=9)
+            page["items"] = [attach_srcset(row) for row in page["items"]]
+            return jsonify(page)
+
         cursor.execute("SELECT * FROM tree_intros ORDER BY id DESC;")
-        data = cursor.fetchall()
+        data = [attach_srcset(row) for row in cursor.fetchall()]
         return jsonify(data)
 
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
+# ✅ 樹種搜尋（pg_trgm）：?q=&page=&limit=，依命中欄位排序並附 snippet
+@app.get("/api/tree_intros/search")
+@conditional("tree_intros")
+@cached("tree_intros")
+def search_tree_intros():
+    conn = get_db()
+    cursor = json_cursor(conn)
+    try:
+        page = search_text(cursor, "tree_intros", request.args, default_limit=12)
+        page["items"] = [attach_srcset(row) for row in page["items"]]
+        return jsonify(page), 200
+
+    except (SearchError, PaginationError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    finally:
+        cursor.close()
+
+
 @app.get("/api/tree_intros/<int:id>")
+@conditional("tree_intros")
+@cached("tree_intros")
 def get_tree_intro(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
         cursor.execute("SELECT * FROM tree_intros WHERE id = %s;", (id,))
         row = cursor.fetchone()
         if row:
-            # ✅ For single image, just return as-is
-            # row["image_url"] will already be a string (or None)
-            return jsonify(row), 200
+            # ✅ 單張圖：image_url 原樣回傳，另附 srcset 用的 image
+            return jsonify(attach_srcset(row)), 200
         else:
             return jsonify({"error": "找不到資料"}), 404
         
@@ -978,20 +1172,32 @@ def get_tree_intro(id):
 
     finally:
         cursor.close()
-        conn.close()
 @app.put("/api/tree_intros/<int:id>")
 def update_tree_intro(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
+    image_url, image_variants, direct_urls = None, {}, []
     try:
         data = request.form
         image = request.files.get("image")
-        image_url = None
 
         # ✅ Upload to R2 if a new image is provided
         if image and image.filename:
-            image_url = r2_upload_file(image, folder="tree_intros")
+            image_url, image_variants = upload_image(image, folder="tree_intros")
+
+        # 沒有附檔時，看是不是已經直接傳到 R2（/api/uploads）
+        direct_urls = [] if image_url else uploaded_urls([request.form.get("uploaded_image", "")], "tree_intros")
+        if direct_urls:
+            image_url = direct_urls[0]
+
+        # 換了新檔案的話，舊的要從 R2 刪掉
+        old_url, old_variants = None, None
+        if image_url:
+            cursor.execute("SELECT image_url, image_variants FROM tree_intros WHERE id = %s FOR UPDATE;", (id,))
+            current = cursor.fetchone()
+            old_url = current["image_url"] if current else None
+            old_variants = current["image_variants"] if current else None
 
         cursor.execute("""
             UPDATE tree_intros
@@ -1004,7 +1210,8 @@ def update_tree_intro(id):
                 other_usage = %s,
                 breeding_intro = %s,
                 source = %s,
-                image_url = COALESCE(%s, image_url)
+                image_url = COALESCE(%s, image_url),
+                image_variants = CASE WHEN %s THEN %s ELSE image_variants END
             WHERE id = %s
             RETURNING *;
         """, (
@@ -1018,32 +1225,48 @@ def update_tree_intro(id):
             data.get("breeding_intro"),
             data.get("source"),
             image_url,  # new R2 url or None → keep old if None
+            image_url is not None,
+            json.dumps(image_variants) if image_variants else None,
             id
         ))
 
         updated = cursor.fetchone()
+        if not updated:
+            # 不存在的 id：這次上傳拿到的引用也要還回去
+            conn.rollback()
+            discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
+            return jsonify({"error": "ID 不存在"}), 404
+
+        if old_url:
+            # 重傳同一張圖時新舊 URL 相同（去重），扣掉舊的引用後還有新的，不會被刪
+            enqueue_r2_delete(cursor, [old_url] + variant_urls(old_variants))
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "tree_intros", "tree_intros", direct_urls)
         conn.commit()
+        invalidate_cache("tree_intros")
 
-        if updated:
-            return jsonify(updated), 200
-        else:
-            return jsonify({"error": "ID 不存在"}), 404
+        return jsonify(updated), 200
+
+    except UploadExpiredError as e:
+        conn.rollback()
+        discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
+        return jsonify({"error": str(e)}), 410
 
     except Exception as e:
         conn.rollback()
+        discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
 @app.delete("/api/tree_intros/<int:id>")
 def delete_tree_intro(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)  # ✅ so we can use dict access
 
     try:
         # ✅ Step 1: Fetch the record first
-        cursor.execute("SELECT image_url FROM tree_intros WHERE id = %s;", (id,))
+        cursor.execute("SELECT image_url, image_variants FROM tree_intros WHERE id = %s;", (id,))
         record = cursor.fetchone()
 
         if not record:
@@ -1054,11 +1277,11 @@ def delete_tree_intro(id):
         # ✅ Step 2: Delete DB row
         cursor.execute("DELETE FROM tree_intros WHERE id = %s RETURNING id;", (id,))
         deleted = cursor.fetchone()
-        conn.commit()
 
-        # ✅ Step 3: Clean up R2 if image exists
-        if image_url:
-            r2_delete_file(image_url)
+        # ✅ Step 3: Clean up R2 if image exists（排進 jobs，commit 後由 worker 刪除）
+        enqueue_r2_delete(cursor, [image_url] + variant_urls(record.get("image_variants")))
+        conn.commit()
+        invalidate_cache("tree_intros")
 
         return jsonify({
             "message": "刪除成功",
@@ -1072,7 +1295,6 @@ def delete_tree_intro(id):
 
     finally:
         cursor.close()
-        conn.close()
 
 
 ## ---------------------------- Result 成果後台 API -----------------------------
@@ -1080,73 +1302,116 @@ def delete_tree_intro(id):
 @app.post("/api/result")
 @jwt_required
 def create_result():
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
+    image_url, image_variants, direct_urls = None, {}, []
     try:
         image = request.files.get("image")
-        image_url = None
 
         if image and image.filename:
-            url = r2_upload_file(image, folder="results")
-            if url:
-                image_url = url
+            image_url, image_variants = upload_image(image, folder="results")
+
+        # 沒有附檔時，看是不是已經直接傳到 R2（/api/uploads）
+        direct_urls = [] if image_url else uploaded_urls([request.form.get("uploaded_image", "")], "results")
+        if direct_urls:
+            image_url = direct_urls[0]
 
         # 取得表單欄位資料 
         data = request.form
 
         cursor.execute("""
-            INSERT INTO result (title, date, content, image_url)
-            VALUES (%s, %s, %s, %s)
+            INSERT INTO result (title, date, content, image_url, image_variants)
+            VALUES (%s, %s, %s, %s, %s)
             RETURNING *;
         """, (
             data.get("title"),
             data.get("date"),
             data.get("content"),
-            image_url
+            image_url,
+            json.dumps(image_variants) if image_variants else None
         ))
 
         new_data = cursor.fetchone()
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "result", "results", direct_urls)
         conn.commit()
+        invalidate_cache("result")
         return jsonify(new_data), 201
 
+    except UploadExpiredError as e:
+        conn.rollback()
+        discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
+        return jsonify({"error": str(e)}), 410
+
     except Exception as e:
         conn.rollback()
+        discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
 
 
 @app.get("/api/result")
+@conditional("result")
+@cached("result")
 def get_results():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
+        # ?page=&limit= → {items, total, page, pages}，列表只取輕量欄位
+        if wants_page(request.args):
+            page = offset_page(cursor, "result", "id, title, date, image_url, image_variants, LEFT(content, 200) AS excerpt", "id DESC", request.args, default_limit=8)
+            page["items"] = [attach_srcset(row) for row in page["items"]]
+            return jsonify(page)
+
         cursor.execute("SELECT * FROM result ORDER BY id DESC;")
-        data = cursor.fetchall()
+        data = [attach_srcset(row) for row in cursor.fetchall()]
         return jsonify(data)
 
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
+# ✅ 成果文章搜尋（pg_trgm）：?q=&page=&limit=
+@app.get("/api/result/search")
+@conditional("result")
+@cached("result")
+def search_results():
+    conn = get_db()
+    cursor = json_cursor(conn)
+    try:
+        page = search_text(cursor, "result", request.args, default_limit=8)
+        page["items"] = [attach_srcset(row) for row in page["items"]]
+        return jsonify(page), 200
+
+    except (SearchError, PaginationError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    finally:
+        cursor.close()
+
+
 @app.get("/api/result/<int:id>")
+@conditional("result")
+@cached("result")
 def get_result(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db()
+    cursor = json_cursor(conn)
 
     try:
         cursor.execute("SELECT * FROM result WHERE id = %s;", (id,))
         row = cursor.fetchone()
         if row:
-            # ✅ For single image, just return as-is
-            # row["image_url"] will already be a string (or None)
-            return jsonify(row), 200
+            # ✅ 單張圖：image_url 原樣回傳，另附 srcset 用的 image
+            return jsonify(attach_srcset(row)), 200
         else:
             return jsonify({"error": "找不到資料"}), 404
         
@@ -1157,28 +1422,41 @@ def get_result(id):
 
     finally:
         cursor.close()
-        conn.close()
     
 @app.put("/api/result/<int:id>")
 def update_result_intro(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
+    image_url, image_variants, direct_urls = None, {}, []
     try:
         data = request.form
         image = request.files.get("image")
-        image_url = None
 
         # ✅ Upload to R2 if a new image is provided
         if image and image.filename:
-            image_url = r2_upload_file(image, folder="results")
+            image_url, image_variants = upload_image(image, folder="results")
+
+        # 沒有附檔時，看是不是已經直接傳到 R2（/api/uploads）
+        direct_urls = [] if image_url else uploaded_urls([request.form.get("uploaded_image", "")], "results")
+        if direct_urls:
+            image_url = direct_urls[0]
+
+        # 換了新檔案的話，舊的要從 R2 刪掉
+        old_url, old_variants = None, None
+        if image_url:
+            cursor.execute("SELECT image_url, image_variants FROM result WHERE id = %s FOR UPDATE;", (id,))
+            current = cursor.fetchone()
+            old_url = current["image_url"] if current else None
+            old_variants = current["image_variants"] if current else None
 
         cursor.execute("""
             UPDATE result
             SET title = %s,
                 date = %s,
                 content = %s,
-                image_url = COALESCE(%s, image_url)
+                image_url = COALESCE(%s, image_url),
+                image_variants = CASE WHEN %s THEN %s ELSE image_variants END
             WHERE id = %s
             RETURNING *;
         """, (
@@ -1186,33 +1464,49 @@ def update_result_intro(id):
             data.get("date"),
             data.get("content"),
             image_url,  # new R2 url or None → keep old if None
+            image_url is not None,
+            json.dumps(image_variants) if image_variants else None,
             id
         ))
 
         updated = cursor.fetchone()
+        if not updated:
+            # 不存在的 id：這次上傳拿到的引用也要還回去
+            conn.rollback()
+            discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
+            return jsonify({"error": "ID 不存在"}), 404
+
+        if old_url:
+            # 重傳同一張圖時新舊 URL 相同（去重），扣掉舊的引用後還有新的，不會被刪
+            enqueue_r2_delete(cursor, [old_url] + variant_urls(old_variants))
+        claim_uploads(cursor, direct_urls)
+        enqueue_image_variants(cursor, "result", "results", direct_urls)
         conn.commit()
+        invalidate_cache("result")
 
-        if updated:
-            return jsonify(updated), 200
-        else:
-            return jsonify({"error": "ID 不存在"}), 404
+        return jsonify(updated), 200
+
+    except UploadExpiredError as e:
+        conn.rollback()
+        discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
+        return jsonify({"error": str(e)}), 410
 
     except Exception as e:
         conn.rollback()
+        discard_uploads(([image_url] if image_url and not direct_urls else []) + variant_urls(image_variants))
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
     
 @app.delete("/api/result/<int:id>")
 def delete_result(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)  # ✅ so we can use dict access
 
     try:
         # ✅ Step 1: Fetch the record first
-        cursor.execute("SELECT image_url FROM result WHERE id = %s;", (id,))
+        cursor.execute("SELECT image_url, image_variants FROM result WHERE id = %s;", (id,))
         record = cursor.fetchone()
 
         if not record:
@@ -1223,11 +1517,11 @@ def delete_result(id):
         # ✅ Step 2: Delete DB row
         cursor.execute("DELETE FROM result WHERE id = %s RETURNING id;", (id,))
         deleted = cursor.fetchone()
-        conn.commit()
 
-        # ✅ Step 3: Clean up R2 if image exists
-        if image_url:
-            r2_delete_file(image_url)
+        # ✅ Step 3: Clean up R2 if image exists（排進 jobs，commit 後由 worker 刪除）
+        enqueue_r2_delete(cursor, [image_url] + variant_urls(record.get("image_variants")))
+        conn.commit()
+        invalidate_cache("result")
 
         return jsonify({
             "message": "刪除成功",
@@ -1241,24 +1535,27 @@ def delete_result(id):
 
     finally:
         cursor.close()
-        conn.close()
 
 # ---------------------------- File 檔案後台 API -----------------------------
 
 @app.post("/api/file")
 @jwt_required
 def create_file():
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
+    file_url, direct_urls = None, []
     try:
         file = request.files.get("file")
-        file_url = None
 
         if file and file.filename:
-            url = r2_upload_file(file, folder="files")
+            url = upload_file(file, folder="files")
             if url:
                 file_url = url
+        else:
+            # 大檔案由瀏覽器直接傳到 R2（/api/uploads），這裡只收 URL
+            direct_urls = uploaded_urls([request.form.get("uploaded_file", "")], "files")
+            file_url = next(iter(direct_urls), None)
 
         # 取得表單欄位資料 
         data = request.form
@@ -1275,35 +1572,52 @@ def create_file():
         ))
 
         new_data = cursor.fetchone()
+        claim_uploads(cursor, direct_urls)
         conn.commit()
+        invalidate_cache("files")
         return jsonify(new_data), 201
 
+    except UploadExpiredError as e:
+        conn.rollback()
+        discard_uploads([file_url] if file_url and not direct_urls else [])
+        return jsonify({"error": str(e)}), 410
+
     except Exception as e:
         conn.rollback()
+        discard_uploads([file_url] if file_url and not direct_urls else [])
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
 @app.get("/api/file")
+@conditional("files")
+@cached("files")
 def get_files():
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
     try:
+        # ?page=&limit= → {items, total, page, pages}，列表只取輕量欄位
+        if wants_page(request.args):
+            page = offset_page(cursor, "files", "id, title, date, note, file_url", "id DESC", request.args, default_limit=10)
+            return jsonify(page)
+
         cursor.execute("SELECT * FROM files ORDER BY id DESC;")
         data = cursor.fetchall()
         return jsonify(data)
 
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
 @app.get("/api/file/<int:id>")
+@conditional("files")
+@cached("files")
 def get_file(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
     try:
@@ -1322,20 +1636,29 @@ def get_file(id):
 
     finally:
         cursor.close()
-        conn.close()
 @app.put("/api/file/<int:id>")
 def update_file_intro(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
+    file_url, direct_urls = None, []
     try:
         data = request.form
         file = request.files.get("file")
-        file_url = None
 
         # ✅ Upload to R2 if a new file is provided
         if file and file.filename:
-            file_url = r2_upload_file(file, folder="files")
+            file_url = upload_file(file, folder="files")
+        else:
+            direct_urls = uploaded_urls([data.get("uploaded_file", "")], "files")
+            file_url = next(iter(direct_urls), None)
+
+        # 換了新檔案的話，舊的要從 R2 刪掉
+        old_url = None
+        if file_url:
+            cursor.execute("SELECT file_url FROM files WHERE id = %s FOR UPDATE;", (id,))
+            current = cursor.fetchone()
+            old_url = current["file_url"] if current else None
 
         cursor.execute("""
             UPDATE files
@@ -1354,23 +1677,36 @@ def update_file_intro(id):
         ))
 
         updated = cursor.fetchone()
+        if not updated:
+            # 不存在的 id：這次上傳拿到的引用也要還回去
+            conn.rollback()
+            discard_uploads([file_url] if file_url and not direct_urls else [])
+            return jsonify({"error": "ID 不存在"}), 404
+
+        if old_url:
+            # 重傳同一份檔案時新舊 URL 相同（去重），扣掉舊的引用後還有新的，不會被刪
+            enqueue_r2_delete(cursor, [old_url])
+        claim_uploads(cursor, direct_urls)
         conn.commit()
+        invalidate_cache("files")
 
-        if updated:
-            return jsonify(updated), 200
-        else:
-            return jsonify({"error": "ID 不存在"}), 404
+        return jsonify(updated), 200
+
+    except UploadExpiredError as e:
+        conn.rollback()
+        discard_uploads([file_url] if file_url and not direct_urls else [])
+        return jsonify({"error": str(e)}), 410
 
     except Exception as e:
         conn.rollback()
+        discard_uploads([file_url] if file_url and not direct_urls else [])
         return jsonify({"error": str(e)}), 500
 
     finally:
         cursor.close()
-        conn.close()
 @app.delete("/api/file/<int:id>")
 def delete_file(id):
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)  # ✅ so we can use dict access
 
     try:
@@ -1386,11 +1722,11 @@ def delete_file(id):
         # ✅ Step 2: Delete DB row
         cursor.execute("DELETE FROM files WHERE id = %s RETURNING id;", (id,))
         deleted = cursor.fetchone()
-        conn.commit()
 
-        # ✅ Step 3: Clean up R2 if file exists
-        if file_url:
-            r2_delete_file(file_url)
+        # ✅ Step 3: Clean up R2 if file exists（排進 jobs，commit 後由 worker 刪除）
+        enqueue_r2_delete(cursor, [file_url])
+        conn.commit()
+        invalidate_cache("files")
 
         return jsonify({
             "message": "刪除成功",
@@ -1404,12 +1740,201 @@ def delete_file(id):
 
     finally:
         cursor.close()
-        conn.close()
+## ---------------------------- 直接上傳 R2 -----------------------------
+
+@app.post("/api/uploads/presign")
+@jwt_required
+def presign_upload():
+    data = request.get_json(silent=True) or {}
+    try:
+        ticket = presign(
+            data.get("folder"),
+            data.get("filename"),
+            data.get("content_type"),
+            data.get("size"),
+            data.get("sha256"),
+        )
+        return jsonify(ticket), 200
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.post("/api/uploads/stream")
+@jwt_required
+def stream_upload_file():
+    # body 直接是檔案內容：?folder=files&filename=report.pdf，Content-Type 為檔案類型
+    try:
+        result = stream_upload(
+            request.stream.read,
+            request.args.get("folder", "files"),
+            request.args.get("filename"),
+            request.mimetype,
+            request.content_length,
+        )
+        return jsonify(result), 201
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    except ClientDisconnected:
+        # 分段上傳已經 abort，client 也收不到回應了
+        return jsonify({"error": "client disconnected"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.post("/api/uploads/finalize")
+@jwt_required
+def finalize_upload():
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(finalize(data.get("upload_token"))), 200
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+### --------------------------------- SITE SEARCH -------------------------------------------##
+
+# ✅ 三類基地一起查（basequery.html）：篩選、排序、分頁都在 SQL，附各類別筆數
+@app.get("/api/sites/search")
+@conditional("purification_zones", "green_walls", "greenifications")
+@cached("purification_zones", "green_walls", "greenifications")
+def search_all_sites():
+    conn = get_db()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        return jsonify(search_sites(cursor, request.args)), 200
+
+    except (SearchError, PaginationError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    finally:
+        cursor.close()
+
+
+# ✅ 地圖：目前畫面範圍內的基地點位（GeoJSON FeatureCollection）
+@app.get("/api/sites/geojson")
+@conditional("purification_zones", "green_walls", "greenifications")
+@cached("purification_zones", "green_walls", "greenifications")
+def sites_geojson():
+    conn = get_db()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        response = jsonify(site_features(cursor, request.args))
+        response.mimetype = "application/geo+json"
+        return response, 200
+
+    except SearchError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    finally:
+        cursor.close()
+
+
+# ✅ 地圖縮小時的格網聚合：?zoom=&bbox=，每格一個點（筆數、面積 / 長度合計）
+@app.get("/api/sites/clusters")
+@conditional("purification_zones", "green_walls", "greenifications")
+@cached("purification_zones", "green_walls", "greenifications")
+def sites_clusters():
+    conn = get_db()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        response = jsonify(site_clusters(cursor, request.args))
+        response.mimetype = "application/geo+json"
+        return response, 200
+
+    except SearchError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    finally:
+        cursor.close()
+
+
+### --------------------------------- EXPORT -------------------------------------------##
+
+# ✅ 整張表匯出：/api/export/green_walls?format=csv&year=2024&district=南投市
+# server-side cursor 分批讀、邊讀邊送，不會整張表讀進記憶體
+@app.get("/api/export/<table>")
+def export_table(table):
+    try:
+        body, mimetype, filename = export_stream(table, request.args.get("format", "csv"), request.args, app.json.dumps)
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return Response(body, content_type=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",  # nginx 不要整份 buffer 起來才送
+    })
+
+
+# ✅ 批次匯入（CSV / XLSX）：multipart 欄位 file，?dry_run=1 只驗證不寫入
+# 以 (serial, year) 合併，整批同一個 transaction；回傳逐列錯誤報告
+@app.post("/api/import/<table>")
+@jwt_required
+def import_table(table):
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": "缺少檔案"}), 400
+    dry_run = request.args.get("dry_run", request.form.get("dry_run", "")).lower() in ("1", "true", "yes")
+
+    conn = get_db()
+    try:
+        rows = read_rows(upload.stream, upload.filename, request.args.get("format"))
+        report = import_sites(conn, table, rows, commit=not dry_run)
+    except SiteImportError as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    if report["committed"] and (report["inserted"] or report["updated"]):
+        invalidate_cache(table)
+    return jsonify(report), 200
+
+
+### --------------------------------- REPORTS -------------------------------------------##
+
+# ✅ 認養 / 維護即將到期報表：?days=90&unit=maintain_unit|adopt_unit&district=&format=csv
+@app.get("/api/reports/maintenance_expiry")
+@jwt_required
+def maintenance_expiry_report():
+    conn = get_db()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if request.args.get("format") == "csv":
+            _, _, end, rows = expiring_sites(cursor, request.args)
+            return Response(report_csv(rows), content_type="text/csv; charset=utf-8", headers={
+                "Content-Disposition": f'attachment; filename="maintenance_expiry_{end:%Y%m%d}.csv"',
+                "Cache-Control": "no-store",
+            })
+        return jsonify(expiry_report(cursor, request.args)), 200
+
+    except SearchError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    finally:
+        cursor.close()
+
+
 ### --------------------------------- AREA ARRGEGATION -------------------------------------------##
 
 
 
 @app.route("/api/summary", methods=["GET"])
+@conditional("purification_zones", "green_walls", "greenifications", cache_control="public, max-age=60")
+@cached("purification_zones", "green_walls", "greenifications")
 def get_summary():
     table = request.args.get("table", "").strip()
     district = request.args.get("district", "default").strip()
@@ -1419,28 +1944,27 @@ def get_summary():
     if table not in valid_tables:
         return jsonify({"error": "Invalid table"}), 400
 
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
 
-    # build WHERE clause
-    where_clause = ""
-    params = {}
+    # build WHERE clause（site_stats 由 trigger 維護，只掃統計列不掃原始資料）
+    where_clause = "WHERE tbl = %(table)s"
+    params = {"table": table}
     if district != "default":
-        where_clause = "WHERE district = %(district)s"
+        where_clause += " AND district = %(district)s"
         params["district"] = district
 
     query = f"""
-        SELECT COUNT(*)::int,
+        SELECT COALESCE(SUM(count),0)::int,
                COALESCE(SUM(area),0)::int,
                COALESCE(SUM(length),0)::int
-        FROM {table} {where_clause}
+        FROM site_stats {where_clause}
     """
 
     cursor.execute(query, params)
     c, a, l = cursor.fetchone()
 
     cursor.close()
-    conn.close()
 
     return jsonify({
         "table": table,
@@ -1450,19 +1974,94 @@ def get_summary():
         "length": l
     })
 
+# ✅ 一次取得三張表的 count / area / length（總計、依行政區、依年度、依類型）
+# index.html 載入時抓一次，地圖 hover 直接查表，不再每個行政區打一次 /api/summary
+SUMMARY_TABLES = ["purification_zones", "green_walls", "greenifications"]
+
+
+def empty_summary():
+    return {
+        "total": {"count": 0, "area": 0, "length": 0},
+        "by_district": {},
+        "by_year": {},
+        "by_type": {},
+        "by_district_year": {},
+    }
+
+
+def build_summary(rows):
+    result = {table: empty_summary() for table in SUMMARY_TABLES}
+    result["total"] = {"count": 0, "area": 0, "length": 0}
+
+    for row in rows:
+        stats = {"count": row["count"], "area": row["area"], "length": row["length"]}
+        if row["tbl"] is None:
+            result["total"] = stats
+            continue
+
+        summary = result[row["tbl"]]
+        if row["district"] is not None and row["year"] is not None:
+            summary["by_district_year"].setdefault(row["district"], {})[row["year"]] = stats
+        elif row["district"] is not None:
+            summary["by_district"][row["district"]] = stats
+        elif row["year"] is not None:
+            summary["by_year"][row["year"]] = stats
+        elif row["type"] is not None:
+            summary["by_type"][row["type"]] = stats
+        else:
+            summary["total"] = stats
+    return result
+
+
+@app.get("/api/summary/all")
+@conditional("purification_zones", "green_walls", "greenifications", cache_control="public, max-age=60")
+@cached("purification_zones", "green_walls", "greenifications")
+def get_summary_all():
+    year = request.args.get("year")
+
+    where_clause = ""
+    params = {}
+    if year:
+        where_clause = "WHERE year = %(year)s"
+        params["year"] = year
+
+    # site_stats 每個 (tbl, district, year, type) 一列，成本跟組數成正比而不是資料筆數
+    query = f"""
+        SELECT tbl, district, year, type,
+               COALESCE(SUM(count),0)::int AS count,
+               COALESCE(SUM(area),0)::int AS area,
+               COALESCE(SUM(length),0)::int AS length
+        FROM site_stats {where_clause}
+        GROUP BY GROUPING SETS ((), (tbl), (tbl, district), (tbl, year), (tbl, type), (tbl, district, year))
+    """
+
+    conn = get_db()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cursor.execute(query, params)
+        return jsonify(build_summary(cursor.fetchall())), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    finally:
+        cursor.close()
+
     ### --------------------------------- HIDE & SHOW SECTION -------------------------------------------##
 
 ALLOWED_KEYS = {'purification', 'green_wall', 'greenification'}
 
 @app.get("/api/site/sections")
+@conditional("site_sections")
+@cached("site_sections")
 def api_get_sections():
-    conn = get_db_connection()
+    conn = get_db()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
         cur.execute("SELECT key, label, is_visible FROM site_sections ORDER BY label;")
         return jsonify(cur.fetchall()), 200
     finally:
-        cur.close(); conn.close()
+        cur.close()
 
 @app.patch("/api/site/sections/<key>")
 def api_patch_section(key):
@@ -1475,7 +2074,7 @@ def api_patch_section(key):
 
     is_visible = bool(payload["is_visible"])
 
-    conn = get_db_connection()
+    conn = get_db()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
         cur.execute("""
@@ -1486,17 +2085,18 @@ def api_patch_section(key):
         """, (is_visible, key))
         row = cur.fetchone()
         conn.commit()
+        invalidate_cache("site_sections")
         if not row:
             return jsonify({"error": "not found"}), 404
         return jsonify(row), 200
     finally:
-        cur.close(); conn.close()
+        cur.close()
 
 
 
 # @app.route("/api/areas/total", methods=["GET"])
 # def get_total_area():
-#     conn = get_db_connection()   # however you get your psycopg2 connection
+#     conn = get_db()   # however you get your psycopg2 connection
 #     cursor = conn.cursor()
 
 #     try:
@@ -1527,6 +2127,16 @@ def api_patch_section(key):
 def healthz():
     return jsonify(status="ok")
 
+# 連線池狀態（監控用）：含 pid、DB 主機等內部資訊，要登入才看得到
+@app.get("/healthz/pools")
+@jwt_required
+def healthz_pools():
+    return jsonify(
+        db=get_pool().stats(),
+        r2=r2_pool_stats(),
+        response_cache=response_cache.stats(),
+    )
+
 if __name__ == "__main__":
     # db_reset()
     # print("✅ Database reset")
@@ -0,0 +1,88 @@
+import argparse
+import datetime
+import json
+import random
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import OrjsonProvider, RawJSON
+
+# 列表 API 序列化的 benchmark：Flask 預設 provider（JSONB 先被 psycopg2 json.loads）
+# 對照 OrjsonProvider（JSONB 以 RawJSON 原樣嵌入）。
+#   python bench_json.py --rows 10000 --repeat 20
+DISTRICTS = ["南投市", "埔里鎮", "草屯鎮", "竹山鎮", "集集鎮", "名間鄉", "鹿谷鄉", "中寮鄉", "魚池鄉"]
+
+
+def make_rows(count, seed=1):
+    rng = random.Random(seed)
+    base = datetime.datetime(2020, 1, 1)
+    rows = []
+    for i in range(count):
+        urls = [f"https://cdn.example.com/green_walls/article_{rng.getrandbits(128):032x}_{n}.jpg" for n in range(rng.randint(0, 4))]
+        start = (base + datetime.timedelta(days=rng.randint(0, 1500))).date()
+        rows.append({
+            "id": i + 1,
+            "serial": f"GW-{i:05d}",
+            "year": str(rng.randint(2018, 2025)),
+            "district": rng.choice(DISTRICTS),
+            "type": rng.choice(["綠牆", "植生牆", "立體綠化"]),
+            "project_name": f"示範綠化工程 {i}",
+            "maintain_unit": "南投縣政府環境保護局",
+            "adopt_unit": "社區發展協會",
+            "area": round(rng.uniform(1, 5000), 2),
+            "length": round(rng.uniform(1, 800), 2),
+            "maintain_start_date": start,
+            "maintain_end_date": start + datetime.timedelta(days=365),
+            "gps": f"{23.9 + rng.random() / 10:.6f},{120.6 + rng.random() / 10:.6f}",
+            "annotation": None,
+            "subsidy_source": "空污基金",
+            "created_at": base + datetime.timedelta(seconds=rng.randint(0, 10 ** 8)),
+            "image_urls": json.dumps(urls) if urls else None,
+        })
+    return rows
+
+
+def bench(label, fn, repeat):
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{label:<28} median {timings[len(timings) // 2] * 1000:8.1f} ms"
+          f"   best {timings[0] * 1000:8.1f} ms   {size / 1024:8.0f} KB")
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 Flask 預設 JSON 與 orjson provider 的列表序列化速度")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    raw_rows = make_rows(args.rows)
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    orjson_provider = OrjsonProvider(app)
+
+    def current_path():
+        # psycopg2 預設的 JSONB typecaster + jsonify
+        rows = [dict(row, image_urls=json.loads(row["image_urls"]) if row["image_urls"] else None) for row in raw_rows]
+        return len(default_provider.response(rows).get_data())
+
+    def orjson_path():
+        rows = [dict(row, image_urls=RawJSON(row["image_urls"]) if row["image_urls"] else None) for row in raw_rows]
+        return len(orjson_provider.response(rows).get_data())
+
+    with app.app_context():
+        print(f"{args.rows} rows × {args.repeat} runs")
+        before = bench("flask default (json)", current_path, args.repeat)
+        after = bench("orjson + JSONB passthrough", orjson_path, args.repeat)
+    print(f"speedup ×{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import hashlib
+import os
+
+import psycopg2
+from flask import Request
+
+from db_pool import db_connection
+from r2_utils import r2_upload_file, r2_delete_keys, r2_key_from_url, r2_public_url
+
+# 內容去重：blobs 表（migration 7）記錄 (folder, sha256) → R2 key 與引用次數。
+#   上傳時先算 SHA-256，同一個資料夾已經有相同內容就直接沿用，不再 PUT；
+#   資料刪除 / 換圖時 release_keys() 扣引用次數，歸零才真的從 R2 刪除。
+# multipart 解析時就邊寫暫存檔邊算雜湊（HashingRequest），上傳前不用再讀一次。
+# 瀏覽器直接上傳（direct_upload.py）的引用先記在 upload_reservations（reserve=True），
+# 表單存檔的 transaction 裡 claim_uploads() 轉給資料列；UPLOAD_RESERVATION_HOURS 內沒認領的由 r2_gc.py 收回
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadExpiredError(ValueError):
+    pass
+
+
+class HashingSpool:
+    # 包住 werkzeug 的暫存檔，write 時順便更新雜湊
+    def __init__(self, stream):
+        self._stream = stream
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._stream.write(data)
+
+    def digest(self):
+        return self._hash.digest()
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class HashingRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return HashingSpool(stream)
+
+
+def file_digest(file):
+    # 回傳 (sha256, size)；不是經過 HashingRequest 的檔案（CLI、測試）才分塊讀一次
+    stream = getattr(file, "stream", file)
+    if isinstance(stream, HashingSpool):
+        return stream.digest(), stream.size
+
+    h = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return h.digest(), size
+
+
+def _reserve(cur, key):
+    cur.execute(
+        "INSERT INTO upload_reservations (key, expires_at) VALUES (%s, now() + make_interval(hours => %s));",
+        (key, int(os.getenv("UPLOAD_RESERVATION_HOURS", "24"))),
+    )
+
+
+def acquire(folder, digest, reserve=False):
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE blobs SET refcount = refcount + 1, last_used_at = now()
+                 WHERE folder = %s AND sha256 = %s
+                RETURNING key;
+            """, (folder, psycopg2.Binary(digest)))
+            row = cur.fetchone()
+            if row and reserve:
+                _reserve(cur, row[0])
+        conn.commit()
+    return row[0] if row else None
+
+
+def register(folder, digest, key, size, reserve=False):
+    # 兩個 request 同時上傳同一份內容時，以先寫進 blobs 的為準
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO blobs AS b (key, folder, sha256, size)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (folder, sha256) DO UPDATE
+                   SET refcount = b.refcount + 1, last_used_at = now()
+                RETURNING key;
+            """, (key, folder, psycopg2.Binary(digest), size))
+            winner = cur.fetchone()[0]
+            if reserve:
+                _reserve(cur, winner)
+        conn.commit()
+    return winner
+
+
+def store(folder, digest, size, put):
+    # put() 實際上傳並回傳 URL；內容已存在時不會呼叫。每次呼叫都算一次引用
+    try:
+        key = acquire(folder, digest)
+    except psycopg2.Error as e:
+        # 還沒跑 migration 7 或 DB 暫時不能用：照舊直接上傳，不做去重
+        print("[⚠️] blob lookup failed, uploading without dedup:", e)
+        return put()
+    if key:
+        return r2_public_url(key)
+
+    url = put()
+    if not url:
+        return None
+    key = r2_key_from_url(url)
+    try:
+        winner = register(folder, digest, key, size)
+    except psycopg2.Error as e:
+        print("[⚠️] blob register failed:", e)
+        return url
+    if winner != key:
+        r2_delete_keys([key])
+    return r2_public_url(winner)
+
+
+def upload_file(file, folder="articles", client=None):
+    digest, size = file_digest(file)
+    return store(folder, digest, size, lambda: r2_upload_file(file, folder=folder, client=client))
+
+
+def upload_bytes(body, folder, put):
+    return store(folder, hashlib.sha256(body).digest(), len(body), put)
+
+
+def release_keys(cursor, keys):
+    # 在呼叫端的 transaction 裡扣引用次數，回傳真的可以從 R2 刪掉的 key：
+    # 歸零的，加上不在 blobs 裡的（去重之前上傳的舊檔案）
+    keys = [key for key in keys if key]
+    if not keys:
+        return []
+
+    with cursor.connection.cursor() as cur:
+        cur.execute("""
+            UPDATE blobs b SET refcount = b.refcount - d.n
+              FROM (SELECT k, COUNT(*) AS n FROM unnest(%s::text[]) AS k GROUP BY k) d
+             WHERE b.key = d.k
+            RETURNING b.key, b.refcount;
+        """, (keys,))
+        tracked = dict(cur.fetchall())
+        dead = [key for key, refcount in tracked.items() if refcount <= 0]
+        if dead:
+            cur.execute("DELETE FROM blobs WHERE key = ANY(%s) AND refcount <= 0;", (dead,))
+    return list(dict.fromkeys(key for key in keys if key not in tracked or tracked[key] <= 0))
+
+
+def discard_uploads(file_urls):
+    # 上傳完但 DB 寫入失敗：把這次拿到的引用還回去，沒人用的立刻刪
+    keys = [r2_key_from_url(url) for url in file_urls or []]
+    if not any(keys):
+        return
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                keys = release_keys(cur, keys)
+            conn.commit()
+    except psycopg2.Error as e:
+        # blobs 不能用的話當作沒有去重；留給 r2_gc.py 處理也不會錯
+        print("[⚠️] blob release failed:", e)
+        return
+    r2_delete_keys(keys)
+
+
+def claim_uploads(cursor, file_urls):
+    # 在存檔的 transaction 裡把直接上傳的保留轉給這筆資料；
+    # 保留已經被收回（或同一個檔案用在第二筆資料）的，重新算一次引用；
+    # blobs 裡也沒有了代表檔案已經被 r2_gc.py 刪掉，丟 UploadExpiredError 讓前端重新上傳
+    keys = [r2_key_from_url(url) for url in file_urls or []]
+    with cursor.connection.cursor() as cur:
+        for key in filter(None, keys):
+            cur.execute("""
+                DELETE FROM upload_reservations
+                 WHERE id = (SELECT id FROM upload_reservations WHERE key = %s
+                              ORDER BY expires_at LIMIT 1 FOR UPDATE SKIP LOCKED)
+                RETURNING id;
+            """, (key,))
+            if cur.fetchone() is not None:
+                cur.execute("UPDATE blobs SET last_used_at = now() WHERE key = %s;", (key,))
+                continue
+            cur.execute("UPDATE blobs SET refcount = refcount + 1, last_used_at = now() WHERE key = %s;", (key,))
+            if cur.rowcount == 0:
+                raise UploadExpiredError(f"上傳的檔案已過期，請重新上傳：{key}")
+
+
+def release_expired_reservations(conn):
+    # 直接上傳後一直沒存檔的：扣回引用，歸零的從 R2 刪除。回傳 (收回幾筆保留, r2_delete_keys 結果)
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM upload_reservations WHERE expires_at <= now() RETURNING key;")
+        keys = [row[0] for row in cur.fetchall()]
+        dead = release_keys(cur, keys)
+    conn.commit()
+    return len(keys), r2_delete_keys(dead)
@@ -1,31 +1,15 @@
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
-import socket
-from urllib.parse import urlparse
+from db_pool import build_dsn
 def get_db_connection():
-    dsn = os.getenv("DATABASE_URL")
-    if not dsn:
+    # 初始化 / 重設用的一次性連線；API 請走 db_pool
+    if not os.getenv("DATABASE_URL"):
         print("❌ DATABASE_URL not set")
         return None
 
     try:
-        # Parse hostname
-        parsed = urlparse(dsn)
-        hostname = parsed.hostname
-
-        # Force IPv4 lookup
-        ipv4_addr = socket.getaddrinfo(hostname, None, socket.AF_INET)[0][4][0]
-
-        # Append hostaddr safely
-        connector_dsn = dsn
-        if "hostaddr" not in connector_dsn:
-            if "?" in connector_dsn:
-                connector_dsn += f"&hostaddr={ipv4_addr}"
-            else:
-                connector_dsn += f"?hostaddr={ipv4_addr}"
-
-        conn = psycopg2.connect(connector_dsn)
+        conn = psycopg2.connect(build_dsn())
         return conn
 
     except Exception as e:
@@ -178,9 +162,9 @@ def db_init():
         ON CONFLICT (key) DO NOTHING;
 
   
-        INSERT INTO settings (section, visible) VALUES ('greenifications', TRUE);
-        INSERT INTO settings (section, visible) VALUES ('green wall', TRUE);
-        INSERT INTO settings (section, visible) VALUES ('purification_zones', TRUE);
+        INSERT INTO settings (section, visible) VALUES ('greenifications', TRUE) ON CONFLICT (section) DO NOTHING;
+        INSERT INTO settings (section, visible) VALUES ('green wall', TRUE) ON CONFLICT (section) DO NOTHING;
+        INSERT INTO settings (section, visible) VALUES ('purification_zones', TRUE) ON CONFLICT (section) DO NOTHING;
 
     """)
     cursor.execute("""
@@ -211,5 +195,9 @@ def db_init():
     #     print("[ℹ️] admin 帳號已存在，略過建立")
     conn.commit()
     cursor.close()
+
+    # 索引等後續 schema 變更都走 migrations.py
+    from migrations import run_migrations
+    run_migrations(conn)
     conn.close()
 
@@ -0,0 +1,238 @@
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlparse
+
+import psycopg2
+from psycopg2 import extensions
+from flask import g
+
+# 連線池設定（每個 gunicorn worker 各自一個 pool），建立 pool 時才讀取，
+# 所以 app.py 的 load_dotenv() 設定也會生效
+#   DB_POOL_MIN / DB_POOL_MAX / DB_POOL_TIMEOUT
+#   DB_DNS_TTL：IPv4 解析結果快取秒數
+#   DB_HEALTHCHECK_INTERVAL：閒置超過這個秒數的連線，借出前先 SELECT 1
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# ---------------------------- DNS 快取 -----------------------------
+
+_dns_lock = threading.Lock()
+_dns_cache = {}  # hostname -> (ipv4, expires_at)
+
+
+def resolve_ipv4(hostname):
+    now = time.monotonic()
+    with _dns_lock:
+        cached = _dns_cache.get(hostname)
+        if cached and cached[1] > now:
+            return cached[0]
+
+    try:
+        ipv4_addr = socket.getaddrinfo(hostname, None, socket.AF_INET)[0][4][0]
+    except socket.gaierror:
+        # DNS 暫時失敗時沿用上一次的結果
+        if cached:
+            print(f"[⚠️] DNS lookup failed for {hostname}, using cached {cached[0]}")
+            return cached[0]
+        raise
+
+    with _dns_lock:
+        _dns_cache[hostname] = (ipv4_addr, now + float(os.getenv("DB_DNS_TTL", "300")))
+    return ipv4_addr
+
+
+def build_dsn(dsn=None):
+    dsn = dsn or os.getenv("DATABASE_URL")
+    if not dsn:
+        return None
+
+    # Unix socket / key=value 格式不需要 hostaddr
+    hostname = urlparse(dsn).hostname
+    if not hostname or "hostaddr" in dsn:
+        return dsn
+
+    # Force IPv4 lookup（有快取，TTL 到期才重查）
+    ipv4_addr = resolve_ipv4(hostname)
+    if "?" in dsn:
+        return dsn + f"&hostaddr={ipv4_addr}"
+    return dsn + f"?hostaddr={ipv4_addr}"
+
+
+# ---------------------------- 連線池 -----------------------------
+
+class ConnectionPool:
+    def __init__(self, minconn=None, maxconn=None, timeout=None):
+        self.minconn = minconn if minconn is not None else int(os.getenv("DB_POOL_MIN", "1"))
+        self.maxconn = maxconn if maxconn is not None else int(os.getenv("DB_POOL_MAX", "10"))
+        self.timeout = timeout if timeout is not None else float(os.getenv("DB_POOL_TIMEOUT", "10"))
+        self.healthcheck_interval = float(os.getenv("DB_HEALTHCHECK_INTERVAL", "30"))
+        self.pid = os.getpid()
+        self._idle = []       # [(conn, last_used)]，LIFO
+        self._in_use = 0
+        self._cond = threading.Condition()
+        for _ in range(self.minconn):
+            try:
+                self._idle.append((self._connect(), time.monotonic()))
+            except psycopg2.Error as e:
+                print("❌ Database connection failed:", e)
+                break
+
+    def _connect(self):
+        return psycopg2.connect(build_dsn())
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._idle and self._in_use >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"no database connection available within {self.timeout}s")
+                self._cond.wait(remaining)
+            item = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        try:
+            if item is not None:
+                conn, last_used = item
+                if self._healthy(conn, last_used):
+                    return conn
+                self._discard(conn)
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed or len(self._idle) >= self.maxconn:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def closeall(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pid": self.pid,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "max": self.maxconn,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# fork 前建立的 pool：socket 跟父行程共用，物件被回收時 psycopg2 會 PQfinish
+# 把父行程的連線一起關掉，所以留著參考、永遠不讓它被 GC
+_inherited_pools = []
+
+
+def get_pool():
+    global _pool
+    pool = _pool
+    # fork 之後（gunicorn --preload）子行程要重建自己的 pool；
+    # 繼承來的 socket 屬於父行程，不能 close 也不能被回收，收進 _inherited_pools
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            if _pool is not None:
+                _inherited_pools.append(_pool)
+            _pool = ConnectionPool()
+        return _pool
+
+
+@contextmanager
+def db_connection():
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        raise
+    finally:
+        pool.putconn(conn, discard=broken)
+
+
+def with_db_connection(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with db_connection() as conn:
+            return f(conn, *args, **kwargs)
+    return decorated_function
+
+
+# ---------------------------- Flask 整合 -----------------------------
+
+def get_db():
+    # 同一個 request 共用一條連線，teardown 時一定會還回 pool
+    if "db_conn" not in g:
+        pool = get_pool()
+        g.db_conn = pool.getconn()
+        g.db_pool = pool
+    return g.db_conn
+
+
+def release_db(exc=None):
+    conn = g.pop("db_conn", None)
+    pool = g.pop("db_pool", None)
+    if conn is None:
+        return
+    broken = False
+    if exc is not None:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    pool.putconn(conn, discard=broken)
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
@@ -0,0 +1,187 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import os
+
+import jwt
+import psycopg2
+from botocore.exceptions import ClientError
+
+from blob_store import acquire, register
+from r2_utils import r2_client, r2_new_key, r2_public_url, r2_delete_keys, r2_key_from_url, r2_stream_upload, UploadTooLarge
+
+# 瀏覽器直接上傳到 R2，檔案內容不經過 gunicorn worker：
+#   1. POST /api/uploads/presign  {folder, filename, content_type, size, sha256?}
+#      → 簽好的 PUT URL（Content-Type / Content-Length / checksum 都在簽章內，改了 R2 會拒絕）
+#        sha256 有帶且內容已經存在（blobs）時直接回 url，不用上傳
+#   2. 瀏覽器 PUT 檔案到 upload_url，帶回傳的 headers
+#   3. POST /api/uploads/finalize {upload_token} → HEAD 檢查大小 / 類型後登記到 blobs，回 url
+#   4. 表單送 uploaded_images / uploaded_image / uploaded_file 欄位（URL）給原本的新增 / 修改 API
+#      1 / 3 拿到的 blobs 引用先記成保留（upload_reservations），第 4 步存檔的 transaction 才轉給資料列
+#      （blob_store.claim_uploads）；表單沒送出或存檔失敗時保留留著，過期後由 r2_gc.py 收回
+# bucket 沒開 CORS 等不能直傳的情況，改用 POST /api/uploads/stream：request body 邊讀邊分段傳到 R2
+# （stream_upload），worker 記憶體大約 R2_PART_SIZE_MB × (R2_PART_CONCURRENCY + 1)，一樣回 url 給第 4 步用。
+# R2 不支援 presigned POST policy，大小限制靠簽進去的 Content-Length + finalize 的 HEAD。
+# bucket 的 CORS 要允許後台網域 PUT（content-type、x-amz-checksum-sha256 header）。
+#   UPLOAD_URL_TTL / UPLOAD_MAX_IMAGE_MB / UPLOAD_MAX_FILE_MB
+IMAGE_FOLDERS = ("purification_zones", "green_walls", "greenifications", "tree_intros", "results")
+
+
+class UploadError(ValueError):
+    pass
+
+
+def upload_rule(folder):
+    # (允許的 content type 前綴, 大小上限 bytes)
+    if folder in IMAGE_FOLDERS:
+        return "image/", int(float(os.getenv("UPLOAD_MAX_IMAGE_MB", "20")) * 1024 * 1024)
+    if folder == "files":
+        return "", int(float(os.getenv("UPLOAD_MAX_FILE_MB", "200")) * 1024 * 1024)
+    raise UploadError(f"不支援的資料夾：{folder}")
+
+
+def _decode_sha256(value):
+    if not value:
+        return None
+    try:
+        digest = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        digest = b""
+    if len(digest) != 32:
+        raise UploadError("sha256 需為 base64 編碼的 32 bytes")
+    return digest
+
+
+def _secret():
+    return os.getenv("JWT_SECRET", "fallback_secret")
+
+
+def presign(folder, filename, content_type, size, sha256=None):
+    prefix, max_size = upload_rule(folder)
+    if not filename:
+        raise UploadError("缺少 filename")
+    content_type = content_type or "application/octet-stream"
+    if not content_type.startswith(prefix):
+        raise UploadError(f"{folder} 只接受 {prefix}* 類型")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("size 需為整數")
+    if size <= 0 or size > max_size:
+        raise UploadError(f"檔案大小需介於 1 ~ {max_size} bytes")
+
+    digest = _decode_sha256(sha256)
+    if digest is not None:
+        try:
+            key = acquire(folder, digest, reserve=True)
+        except psycopg2.Error as e:
+            print("[⚠️] blob lookup failed:", e)
+            key = None
+        if key:
+            return {"url": r2_public_url(key), "deduplicated": True}
+
+    ttl = int(os.getenv("UPLOAD_URL_TTL", "600"))
+    key = r2_new_key(folder, filename)
+    params = {
+        "Bucket": os.getenv("R2_BUCKET"),
+        "Key": key,
+        "ContentType": content_type,
+        "ContentLength": size,
+    }
+    headers = {"Content-Type": content_type}
+    if digest is not None:
+        params["ChecksumSHA256"] = sha256
+        headers["x-amz-checksum-sha256"] = sha256
+
+    upload_url = r2_client().generate_presigned_url("put_object", Params=params, ExpiresIn=ttl)
+    upload_token = jwt.encode({
+        "key": key,
+        "folder": folder,
+        "content_type": content_type,
+        "size": size,
+        "sha256": sha256,
+        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=ttl * 2),
+    }, _secret(), algorithm="HS256")
+    return {"upload_url": upload_url, "method": "PUT", "headers": headers, "upload_token": upload_token, "expires_in": ttl}
+
+
+def finalize(upload_token):
+    try:
+        claims = jwt.decode(upload_token or "", _secret(), algorithms=["HS256"])
+    except jwt.InvalidTokenError:
+        raise UploadError("upload_token 無效或已過期")
+
+    key = claims["key"]
+    try:
+        head = r2_client().head_object(Bucket=os.getenv("R2_BUCKET"), Key=key, ChecksumMode="ENABLED")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            raise UploadError("檔案還沒上傳完成")
+        raise
+
+    problems = []
+    if head.get("ContentLength") != claims["size"]:
+        problems.append("大小不符")
+    if (head.get("ContentType") or "").split(";")[0] != claims["content_type"]:
+        problems.append("類型不符")
+    if claims.get("sha256") and head.get("ChecksumSHA256") and head["ChecksumSHA256"] != claims["sha256"]:
+        problems.append("sha256 不符")
+    if problems:
+        r2_delete_keys([key])
+        raise UploadError("上傳的檔案與申請時不同：" + "、".join(problems))
+
+    digest = _decode_sha256(claims.get("sha256"))
+    if digest is not None:
+        try:
+            winner = register(claims["folder"], digest, key, claims["size"], reserve=True)
+        except psycopg2.Error as e:
+            print("[⚠️] blob register failed:", e)
+            winner = key
+        if winner != key:
+            r2_delete_keys([key])
+            key = winner
+    return {"url": r2_public_url(key), "size": claims["size"], "content_type": claims["content_type"]}
+
+
+def stream_upload(read, folder, filename, content_type, content_length=None):
+    prefix, max_size = upload_rule(folder)
+    if not filename:
+        raise UploadError("缺少 filename")
+    content_type = content_type or "application/octet-stream"
+    if not content_type.startswith(prefix):
+        raise UploadError(f"{folder} 只接受 {prefix}* 類型")
+    if content_length is not None and content_length > max_size:
+        raise UploadError(f"檔案大小需介於 1 ~ {max_size} bytes")
+
+    # 上傳的同時算 SHA-256，傳完再去重：內容已經存在就刪掉剛傳的這份
+    digest = hashlib.sha256()
+    key = r2_new_key(folder, filename)
+    try:
+        size = r2_stream_upload(read, key, content_type, max_bytes=max_size, on_chunk=digest.update)
+    except UploadTooLarge:
+        raise UploadError(f"檔案大小需介於 1 ~ {max_size} bytes")
+    if size == 0:
+        r2_delete_keys([key])
+        raise UploadError("檔案是空的")
+
+    try:
+        winner = register(folder, digest.digest(), key, size, reserve=True)
+    except psycopg2.Error as e:
+        print("[⚠️] blob register failed:", e)
+        winner = key
+    if winner != key:
+        r2_delete_keys([key])
+    return {"url": r2_public_url(winner), "size": size, "content_type": content_type}
+
+
+def uploaded_urls(values, folder):
+    # 表單帶回來的直接上傳 URL，只接受該資料夾底下的
+    urls = []
+    for url in values:
+        key = r2_key_from_url(url)
+        if key and key.startswith(f"{folder}/"):
+            urls.append(url)
+        elif url:
+            print(f"[⚠️] ignored uploaded url outside {folder}: {url}")
+    return urls
@@ -0,0 +1,172 @@
+import argparse
+import datetime
+
+from export import csv_lines
+from site_search import SearchError, parse_categories
+
+# 認養 / 維護即將到期的基地報表：maintain_end_date 落在 [from, to] 的資料，
+# 依 維護單位（或認養單位）+ 鄉鎮別 分組。走 migration 11 的 partial index，不掃整張表。
+#   GET /api/reports/maintenance_expiry?days=90&unit=maintain_unit&district=&category=&format=json|csv
+#       from / to（YYYY-MM-DD）可以取代 days；expired=1 連已經過期但還沒處理的一起列
+#   python expiry_report.py --days 60 --csv 到期報表.csv     排程用（例如 crontab 每週一早上）
+#     0 8 * * 1  cd /app && python expiry_report.py --days 60 --csv /reports/expiry_$(date +\%Y\%m\%d).csv
+MAX_DAYS = 730
+UNITS = ("maintain_unit", "adopt_unit")
+CATEGORY_LABELS = {
+    "purification_zones": "空氣品質淨化區",
+    "green_walls": "清淨綠牆",
+    "greenifications": "綠美化",
+}
+REPORT_COLUMNS = [
+    ("unit", "單位"),
+    ("district", "鄉鎮別"),
+    ("category_label", "類別"),
+    ("serial", "序號"),
+    ("project_name", "基地/計劃名稱"),
+    ("maintain_unit", "維護單位"),
+    ("adopt_unit", "認養單位"),
+    ("maintain_start_date", "認養開始日期"),
+    ("maintain_end_date", "認養結束日期"),
+    ("days_left", "剩餘天數"),
+]
+
+
+def _date_arg(value, name):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise SearchError(f"{name} 需為 YYYY-MM-DD")
+
+
+def expiry_window(args, today=None):
+    today = today or datetime.date.today()
+    if args.get("from") or args.get("to"):
+        start = _date_arg(args.get("from"), "from") if args.get("from") else today
+        end = _date_arg(args.get("to"), "to") if args.get("to") else start + datetime.timedelta(days=90)
+    else:
+        try:
+            days = int(args.get("days") or 90)
+        except ValueError:
+            raise SearchError("days 需為整數")
+        if not 0 <= days <= MAX_DAYS:
+            raise SearchError(f"days 需介於 0 ~ {MAX_DAYS}")
+        start, end = today, today + datetime.timedelta(days=days)
+    if start > end:
+        raise SearchError("from 不可晚於 to")
+    if (args.get("expired") or "").lower() in ("1", "true", "yes"):
+        start = None
+    return start, end
+
+
+def expiring_sites(cursor, args, today=None):
+    today = today or datetime.date.today()
+    unit = args.get("unit") or "maintain_unit"
+    if unit not in UNITS:
+        raise SearchError("unit 只能是 " + "、".join(UNITS))
+    categories = parse_categories(args)
+    start, end = expiry_window(args, today)
+
+    where_sql = "maintain_end_date IS NOT NULL AND maintain_end_date <= %s"
+    params = [end]
+    if start:
+        where_sql += " AND maintain_end_date >= %s"
+        params.append(start)
+    district = (args.get("district") or "").strip()
+    if district:
+        where_sql += " AND district = %s"
+        params.append(district)
+
+    cursor.execute(f"""
+        SELECT * FROM (
+            {" UNION ALL ".join(
+                f"SELECT '{table}' AS category, id, serial, project_name, district, "
+                f"maintain_unit, adopt_unit, maintain_start_date, maintain_end_date "
+                f"FROM {table} WHERE {where_sql}"
+                for table in categories
+            )}
+        ) expiring
+        ORDER BY NULLIF({unit}, '') NULLS LAST, district, maintain_end_date, category, id;
+    """, params * len(categories))
+    rows = cursor.fetchall()
+    for row in rows:
+        row["unit"] = row[unit] or "（未填）"
+        row["category_label"] = CATEGORY_LABELS[row["category"]]
+        row["days_left"] = (row["maintain_end_date"] - today).days
+    return unit, start, end, rows
+
+
+def group_sites(rows):
+    # rows 已依 (單位, 鄉鎮別) 排好
+    groups = []
+    for row in rows:
+        if not groups or (groups[-1]["unit"], groups[-1]["district"]) != (row["unit"], row["district"]):
+            groups.append({"unit": row["unit"], "district": row["district"], "count": 0, "expired": 0, "sites": []})
+        group = groups[-1]
+        group["count"] += 1
+        group["expired"] += row["days_left"] < 0
+        group["sites"].append({
+            "category": row["category"],
+            "id": row["id"],
+            "serial": row["serial"],
+            "project_name": row["project_name"],
+            "maintain_unit": row["maintain_unit"],
+            "adopt_unit": row["adopt_unit"],
+            "maintain_start_date": row["maintain_start_date"],
+            "maintain_end_date": row["maintain_end_date"],
+            "days_left": row["days_left"],
+        })
+    return groups
+
+
+def expiry_report(cursor, args, today=None):
+    unit, start, end, rows = expiring_sites(cursor, args, today)
+    return {
+        "unit": unit,
+        "from": start,
+        "to": end,
+        "total": len(rows),
+        "groups": group_sites(rows),
+    }
+
+
+def report_csv(rows):
+    return "".join(csv_lines(rows, REPORT_COLUMNS))
+
+
+def main():
+    from dotenv import load_dotenv
+    from psycopg2.extras import RealDictCursor
+    from werkzeug.datastructures import MultiDict
+    from db_init import get_db_connection
+
+    parser = argparse.ArgumentParser(description="列出認養 / 維護即將到期的基地")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--unit", choices=UNITS, default="maintain_unit")
+    parser.add_argument("--district")
+    parser.add_argument("--expired", action="store_true", help="連已過期的一起列")
+    parser.add_argument("--csv", help="輸出 CSV（UTF-8 BOM，Excel 可直接開）")
+    args = parser.parse_args()
+
+    query = MultiDict({"days": str(args.days), "unit": args.unit, "district": args.district or "",
+                       "expired": "1" if args.expired else ""})
+    load_dotenv()
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            unit, start, end, rows = expiring_sites(cursor, query)
+    finally:
+        conn.close()
+
+    print(f"🧾 認養 / 維護到期報表 {start or '（含已過期）'} ~ {end}：{len(rows)} 筆")
+    for group in group_sites(rows):
+        print(f"  {group['unit']} / {group['district']}：{group['count']} 筆（已過期 {group['expired']}）")
+        for site in group["sites"]:
+            print(f"    - {site['serial']} {site['project_name'] or ''} {site['maintain_end_date']}（{site['days_left']} 天）")
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8", newline="") as f:
+            f.write(report_csv(rows))
+        print(f"[✅] CSV 已寫入 {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import csv
+import datetime
+import io
+import os
+
+from db_pool import db_connection
+from json_provider import json_cursor, json_value
+
+# 整張表匯出（報表用）：server-side cursor（named cursor）每次只從 Postgres 拉 itersize 筆，
+# 邊查邊寫進 generator response，worker 記憶體跟資料筆數無關。
+#   ndjson：一列一個 JSON 物件（跟列表 API 同一個 JSON provider）
+#   csv   ：UTF-8 BOM + 中文欄名，Excel 直接開不會亂碼；照片網址以換行分隔在同一格
+# generator 自己向連線池借連線，response 送完（或 client 中斷）才歸還。
+#   EXPORT_ITERSIZE：每次 fetch 的筆數（預設 2000）
+SITE_COLUMNS = [
+    ("id", "ID"),
+    ("serial", "序號"),
+    ("year", "設置年度"),
+    ("district", "鄉鎮別"),
+    ("type", "類別"),
+    ("project_name", "基地/計劃名稱"),
+    ("maintain_unit", "維護單位"),
+    ("adopt_unit", "認養單位"),
+    ("area", "基地面積 (平方公尺)"),
+    ("length", "基地長度 (公尺)"),
+    ("subsidy_source", "設置經費來源"),
+    ("maintain_start_date", "認養開始日期"),
+    ("maintain_end_date", "認養結束日期"),
+    ("gps", "GPS 座標"),
+    ("annotation", "說明"),
+    ("image_urls", "圖片"),
+    ("created_at", "建立時間"),
+]
+
+TREE_INTRO_COLUMNS = [
+    ("id", "ID"),
+    ("title", "樹種名"),
+    ("scientific_name", "學名"),
+    ("plant_phenology", "物候資訊"),
+    ("features", "形態特徵"),
+    ("natural_distribution", "天然分佈"),
+    ("usage", "景觀用途"),
+    ("other_usage", "其他用途"),
+    ("breeding_intro", "培育或繁殖簡要說明"),
+    ("source", "資料來源"),
+    ("image_url", "圖片"),
+]
+
+# table → (欄位, 可用的篩選參數, 排序)
+EXPORT_TABLES = {
+    "purification_zones": (SITE_COLUMNS, ("year", "district"), "created_at DESC, id DESC"),
+    "green_walls": (SITE_COLUMNS, ("year", "district"), "created_at DESC, id DESC"),
+    "greenifications": (SITE_COLUMNS, ("year", "district"), "created_at DESC, id DESC"),
+    "tree_intros": (TREE_INTRO_COLUMNS, (), "id DESC"),
+}
+FORMATS = {
+    "ndjson": "application/x-ndjson; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def export_query(table, args):
+    if table not in EXPORT_TABLES:
+        raise ExportError(f"不支援匯出：{table}")
+    columns, filters, order_by = EXPORT_TABLES[table]
+
+    where_sql = "1=1"
+    params = []
+    for name in filters:
+        value = args.get(name)
+        if value:
+            where_sql += f" AND {name} = %s"
+            params.append(value)
+
+    select = ", ".join(column for column, _ in columns)
+    return columns, f"SELECT {select} FROM {table} WHERE {where_sql} ORDER BY {order_by}", params
+
+
+def iter_rows(table, query, params):
+    itersize = int(os.getenv("EXPORT_ITERSIZE", "2000"))
+    with db_connection() as conn:
+        try:
+            # named cursor 一定要在 transaction 裡；唯讀匯出，結束時 rollback 關掉
+            with json_cursor(conn, name=f"export_{table}") as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                yield from cursor
+        finally:
+            conn.rollback()
+
+
+def ndjson_lines(rows, dumps):
+    for row in rows:
+        yield dumps(row) + "\n"
+
+
+def _csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(rows, columns, batch_size=500):
+    # csv.writer 寫進 StringIO，每 batch_size 列吐一次，減少 chunk 數量
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")  # BOM：Excel 才會用 UTF-8 開
+    writer.writerow([label for _, label in columns])
+
+    for count, row in enumerate(rows, 1):
+        cells = []
+        for column, _ in columns:
+            value = row[column]
+            if column == "image_urls":
+                value = "\n".join(json_value(value, []))
+            cells.append(_csv_cell(value))
+        writer.writerow(cells)
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_stream(table, fmt, args, dumps):
+    # 回傳 (generator, mimetype, 下載檔名)；參數錯誤在開始串流之前就丟 ExportError
+    if fmt not in FORMATS:
+        raise ExportError("format 需為 ndjson 或 csv")
+    columns, query, params = export_query(table, args)
+
+    rows = iter_rows(table, query, params)
+    if fmt == "csv":
+        body = csv_lines(rows, columns)
+    else:
+        body = ndjson_lines(rows, dumps)
+    filename = f"{table}_{datetime.date.today():%Y%m%d}.{fmt}"
+    return body, FORMATS[fmt], filename
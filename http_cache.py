@@ -0,0 +1,98 @@
+import hashlib
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import request, make_response
+from psycopg2.extras import RealDictCursor
+
+from db_pool import get_db
+from response_cache import cache_key, on_invalidate
+
+# 條件式 GET：ETag / Last-Modified 由 table_versions（migration 4）的版本號產生，
+# client 帶 If-None-Match / If-Modified-Since 且資料沒變時直接回 304，不跑 SELECT。
+# 版本號在記憶體快取 TABLE_STAMP_TTL 秒，寫入的 invalidate 通知會立即清掉。
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+_stamp_lock = threading.Lock()
+_stamps = {}  # tbl -> (version, updated_at, expires_at)
+
+
+def _forget_stamp(table):
+    with _stamp_lock:
+        if table is None:
+            _stamps.clear()
+        else:
+            _stamps.pop(table, None)
+
+
+on_invalidate(_forget_stamp)
+
+
+def get_stamps(tables):
+    now = time.monotonic()
+    result = {}
+    missing = []
+    with _stamp_lock:
+        for table in tables:
+            stamp = _stamps.get(table)
+            if stamp and stamp[2] > now:
+                result[table] = stamp
+            else:
+                missing.append(table)
+
+    if missing:
+        cursor = get_db().cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(
+                "SELECT tbl, version, updated_at FROM table_versions WHERE tbl = ANY(%s);",
+                (missing,),
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        expires_at = now + float(os.getenv("TABLE_STAMP_TTL", "5"))
+        with _stamp_lock:
+            for row in rows:
+                stamp = (row["version"], row["updated_at"], expires_at)
+                _stamps[row["tbl"]] = stamp
+                result[row["tbl"]] = stamp
+    return result
+
+
+def conditional(*tables, cache_control=DEFAULT_CACHE_CONTROL):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            stamps = get_stamps(tables)
+            if len(stamps) < len(tables):
+                # 還沒跑 migration 4，照常回應
+                response = make_response(f(*args, **kwargs))
+                response.headers["Cache-Control"] = cache_control
+                return response
+
+            versions = ",".join(f"{t}:{stamps[t][0]}" for t in tables)
+            etag = hashlib.sha256(f"{cache_key()}|{versions}".encode("utf-8")).hexdigest()[:32]
+            last_modified = max(stamps[t][1] for t in tables).replace(microsecond=0)
+
+            not_modified = False
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            elif request.if_modified_since:
+                not_modified = request.if_modified_since >= last_modified
+
+            if not_modified:
+                response = make_response("", 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.headers["Cache-Control"] = cache_control
+            return response
+        return decorated_function
+    return decorator
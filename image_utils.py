@@ -0,0 +1,335 @@
+import io
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from botocore.exceptions import ClientError
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from blob_store import file_digest, store, upload_file, upload_bytes, discard_uploads
+from db_pool import db_connection
+from json_provider import json_value
+from r2_utils import r2_client, r2_new_key, r2_public_url, r2_key_from_url
+from response_cache import invalidate
+
+# 圖片上傳時的衍生圖：每張圖只解碼一次、依 EXIF 轉正後丟掉所有 metadata（含 GPS），
+# 產生固定的 thumb / medium / full 三種尺寸，各一份 WebP 與 JPEG fallback，
+# 跟原圖一起平行上傳到 {folder}/variants/。
+# DB 的 image_variants 欄位（migration 6）存 {原圖 URL: {尺寸: {webp, jpeg, width, height}}}
+# 原圖與衍生圖都經過 blob_store 去重，內容相同的不會重複 PUT
+# 原圖帶 EXIF / XMP 時也一樣轉正後重新編碼、不帶 metadata 再上傳（公開的原圖不能洩漏 GPS）；
+# 去重仍以使用者上傳的原始內容算雜湊
+#   IMAGE_WEBP_QUALITY / IMAGE_JPEG_QUALITY / IMAGE_ORIGINAL_QUALITY
+VARIANT_SIZES = {"thumb": 320, "medium": 960, "full": 1920}
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+# 原圖可以重新編碼的格式；其他格式（GIF、動畫）照原檔上傳
+ORIGINAL_FORMATS = {"JPEG": ("JPEG", "image/jpeg"), "MPO": ("JPEG", "image/jpeg"),
+                    "PNG": ("PNG", "image/png"), "WEBP": ("WEBP", "image/webp")}
+ORIENTATION_TAG = 0x0112
+SITE_IMAGE_TABLES = ("purification_zones", "green_walls", "greenifications")
+IMAGE_TABLES = SITE_IMAGE_TABLES + ("tree_intros", "result")
+
+
+def _encode(image, fmt):
+    buf = io.BytesIO()
+    if fmt == "webp":
+        image.save(buf, "WEBP", quality=int(os.getenv("IMAGE_WEBP_QUALITY", "80")), method=4)
+    else:
+        if image.mode != "RGB":
+            # JPEG 沒有透明度，鋪白底
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A") if image.mode == "RGBA" else None)
+            image = background
+        image.save(buf, "JPEG", quality=int(os.getenv("IMAGE_JPEG_QUALITY", "85")), optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def _strip_target(source):
+    # 原圖要重新編碼成的 (格式, content type)；沒有 metadata 或格式不支援時回傳 None（照原檔上傳）
+    target = ORIGINAL_FORMATS.get(source.format)
+    if target is None or (source.format != "MPO" and getattr(source, "n_frames", 1) > 1):
+        return None
+    if not (source.getexif() or source.info.get("xmp") or source.info.get("comment")):
+        return None
+    return target
+
+
+def decode_image(data):
+    # 每張圖只解碼一次，衍生圖與去 metadata 的原圖共用：回傳 (source, image)
+    #   source：開啟的原檔（format / info / EXIF；不用轉正的 JPEG 直接存回去）
+    #   image：依 EXIF 轉正後的圖
+    # 不是圖片（或 Pillow 讀不了）回傳 None；呼叫端負責 source.close()
+    largest = max(VARIANT_SIZES.values())
+    try:
+        source = Image.open(io.BytesIO(data))
+        if _strip_target(source) is None:
+            # 原圖不用重新編碼時，JPEG 直接用 DCT 縮小解碼，大圖不用先解出全尺寸
+            source.draft("RGB", (largest, largest))
+        source.load()
+        if source.getexif().get(ORIENTATION_TAG, 1) == 1:
+            return source, source
+        return source, ImageOps.exif_transpose(source)
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"[⚠️] image decode failed: {e}")
+        return None
+
+
+def render_variants(image):
+    # 回傳 {尺寸: (width, height, {格式: bytes})}；image 是 decode_image() 轉正後的圖，不會被改動
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    # 從大到小依序縮，每一層都從上一層縮（編碼完才縮下一層），比每次從原圖縮快
+    variants = {}
+    for size, edge in sorted(VARIANT_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        variants[size] = (image.width, image.height, {fmt: _encode(image, fmt) for fmt in FORMATS})
+    return variants
+
+
+def strip_metadata(source, image):
+    # 回傳 (bytes, content type)：轉正、去掉 EXIF / XMP / 註解，保留 ICC 色彩描述檔；
+    # 沒有 metadata 或格式不支援時回傳 None（照原檔上傳）
+    target = _strip_target(source)
+    if target is None:
+        return None
+
+    fmt, content_type = target
+    options = {"exif": b"", "xmp": b"", "comment": b"", "icc_profile": source.info.get("icc_profile")}
+    quality = int(os.getenv("IMAGE_ORIGINAL_QUALITY", "95"))
+    buf = io.BytesIO()
+    try:
+        if fmt == "JPEG" and image is source:
+            # 不用轉正的 JPEG 沿用原本的量化表，畫質幾乎不變
+            source.save(buf, "JPEG", quality="keep", **options)
+        elif fmt == "JPEG":
+            image.save(buf, "JPEG", quality=quality, **options)
+        elif fmt == "WEBP":
+            image.save(buf, "WEBP", quality=quality, **options)
+        else:
+            image.save(buf, "PNG", optimize=True, **options)
+    except (OSError, ValueError) as e:
+        print(f"[⚠️] image metadata strip failed: {e}")
+        return None
+    return buf.getvalue(), content_type
+
+
+def process_image(data):
+    # 回傳 (衍生圖, 去 metadata 的原圖)；不是圖片時兩個都是 None
+    decoded = decode_image(data)
+    if decoded is None:
+        return None, None
+    source, image = decoded
+    with source:
+        return render_variants(image), strip_metadata(source, image)
+
+
+def _render_file(file):
+    data = file.read()
+    file.seek(0)
+    return process_image(data)
+
+
+def _put_original(client, key, body, content_type):
+    try:
+        client.put_object(Bucket=os.getenv("R2_BUCKET"), Key=key, Body=body, ContentType=content_type, ACL="public-read")
+        return r2_public_url(key)
+    except ClientError as e:
+        print(f"R2 upload error: {e}")
+        return None
+
+
+def _upload_original(file, clean, folder, client):
+    if clean is None:
+        return upload_file(file, folder, client)
+    digest, _ = file_digest(file)
+    body, content_type = clean
+    put = partial(_put_original, client, r2_new_key(folder, file.filename), body, content_type)
+    return store(folder, digest, len(body), put)
+
+
+def _put_variant(client, key, body, content_type):
+    client.put_object(
+        Bucket=os.getenv("R2_BUCKET"),
+        Key=key,
+        Body=body,
+        ContentType=content_type,
+        CacheControl="public, max-age=31536000, immutable",
+        ACL="public-read",
+    )
+    return r2_public_url(key)
+
+
+def _submit_variants(pool, client, folder, variants):
+    pending = {}
+    token = uuid.uuid4().hex
+    for size, (width, height, bodies) in (variants or {}).items():
+        for fmt, body in bodies.items():
+            key = f"{folder}/variants/{token}/{size}.{fmt}"
+            put = partial(_put_variant, client, key, body, FORMATS[fmt][1])
+            pending[(size, fmt)] = (width, height, pool.submit(upload_bytes, body, folder, put))
+    return pending
+
+
+def _collect_variants(pending):
+    # 回傳 (entry, 已上傳的 URL, 是否有失敗)
+    entry, uploaded, failed = {}, [], False
+    for (size, fmt), (width, height, future) in pending.items():
+        try:
+            variant_url = future.result()
+        except Exception as e:
+            print(f"R2 upload error: {e}")
+            failed = True
+            continue
+        uploaded.append(variant_url)
+        entry.setdefault(size, {"width": width, "height": height})[fmt] = variant_url
+    return entry, uploaded, failed
+
+
+def upload_images(files, folder="articles"):
+    # 回傳 (image_urls, image_variants)：image_urls 順序跟 files 一樣，原圖上傳失敗的略過；
+    # 衍生圖產生或上傳失敗時那張圖只有原圖，前端退回用 image_urls
+    files = [f for f in files if f and f.filename]
+    if not files:
+        return [], {}
+
+    client = r2_client()
+    with ThreadPoolExecutor(max_workers=int(os.getenv("R2_UPLOAD_CONCURRENCY", "4"))) as pool:
+        # 縮圖 / 編碼大多在 C 裡做，會放掉 GIL，可以跟上傳一起用 thread
+        rendered = list(pool.map(_render_file, files))
+
+        jobs = [
+            (pool.submit(_upload_original, file, clean, folder, client), _submit_variants(pool, client, folder, variants))
+            for file, (variants, clean) in zip(files, rendered)
+        ]
+
+        image_urls, image_variants, leftovers = [], {}, []
+        for original, pending in jobs:
+            url = original.result()
+            entry, uploaded, failed = _collect_variants(pending)
+            if not url or failed:
+                leftovers += uploaded
+            if url:
+                image_urls.append(url)
+                if entry and not failed:
+                    image_variants[url] = entry
+
+    if leftovers:
+        discard_uploads(leftovers)
+    return image_urls, image_variants
+
+
+def upload_image(file, folder="articles"):
+    # 單張圖（tree_intros / result）：回傳 (image_url, image_variants)
+    urls, variants = upload_images([file], folder=folder)
+    return (urls[0] if urls else None), variants
+
+
+def backfill_variants(table, folder, urls):
+    # 直接上傳到 R2 的圖（direct_upload.py）沒經過上面的流程，由 jobs worker 事後補衍生圖：
+    # 從 R2 讀回原圖、產生衍生圖，寫進目前引用這張圖、但還沒有衍生圖的資料列
+    if table not in IMAGE_TABLES:
+        raise ValueError(f"unknown image table {table}")
+    match_sql = "image_urls ? %s" if table in SITE_IMAGE_TABLES else "image_url = %s"
+
+    client = r2_client()
+    for url in urls:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT id FROM {table} WHERE {match_sql} AND NOT (COALESCE(image_variants, '{{}}') ? %s);",
+                    (url, url),
+                )
+                ids = [row[0] for row in cur.fetchall()]
+            conn.rollback()
+        if not ids:
+            continue
+
+        key = r2_key_from_url(url)
+        body = client.get_object(Bucket=os.getenv("R2_BUCKET"), Key=key)["Body"].read()
+        variants, clean = process_image(body)
+        if clean:
+            # 瀏覽器直傳的原圖還帶著 EXIF / GPS：同一個 key 覆寫成去掉 metadata 的版本
+            _put_original(client, key, *clean)
+        if not variants:
+            continue
+
+        # 每一列各算一次引用，跟 upload_images 一樣；第一次之後都是去重命中
+        entries, leftovers = [], []
+        with ThreadPoolExecutor(max_workers=int(os.getenv("R2_UPLOAD_CONCURRENCY", "4"))) as pool:
+            for _ in ids:
+                entry, uploaded, failed = _collect_variants(_submit_variants(pool, client, folder, variants))
+                if failed:
+                    leftovers += uploaded
+                else:
+                    entries.append((entry, uploaded))
+
+        updated = 0
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                for row_id, (entry, uploaded) in zip(ids, entries):
+                    cur.execute(f"""
+                        UPDATE {table}
+                           SET image_variants = COALESCE(image_variants, '{{}}') || jsonb_build_object(%s::text, %s::jsonb)
+                         WHERE id = %s AND {match_sql} AND NOT (COALESCE(image_variants, '{{}}') ? %s);
+                    """, (url, json.dumps(entry), row_id, url, url))
+                    if cur.rowcount == 0:
+                        # 這段時間資料被改掉了
+                        leftovers += uploaded
+                    updated += cur.rowcount
+            conn.commit()
+        if updated:
+            # 列表 / 單筆的快取要重抓才有 srcset（也會 NOTIFY 其他 worker）
+            invalidate(table)
+        if leftovers:
+            discard_uploads(leftovers)
+
+
+# ---------------------------- 讀取端 -----------------------------
+
+def variant_urls(image_variants, urls=None):
+    # 衍生圖的 URL 清單；給 urls 時只取這些原圖的衍生圖（刪除被換掉的圖用）
+    image_variants = json_value(image_variants, {})
+    return [
+        entry[fmt]
+        for url, sizes in image_variants.items() if urls is None or url in urls
+        for entry in sizes.values()
+        for fmt in FORMATS if entry.get(fmt)
+    ]
+
+
+def srcset(url, image_variants):
+    # <picture> 用：<source type="image/webp" srcset=...> + <img src=... srcset=...>
+    sizes = json_value(image_variants, {}).get(url)
+    if not sizes:
+        return {"src": url, "original": url, "width": None, "height": None, "thumb": url, "srcset": None}
+
+    # 原圖比 thumb / medium 小時幾個尺寸一樣大，srcset 只留一個
+    ordered = []
+    for name in VARIANT_SIZES:
+        if name in sizes and not (ordered and ordered[-1]["width"] == sizes[name]["width"]):
+            ordered.append(sizes[name])
+    largest = ordered[-1]
+    return {
+        "src": (sizes.get("medium") or largest)["jpeg"],
+        "original": url,
+        "width": largest["width"],
+        "height": largest["height"],
+        "thumb": ordered[0]["webp"],
+        "srcset": {fmt: ", ".join(f"{entry[fmt]} {entry['width']}w" for entry in ordered) for fmt in FORMATS},
+    }
+
+
+def attach_srcset(row):
+    # 多圖（image_urls）→ row["images"]，單圖（image_url）→ row["image"]；image_variants 不直接回傳
+    if row is None:
+        return row
+    image_variants = json_value(row.pop("image_variants", None), {})
+    if "image_urls" in row:
+        # image_urls 本身不動（json_cursor 查出來的會原樣輸出），只拿來組 images
+        row["images"] = [srcset(url, image_variants) for url in json_value(row["image_urls"], None) or []]
+    if "image_url" in row:
+        row["image"] = srcset(row["image_url"], image_variants) if row["image_url"] else None
+    return row
@@ -0,0 +1,220 @@
+import json
+import os
+import random
+import select
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from blob_store import release_keys
+from image_utils import backfill_variants
+from r2_utils import r2_delete_keys, r2_key_from_url
+
+# 背景工作佇列（jobs 表，migration 5）
+#   enqueue() 跟業務資料同一個 transaction 寫入，commit 之後才會被執行
+#   python jobs.py 啟動 worker：批次領取 → 執行 → 失敗指數退避重試 → 超過次數標記 dead
+#   JOB_BATCH_SIZE / JOB_POLL_SECONDS / JOB_LOCK_TIMEOUT / JOB_BACKOFF_BASE / JOB_BACKOFF_MAX
+CHANNEL = "jobs"
+HANDLERS = {}
+
+
+def job_handler(kind):
+    # handler(jobs) 一次處理同一種類的多筆工作，回傳 {job_id: 錯誤訊息}，沒列出的視為成功
+    def register(f):
+        HANDLERS[kind] = f
+        return f
+    return register
+
+
+def enqueue(cursor, kind, payload, delay_seconds=0, max_attempts=8):
+    cursor.execute("""
+        INSERT INTO jobs (kind, payload, run_at, max_attempts)
+        VALUES (%s, %s, now() + make_interval(secs => %s), %s)
+        RETURNING id;
+    """, (kind, json.dumps(payload), delay_seconds, max_attempts))
+    job_id = cursor.fetchone()
+    cursor.execute("SELECT pg_notify(%s, %s);", (CHANNEL, kind))
+    return job_id["id"] if isinstance(job_id, dict) else job_id[0]
+
+
+def enqueue_r2_delete(cursor, file_urls):
+    # 去重後同一個檔案可能被多筆資料引用，引用次數歸零的才排進刪除
+    keys = release_keys(cursor, [r2_key_from_url(url) for url in file_urls or []])
+    if not keys:
+        return None
+    return enqueue(cursor, "r2_delete", {"keys": keys})
+
+
+def enqueue_image_variants(cursor, table, folder, image_urls):
+    # 直接上傳（沒經過 upload_images）的圖，由 worker 補產生衍生圖
+    image_urls = [url for url in image_urls or [] if url]
+    if not image_urls:
+        return None
+    return enqueue(cursor, "image_variants", {"table": table, "folder": folder, "urls": image_urls})
+
+
+# ---------------------------- handlers -----------------------------
+
+@job_handler("r2_delete")
+def _handle_r2_delete(jobs):
+    # 多筆工作的 key 合併成 DeleteObjects 批次，再把逐 key 的結果對回各筆工作
+    keys = [key for job in jobs for key in job["payload"].get("keys", [])]
+    result = r2_delete_keys(keys)
+    failed = {e["key"]: f"{e['code']}: {e['message']}" for e in result["errors"]}
+
+    errors = {}
+    for job in jobs:
+        job_errors = [failed[key] for key in job["payload"].get("keys", []) if key in failed]
+        if job_errors:
+            errors[job["id"]] = "; ".join(job_errors)
+    return errors
+
+
+@job_handler("image_variants")
+def _handle_image_variants(jobs):
+    errors = {}
+    for job in jobs:
+        payload = job["payload"]
+        try:
+            backfill_variants(payload["table"], payload["folder"], payload["urls"])
+        except Exception as e:
+            errors[job["id"]] = repr(e)
+    return errors
+
+
+# ---------------------------- worker -----------------------------
+
+def claim(cursor, batch_size):
+    # 逾時沒回報的 running（worker 當掉）也重新領取
+    cursor.execute("""
+        WITH claimed AS (
+            SELECT id FROM jobs
+             WHERE (status = 'pending' AND run_at <= now())
+                OR (status = 'running' AND locked_at < now() - make_interval(secs => %s))
+             ORDER BY run_at, id
+             LIMIT %s
+             FOR UPDATE SKIP LOCKED
+        )
+        UPDATE jobs j
+           SET status = 'running', locked_at = now(), attempts = j.attempts + 1
+          FROM claimed
+         WHERE j.id = claimed.id
+        RETURNING j.id, j.kind, j.payload, j.attempts, j.max_attempts;
+    """, (float(os.getenv("JOB_LOCK_TIMEOUT", "300")), batch_size))
+    return cursor.fetchall()
+
+
+def backoff_seconds(attempts):
+    base = float(os.getenv("JOB_BACKOFF_BASE", "10"))
+    cap = float(os.getenv("JOB_BACKOFF_MAX", "3600"))
+    delay = min(cap, base * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def finish(cursor, jobs, errors):
+    done = [job["id"] for job in jobs if job["id"] not in errors]
+    if done:
+        cursor.execute("DELETE FROM jobs WHERE id = ANY(%s);", (done,))
+
+    for job in jobs:
+        if job["id"] not in errors:
+            continue
+        if job["attempts"] >= job["max_attempts"]:
+            print(f"[❌] job {job['id']} ({job['kind']}) dead after {job['attempts']} attempts: {errors[job['id']]}")
+            cursor.execute(
+                "UPDATE jobs SET status = 'dead', locked_at = NULL, last_error = %s WHERE id = %s;",
+                (errors[job["id"]], job["id"]),
+            )
+        else:
+            cursor.execute("""
+                UPDATE jobs
+                   SET status = 'pending', locked_at = NULL, last_error = %s,
+                       run_at = now() + make_interval(secs => %s)
+                 WHERE id = %s;
+            """, (errors[job["id"]], backoff_seconds(job["attempts"]), job["id"]))
+
+
+def run_once(conn, batch_size=None):
+    batch_size = batch_size or int(os.getenv("JOB_BATCH_SIZE", "50"))
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        jobs = claim(cursor, batch_size)
+        conn.commit()
+        if not jobs:
+            return 0
+
+        by_kind = {}
+        for job in jobs:
+            by_kind.setdefault(job["kind"], []).append(job)
+
+        errors = {}
+        for kind, kind_jobs in by_kind.items():
+            handler = HANDLERS.get(kind)
+            if handler is None:
+                errors.update({job["id"]: f"unknown job kind {kind}" for job in kind_jobs})
+                continue
+            try:
+                errors.update(handler(kind_jobs))
+            except Exception as e:
+                errors.update({job["id"]: repr(e) for job in kind_jobs})
+
+        finish(cursor, jobs, errors)
+        conn.commit()
+        return len(jobs)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _connect():
+    from db_init import get_db_connection
+
+    while True:
+        conn = get_db_connection()
+        if conn is not None:
+            return conn
+        time.sleep(float(os.getenv("JOB_POLL_SECONDS", "5")))
+
+
+def work_forever():
+    poll = float(os.getenv("JOB_POLL_SECONDS", "5"))
+    conn = listener = None
+    print("[✅] job worker started")
+
+    while True:
+        try:
+            if conn is None or conn.closed:
+                conn = _connect()
+            if listener is None or listener.closed:
+                listener = _connect()
+                listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with listener.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL};")
+
+            if run_once(conn):
+                continue
+
+            # 沒工作就等 NOTIFY 或下一次輪詢（退避中的工作靠輪詢喚醒）
+            if select.select([listener], [], [], poll) != ([], [], []):
+                listener.poll()
+                listener.notifies.clear()
+        except psycopg2.Error as e:
+            print("[❌] job worker DB error:", e)
+            for c in (conn, listener):
+                if c is not None:
+                    try:
+                        c.close()
+                    except Exception:
+                        pass
+            conn = listener = None
+            time.sleep(poll)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    work_forever()
@@ -0,0 +1,82 @@
+import decimal
+import json
+import os
+
+from flask.json.provider import JSONProvider
+from psycopg2.extras import RealDictCursor, register_default_jsonb
+
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 時維持 Flask 預設的 json provider
+    orjson = None
+
+# Flask 回應的 JSON 序列化改用 orjson（JSON_PROVIDER=default 可切回 Flask 預設）：
+#   date / datetime 直接輸出 ISO 8601，Decimal 跟 Flask 預設一樣輸出字串，中文不轉成 \uXXXX
+#   json_cursor() 查出來的 JSONB 欄位不 parse（RawJSON），回應時原樣嵌入，省掉 decode + encode
+OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+_passthrough = False
+
+
+class RawJSON:
+    # JSONB 欄位的原始文字；需要內容時用 json_value() 取
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return f"RawJSON({self.text!r})"
+
+
+def json_value(value, default=None):
+    # RawJSON / JSON 字串 / 已經 parse 過的值，一律回傳 Python 物件
+    if value is None:
+        return default
+    if isinstance(value, RawJSON):
+        return orjson.loads(value.text)
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+def _default(obj):
+    if isinstance(obj, RawJSON):
+        return orjson.Fragment(obj.text)
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=_default, option=OPTIONS), mimetype=self.mimetype)
+
+
+def init_app(app):
+    global _passthrough
+    if orjson is None or os.getenv("JSON_PROVIDER", "orjson") != "orjson":
+        return
+    app.json = OrjsonProvider(app)
+    _passthrough = True
+
+
+def json_cursor(conn, name=None):
+    # 唯讀 API 用：JSONB 以 RawJSON 傳回；還沒換成 orjson provider 時就是一般的 RealDictCursor
+    # name 有給就是 server-side（named）cursor，匯出大量資料用
+    cursor = conn.cursor(name=name, cursor_factory=RealDictCursor)
+    if _passthrough:
+        register_default_jsonb(cursor, loads=RawJSON)
+    return cursor
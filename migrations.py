@@ -0,0 +1,347 @@
+from db_init import get_db_connection
+
+# 版本化的 schema 變更：只能往後加，不要改已經上線的步驟。
+# 每一步都要可以重複執行（IF NOT EXISTS / ON CONFLICT），不使用 DROP SCHEMA。
+SITE_TABLES = ("purification_zones", "green_walls", "greenifications")
+VERSIONED_TABLES = SITE_TABLES + ("tree_intros", "result", "files", "settings", "site_sections")
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def register(f):
+        MIGRATIONS.append((version, name, f))
+        return f
+    return register
+
+
+@migration(1, "site list keyset indexes")
+def _site_list_keyset_indexes(cursor):
+    for table in SITE_TABLES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_created_id ON {table} (created_at, id);")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_year_district_created_id ON {table} (year, district, created_at, id);")
+
+
+@migration(2, "site filter and summary indexes")
+def _site_filter_summary_indexes(cursor):
+    # (year, district, created_at) 已由 migration 1 的 (year, district, created_at, id) 涵蓋
+    for table in SITE_TABLES:
+        # 只篩 district 的列表 + /api/summary 的 index-only scan
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_district_covering
+            ON {table} (district, created_at DESC) INCLUDE (area, length);
+        """)
+        cursor.execute(f"ANALYZE {table};")
+
+
+@migration(3, "site_stats rollup with triggers")
+def _site_stats_rollup(cursor):
+    # (tbl, district, year, type) 一列，由 trigger 增量維護；/api/summary 讀這張表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS site_stats (
+            tbl TEXT NOT NULL,
+            district TEXT NOT NULL,
+            year TEXT NOT NULL,
+            type TEXT NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            area DOUBLE PRECISION NOT NULL DEFAULT 0,
+            length DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (tbl, district, year, type)
+        );
+
+        CREATE OR REPLACE FUNCTION site_stats_apply(
+            p_tbl TEXT, p_district TEXT, p_year TEXT, p_type TEXT,
+            p_count INT, p_area DOUBLE PRECISION, p_length DOUBLE PRECISION
+        ) RETURNS VOID AS $$
+        BEGIN
+            INSERT INTO site_stats AS s (tbl, district, year, type, count, area, length)
+            VALUES (p_tbl, p_district, p_year, p_type, p_count,
+                    p_count * COALESCE(p_area, 0), p_count * COALESCE(p_length, 0))
+            ON CONFLICT (tbl, district, year, type) DO UPDATE
+               SET count = s.count + EXCLUDED.count,
+                   area = s.area + EXCLUDED.area,
+                   length = s.length + EXCLUDED.length;
+
+            DELETE FROM site_stats
+             WHERE tbl = p_tbl AND district = p_district AND year = p_year AND type = p_type
+               AND count <= 0;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION site_stats_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM site_stats_apply(TG_TABLE_NAME, OLD.district, OLD.year, OLD.type, -1, OLD.area, OLD.length);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM site_stats_apply(TG_TABLE_NAME, NEW.district, NEW.year, NEW.type, 1, NEW.area, NEW.length);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in SITE_TABLES:
+        cursor.execute(f"""
+            DROP TRIGGER IF EXISTS trg_{table}_site_stats ON {table};
+            CREATE TRIGGER trg_{table}_site_stats
+            AFTER INSERT OR DELETE OR UPDATE OF district, year, type, area, length ON {table}
+            FOR EACH ROW EXECUTE FUNCTION site_stats_trigger();
+        """)
+
+    from site_stats import rebuild
+    rebuild(cursor)
+
+
+@migration(4, "table_versions change stamps")
+def _table_versions(cursor):
+    # 每張表一個版本號，寫入時由 statement-level trigger 遞增；ETag / Last-Modified 用
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            tbl TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 1,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE OR REPLACE FUNCTION table_versions_bump() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO table_versions AS v (tbl) VALUES (TG_TABLE_NAME)
+            ON CONFLICT (tbl) DO UPDATE
+               SET version = v.version + 1,
+                   updated_at = now();
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in VERSIONED_TABLES:
+        cursor.execute(
+            "INSERT INTO table_versions (tbl) VALUES (%s) ON CONFLICT (tbl) DO NOTHING;",
+            (table,),
+        )
+        cursor.execute(f"""
+            DROP TRIGGER IF EXISTS trg_{table}_version ON {table};
+            CREATE TRIGGER trg_{table}_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION table_versions_bump();
+        """)
+
+
+@migration(5, "jobs queue")
+def _jobs_queue(cursor):
+    # R2 等外部副作用的背景工作；worker 用 FOR UPDATE SKIP LOCKED 領取（jobs.py）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id BIGSERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload JSONB NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            max_attempts INT NOT NULL DEFAULT 8,
+            run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            locked_at TIMESTAMPTZ,
+            last_error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (run_at, id) WHERE status = 'pending';
+        CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (locked_at) WHERE status = 'running';
+    """)
+
+
+@migration(6, "image variants")
+def _image_variants(cursor):
+    # {原圖 URL: {thumb/medium/full: {webp, jpeg, width, height}}}，由 image_utils.upload_images 產生
+    for table in SITE_TABLES + ("tree_intros", "result"):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS image_variants JSONB;")
+
+
+@migration(7, "content-addressed blobs")
+def _blobs(cursor):
+    # 上傳內容去重（blob_store.py）：同一資料夾內 sha256 相同的檔案共用一個 R2 key
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            key TEXT PRIMARY KEY,
+            folder TEXT NOT NULL,
+            sha256 BYTEA NOT NULL,
+            size BIGINT NOT NULL,
+            refcount INT NOT NULL DEFAULT 1,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            last_used_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_blobs_folder_sha256 ON blobs (folder, sha256);
+    """)
+
+
+@migration(8, "site bulk import")
+def _site_bulk_import(cursor):
+    # 批次匯入（site_import.py）以 (serial, year) 比對既有資料；舊資料可能重複，所以不設 UNIQUE
+    for table in SITE_TABLES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_serial_year ON {table} (serial, year);")
+
+    # 逐列 trigger 在大量寫入時會把同一列 site_stats 更新上萬次；
+    # transaction 內 SET LOCAL site_stats.deferred = 'on' 就跳過，由呼叫端最後 site_stats.rebuild_table()
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION site_stats_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            IF current_setting('site_stats.deferred', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM site_stats_apply(TG_TABLE_NAME, OLD.district, OLD.year, OLD.type, -1, OLD.area, OLD.length);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM site_stats_apply(TG_TABLE_NAME, NEW.district, NEW.year, NEW.type, 1, NEW.area, NEW.length);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+
+@migration(9, "trigram text search")
+def _trigram_text_search(cursor):
+    # 樹種 / 成果文章搜尋（text_search.py）的 GIN trigram index；沒有 pg_trgm 就跳過
+    from text_search import create_indexes
+    create_indexes(cursor)
+
+
+@migration(10, "site coordinates")
+def _site_coordinates(cursor):
+    # gps 是自由輸入的文字；parse_gps() 解析 "lat, lon"（順序相反、括號、全形逗號也可），
+    # 解析不了或超出範圍就是 NULL。lat / lon 是 generated column，寫入 gps 時自動重算，
+    # 新增欄位時整張表重寫一次就等於回填。地圖 bbox 查詢走 point(lon, lat) 的 GiST index。
+    cursor.execute(r"""
+        CREATE OR REPLACE FUNCTION parse_gps(raw TEXT) RETURNS DOUBLE PRECISION[] AS $$
+        DECLARE
+            parts TEXT[];
+            a DOUBLE PRECISION;
+            b DOUBLE PRECISION;
+        BEGIN
+            parts := regexp_match(raw, '^\s*[(\[]?\s*(-?\d{1,3}(?:\.\d+)?)\s*(?:[,，;]\s*|\s+)(-?\d{1,3}(?:\.\d+)?)\s*[)\]]?\s*$');
+            IF parts IS NULL THEN
+                RETURN NULL;
+            END IF;
+            a := parts[1]::DOUBLE PRECISION;
+            b := parts[2]::DOUBLE PRECISION;
+            IF abs(a) > 90 THEN
+                -- 經度寫在前面
+                SELECT b, a INTO a, b;
+            END IF;
+            IF abs(a) > 90 OR abs(b) > 180 OR (a = 0 AND b = 0) THEN
+                RETURN NULL;
+            END IF;
+            RETURN ARRAY[a, b];
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE;
+    """)
+    for table in SITE_TABLES:
+        cursor.execute(f"""
+            ALTER TABLE {table}
+                ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION GENERATED ALWAYS AS ((parse_gps(gps))[1]) STORED,
+                ADD COLUMN IF NOT EXISTS lon DOUBLE PRECISION GENERATED ALWAYS AS ((parse_gps(gps))[2]) STORED;
+            CREATE INDEX IF NOT EXISTS idx_{table}_location
+                ON {table} USING gist (point(lon, lat)) WHERE lat IS NOT NULL;
+            ANALYZE {table};
+        """)
+
+
+@migration(11, "maintenance expiry index")
+def _maintenance_expiry_index(cursor):
+    # 到期報表（expiry_report.py）與 /api/sites/search 的維護期間篩選都是 maintain_end_date 範圍查詢；
+    # 沒填日期的不進 index。資料的實體順序跟到期日無關，BRIN 幫不上忙，用 partial btree
+    for table in SITE_TABLES:
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_maintain_end
+            ON {table} (maintain_end_date) INCLUDE (district, maintain_unit, adopt_unit)
+            WHERE maintain_end_date IS NOT NULL;
+        """)
+
+
+@migration(12, "site created_at not null")
+def _site_created_at_not_null(cursor):
+    # keyset 分頁的 cursor 跟排序都靠 (created_at, id)；沒有建立時間的舊資料視為最舊
+    for table in SITE_TABLES:
+        cursor.execute(f"""
+            UPDATE {table} SET created_at = 'epoch'::timestamp WHERE created_at IS NULL;
+            ALTER TABLE {table} ALTER COLUMN created_at SET NOT NULL;
+        """)
+
+
+@migration(13, "upload reservations")
+def _upload_reservations(cursor):
+    # 直接上傳（direct_upload.py）先拿到的 blobs 引用：表單存檔時轉給資料列（blob_store.claim_uploads），
+    # 沒人認領、過期的由 r2_gc.py 收回（blob_store.release_expired_reservations）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS upload_reservations (
+            id BIGSERIAL PRIMARY KEY,
+            key TEXT NOT NULL,
+            expires_at TIMESTAMPTZ NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_upload_reservations_key ON upload_reservations (key);
+        CREATE INDEX IF NOT EXISTS idx_upload_reservations_expires ON upload_reservations (expires_at);
+    """)
+
+
+def run_migrations(conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cursor = conn.cursor()
+    applied = []
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        conn.commit()
+
+        # 多個 worker / 部署同時啟動時只讓一個跑 migration
+        cursor.execute("SELECT pg_advisory_lock(hashtext('schema_version'));")
+        try:
+            cursor.execute("SELECT version FROM schema_version;")
+            done = {row[0] for row in cursor.fetchall()}
+
+            for version, name, step in sorted(MIGRATIONS, key=lambda m: m[0]):
+                if version in done:
+                    continue
+                try:
+                    step(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, name) VALUES (%s, %s);",
+                        (version, name),
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(version)
+                print(f"[✅] migration {version} {name}")
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(hashtext('schema_version'));")
+            conn.commit()
+    finally:
+        cursor.close()
+        if own_conn:
+            conn.close()
+    return applied
+
+
+def current_version(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('schema_version');")
+        if cursor.fetchone()[0] is None:
+            return 0
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version;")
+        return cursor.fetchone()[0]
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    applied = run_migrations()
+    print("🧾 applied migrations:", applied or "none")
@@ -0,0 +1,145 @@
+import base64
+import datetime
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def parse_limit(args, default=DEFAULT_LIMIT):
+    raw = args.get("limit")
+    if raw in (None, ""):
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise PaginationError("limit 必須是整數")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+# ---------------------------- COUNT(*) 快取 -----------------------------
+# 頁數只需要大概的總數；每個 worker 各自快取 COUNT_CACHE_TTL 秒，
+# 本 worker 的新增 / 刪除會立即 invalidate_count()
+# key 含使用者的篩選參數（year / district…），用 LRU 限制筆數：COUNT_CACHE_MAX_ENTRIES
+
+_count_lock = threading.Lock()
+_count_cache = OrderedDict()  # (table, where_sql, params) -> (total, expires_at)
+
+
+def cached_count(cursor, table, where_sql="TRUE", params=()):
+    key = (table, where_sql, tuple(params))
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached and cached[1] > now:
+            _count_cache.move_to_end(key)
+            return cached[0]
+        if cached:
+            del _count_cache[key]
+
+    cursor.execute(f"SELECT COUNT(*) AS total FROM {table} WHERE {where_sql};", list(params))
+    row = cursor.fetchone()
+    total = row["total"] if isinstance(row, dict) else row[0]
+
+    ttl = float(os.getenv("COUNT_CACHE_TTL", "60"))
+    max_entries = int(os.getenv("COUNT_CACHE_MAX_ENTRIES", "1024"))
+    with _count_lock:
+        _count_cache[key] = (total, now + ttl)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > max_entries:
+            _count_cache.popitem(last=False)
+    return total
+
+
+def invalidate_count(table=None):
+    # table=None 全部清掉（例如快取通知斷線重連）
+    with _count_lock:
+        for key in [k for k in _count_cache if table is None or k[0] == table]:
+            del _count_cache[key]
+
+
+# ---------------------------- Page / limit（articles.html 格式） -----------------------------
+
+def wants_page(args):
+    return "page" in args or "limit" in args
+
+
+def parse_page(args):
+    try:
+        return max(1, int(args.get("page") or 1))
+    except ValueError:
+        raise PaginationError("page 必須是整數")
+
+
+def offset_page(cursor, table, columns, order_sql, args, default_limit=10):
+    page = parse_page(args)
+    limit = parse_limit(args, default=default_limit)
+
+    total = cached_count(cursor, table)
+    pages = max(1, -(-total // limit))
+
+    cursor.execute(
+        f"SELECT {columns} FROM {table} ORDER BY {order_sql} LIMIT %s OFFSET %s;",
+        (limit, (page - 1) * limit),
+    )
+    return {"items": cursor.fetchall(), "total": total, "page": page, "pages": pages}
+
+
+# ---------------------------- Keyset (created_at, id) -----------------------------
+
+def wants_keyset(args):
+    # 預設分頁；整包陣列只給明確帶 ?all=1 的舊 client（放在 query string，回應快取 / ETag 才分得開）
+    return args.get("all") != "1"
+
+
+def encode_cursor(row):
+    payload = [row["created_at"].isoformat(), row["id"]]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        # 先在這裡解析，偽造 / 損壞的時間不要送進 SQL 變成 500
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise PaginationError("cursor 無效")
+
+
+def keyset_page(cursor, table, where_sql, params, args, columns="*"):
+    # table / where_sql / columns 都是程式內固定字串，使用者輸入只走 params
+    # created_at 由 migration 12 補值並設為 NOT NULL
+    limit = parse_limit(args)
+    token = args.get("cursor")
+
+    page_sql = where_sql
+    page_params = list(params)
+    if token:
+        # (created_at, id) 索引上的 range scan
+        page_sql += " AND (created_at, id) < (%s, %s)"
+        page_params += list(decode_cursor(token))
+
+    cursor.execute(
+        f"SELECT {columns} FROM {table} WHERE {page_sql} "
+        f"ORDER BY created_at DESC, id DESC LIMIT %s;",
+        page_params + [limit + 1],
+    )
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+
+    total = cached_count(cursor, table, where_sql, params)
+
+    return {"items": rows, "next_cursor": next_cursor, "total": total}
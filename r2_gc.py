@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+
+from blob_store import release_expired_reservations
+from r2_utils import r2_client, r2_delete_keys, r2_key_from_url
+
+# R2 孤兒檔案清理：列出各資料夾的物件，跟 DB 內引用到的 URL 比對，
+# 沒被引用且超過寬限期的物件批次刪除。預設只產生報告（dry-run）。
+# --delete 時也先收回過期的直接上傳保留（upload_reservations），引用歸零的檔案一起刪除。
+#   python r2_gc.py                 dry-run 報告
+#   python r2_gc.py --delete        真的刪除
+#   python r2_gc.py --grace-hours 48 --folder files
+GC_FOLDERS = ["purification_zones", "green_walls", "greenifications", "tree_intros", "results", "files"]
+
+# 每個查詢回傳一欄 URL；新增存放 R2 URL 的欄位時要加在這裡
+REFERENCE_QUERIES = [
+    "SELECT jsonb_array_elements_text(image_urls) FROM purification_zones WHERE jsonb_typeof(image_urls) = 'array'",
+    "SELECT jsonb_array_elements_text(image_urls) FROM green_walls WHERE jsonb_typeof(image_urls) = 'array'",
+    "SELECT jsonb_array_elements_text(image_urls) FROM greenifications WHERE jsonb_typeof(image_urls) = 'array'",
+    "SELECT image_url FROM tree_intros WHERE image_url IS NOT NULL",
+    "SELECT image_url FROM result WHERE image_url IS NOT NULL",
+    "SELECT file_url FROM files WHERE file_url IS NOT NULL",
+] + [
+    # image_variants（migration 6）裡的 webp / jpeg URL
+    f"""SELECT jsonb_path_query(image_variants, '$.*.*.* ? (@.type() == "string")') #>> '{{}}'
+        FROM {table} WHERE image_variants IS NOT NULL"""
+    for table in ("purification_zones", "green_walls", "greenifications", "tree_intros", "result")
+]
+
+
+def _digest(key):
+    # 只存 16 bytes 雜湊，引用數量很大時記憶體也不會跟著 URL 長度膨脹
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def referenced_keys(conn, grace_hours=24):
+    digests = set()
+    for query in REFERENCE_QUERIES:
+        # server-side cursor，逐批讀取
+        with conn.cursor(name="r2_gc_refs") as cursor:
+            cursor.itersize = 5000
+            cursor.execute(query)
+            for (url,) in cursor:
+                key = r2_key_from_url(url)
+                if key:
+                    digests.add(_digest(key))
+        conn.rollback()
+
+    # 去重命中的 blob 可能還在等 DB commit，寬限期內用過的一律視為引用中；
+    # 直接上傳後還在等表單存檔（保留未過期）的也是
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT key FROM blobs WHERE last_used_at > now() - make_interval(secs => %s);",
+            (grace_hours * 3600,),
+        )
+        digests.update(_digest(key) for (key,) in cursor.fetchall())
+        cursor.execute("SELECT key FROM upload_reservations WHERE expires_at > now();")
+        digests.update(_digest(key) for (key,) in cursor.fetchall())
+    conn.rollback()
+    return digests
+
+
+def claim_orphans(conn, keys, grace_hours=24):
+    # 引用是掃描前拍的快照；刪 R2 之前逐批在 DB 再確認一次。掃描期間被去重命中（last_used_at 更新）
+    # 或被直接上傳保留的不刪。blobs 紀錄先刪掉並 commit，之後的 acquire 就不會再指到這些 key。
+    # 回傳可以從 R2 刪除的 key（含不在 blobs 裡的舊檔案）
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            DELETE FROM blobs b
+             WHERE key = ANY(%s)
+               AND last_used_at < now() - make_interval(secs => %s)
+               AND NOT EXISTS (SELECT 1 FROM upload_reservations r WHERE r.key = b.key);
+        """, (list(keys), grace_hours * 3600))
+        cursor.execute("SELECT key FROM blobs WHERE key = ANY(%s);", (list(keys),))
+        in_use = {key for (key,) in cursor.fetchall()}
+    conn.commit()
+    return [key for key in keys if key not in in_use]
+
+
+def list_objects(folder):
+    paginator = r2_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=os.getenv("R2_BUCKET"), Prefix=f"{folder}/"):
+        for obj in page.get("Contents", []):
+            yield obj
+
+
+def expired_reservations(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM upload_reservations WHERE expires_at <= now();")
+        count = cursor.fetchone()[0]
+    conn.rollback()
+    return count
+
+
+def collect_garbage(conn, folders=None, grace_hours=24, delete=False, sample_size=20):
+    reservations = {"expired": expired_reservations(conn), "deleted": 0, "errors": 0}
+    if delete:
+        released, result = release_expired_reservations(conn)
+        reservations.update(expired=released, deleted=len(result["deleted"]), errors=len(result["errors"]))
+
+    referenced = referenced_keys(conn, grace_hours)
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    report = {"dry_run": not delete, "grace_hours": grace_hours, "referenced": len(referenced),
+              "reservations": reservations, "folders": {}}
+
+    for folder in folders or GC_FOLDERS:
+        stats = {"scanned": 0, "orphans": 0, "orphan_bytes": 0, "too_recent": 0, "reused": 0,
+                 "deleted": 0, "errors": 0, "sample": []}
+        pending = []
+
+        def flush():
+            keys = claim_orphans(conn, pending, grace_hours)
+            stats["reused"] += len(pending) - len(keys)
+            result = r2_delete_keys(keys)
+            stats["deleted"] += len(result["deleted"])
+            stats["errors"] += len(result["errors"])
+            pending.clear()
+
+        for obj in list_objects(folder):
+            stats["scanned"] += 1
+            key = obj["Key"]
+            if _digest(key) in referenced:
+                continue
+            # 寬限期內的可能是剛上傳、DB 還沒 commit 的檔案
+            if obj["LastModified"] > cutoff:
+                stats["too_recent"] += 1
+                continue
+
+            stats["orphans"] += 1
+            stats["orphan_bytes"] += obj.get("Size", 0)
+            if len(stats["sample"]) < sample_size:
+                stats["sample"].append(key)
+            if delete:
+                pending.append(key)
+                if len(pending) >= 1000:
+                    flush()
+
+        if delete and pending:
+            flush()
+        report["folders"][folder] = stats
+    return report
+
+
+def main():
+    from dotenv import load_dotenv
+    from db_init import get_db_connection
+
+    parser = argparse.ArgumentParser(description="清理 R2 中沒有被 DB 引用的檔案")
+    parser.add_argument("--delete", action="store_true", help="實際刪除（預設只列報告）")
+    parser.add_argument("--grace-hours", type=float, default=24)
+    parser.add_argument("--folder", action="append", choices=GC_FOLDERS)
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = get_db_connection()
+    try:
+        report = collect_garbage(conn, args.folder, args.grace_hours, args.delete)
+    finally:
+        conn.close()
+
+    print(f"🧾 R2 GC {'dry-run' if report['dry_run'] else 'delete'}（引用中的檔案 {report['referenced']} 個）")
+    reservations = report["reservations"]
+    print(f"  過期的直接上傳保留 {reservations['expired']}，已刪除 {reservations['deleted']}，失敗 {reservations['errors']}")
+    for folder, stats in report["folders"].items():
+        print(f"  {folder}: 掃描 {stats['scanned']}，孤兒 {stats['orphans']}"
+              f"（{stats['orphan_bytes'] / 1024 / 1024:.1f} MB），寬限期內 {stats['too_recent']}，"
+              f"掃描期間又被引用 {stats['reused']}，已刪除 {stats['deleted']}，失敗 {stats['errors']}")
+        for key in stats["sample"]:
+            print(f"    - {key}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,271 @@
 import os
+import random
+import threading
+import time
 import uuid
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
-def r2_client():
-    return boto3.client(
+# 每個行程共用一個 client（client 本身 thread-safe，內含 urllib3 連線池）。
+# gunicorn fork 之後 pid 變了就重建，不沿用父行程的 socket。
+#   R2_MAX_POOL_CONNECTIONS / R2_MAX_ATTEMPTS / R2_CONNECT_TIMEOUT / R2_READ_TIMEOUT
+_client = None
+_client_pid = None
+_client_created_at = None
+_client_lock = threading.Lock()
+
+
+def _build_client():
+    config = Config(
+        max_pool_connections=int(os.getenv("R2_MAX_POOL_CONNECTIONS", "20")),
+        tcp_keepalive=True,
+        connect_timeout=float(os.getenv("R2_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.getenv("R2_READ_TIMEOUT", "60")),
+        retries={"mode": "standard", "max_attempts": int(os.getenv("R2_MAX_ATTEMPTS", "3"))},
+    )
+    # 自己的 Session：boto3 預設 session 在多 thread 下建立 client 不安全
+    session = boto3.session.Session()
+    return session.client(
         's3',
         endpoint_url=os.getenv('R2_ENDPOINT'),
         aws_access_key_id=os.getenv('R2_ACCESS_KEY'),
         aws_secret_access_key=os.getenv('R2_SECRET_KEY'),
-        region_name='auto'
+        region_name='auto',
+        config=config,
     )
 
-def r2_upload_file(file, folder="articles"):
+
+def r2_client():
+    global _client, _client_pid, _client_created_at
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = _build_client()
+            _client_pid = pid
+            _client_created_at = time.time()
+        return _client
+
+
+def r2_pool_stats():
+    stats = {"pid": _client_pid, "created_at": _client_created_at, "pools": []}
+    if _client is None or _client_pid != os.getpid():
+        return stats
+    stats["max_pool_connections"] = _client.meta.config.max_pool_connections
     try:
-        filename = f"article_{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-        key = f"{folder}/{filename}" if folder else filename
-        r2_client().upload_fileobj(
+        # botocore 沒有公開 API，讀 urllib3 PoolManager 的狀態
+        manager = _client._endpoint.http_session._manager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            stats["pools"].append({
+                "host": pool.host,
+                "connections_created": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool else 0,
+            })
+    except AttributeError:
+        pass
+    return stats
+
+def r2_public_url(key):
+    return f"{os.getenv('R2_PUBLIC_URL_BASE').rstrip('/')}/{key}"
+
+def r2_new_key(folder, filename):
+    filename = f"article_{uuid.uuid4().hex}_{secure_filename(filename)}"
+    return f"{folder}/{filename}" if folder else filename
+
+def r2_upload_file(file, folder="articles", client=None):
+    try:
+        key = r2_new_key(folder, file.filename)
+        (client or r2_client()).upload_fileobj(
             file,
             os.getenv("R2_BUCKET"),
             key,
             ExtraArgs={"ACL": "public-read"}
         )
-        return f"{os.getenv('R2_PUBLIC_URL_BASE').rstrip('/')}/{key}"
+        return r2_public_url(key)
     except ClientError as e:
         print(f"R2 upload error: {e}")
         return None
 
-def r2_delete_file(file_url):
-    if not file_url or not file_url.startswith("http"):
-        return
+def r2_upload_files(files, folder="articles"):
+    # 多張圖平行上傳，回傳的 URL 順序跟 files 一樣；上傳失敗的那張略過
+    files = [f for f in files if f and f.filename]
+    if not files:
+        return []
+
+    client = r2_client()
+    workers = min(len(files), int(os.getenv("R2_UPLOAD_CONCURRENCY", "4")))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        urls = list(pool.map(lambda f: r2_upload_file(f, folder=folder, client=client), files))
+    return [url for url in urls if url]
+
+
+# ---------------------------- 串流分段上傳 -----------------------------
+# 大檔案邊讀邊傳：每 R2_PART_SIZE_MB 一段，最多 R2_PART_CONCURRENCY 段同時上傳，
+# 記憶體大約 part size × (concurrency + 1)。某一段失敗只重送那一段（R2_PART_RETRIES），
+# 讀取中斷（client 斷線）或超過 max_bytes 就 abort，不留下未完成的 multipart upload。
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 規定除了最後一段，每段至少 5 MB
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _read_part(read, part_size):
+    chunks = []
+    remaining = part_size
+    while remaining > 0:
+        chunk = read(min(remaining, READ_CHUNK_SIZE))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _upload_part(s3, bucket, key, upload_id, number, body, slots):
     try:
-        public_base = os.getenv("R2_PUBLIC_URL_BASE").rstrip("/")
-        key = file_url.replace(public_base + "/", "")
-        s3 = r2_client()
-        s3.delete_object(Bucket=os.getenv("R2_BUCKET"), Key=key)
+        retries = int(os.getenv("R2_PART_RETRIES", "3"))
+        for attempt in range(retries + 1):
+            try:
+                response = s3.upload_part(
+                    Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body,
+                )
+                return {"PartNumber": number, "ETag": response["ETag"]}
+            except ClientError as e:
+                if attempt == retries:
+                    raise
+                print(f"[R2 part retry] {key} part {number}: {e}")
+                time.sleep(min(2 ** attempt, 10))
+    finally:
+        slots.release()
+
+
+def r2_stream_upload(read, key, content_type=None, max_bytes=None, on_chunk=None):
+    # read(n) 回傳 bytes，讀完回 b""；回傳上傳的總 bytes
+    part_size = max(MIN_PART_SIZE, int(float(os.getenv("R2_PART_SIZE_MB", "5")) * 1024 * 1024))
+    concurrency = int(os.getenv("R2_PART_CONCURRENCY", "3"))
+    bucket = os.getenv("R2_BUCKET")
+    s3 = r2_client()
+
+    extra = {"ContentType": content_type} if content_type else {}
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **extra)["UploadId"]
+    slots = threading.BoundedSemaphore(concurrency)
+    futures = []
+    total = 0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                # 先拿到空位才讀下一段，記憶體裡最多 concurrency 段
+                slots.acquire()
+                body = _read_part(read, part_size)
+                total += len(body)
+                if max_bytes is not None and total > max_bytes:
+                    slots.release()
+                    raise UploadTooLarge(f"超過上限 {max_bytes} bytes")
+                if not body and futures:
+                    slots.release()
+                    break
+                if on_chunk:
+                    on_chunk(body)
+                futures.append(pool.submit(_upload_part, s3, bucket, key, upload_id, len(futures) + 1, body, slots))
+                for future in futures:
+                    if future.done() and future.exception():
+                        raise future.exception()
+                if len(body) < part_size:
+                    break
+            parts = [future.result() for future in futures]
+
+        s3.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts},
+        )
+        return total
+    except BaseException:
+        try:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except ClientError as e:
+            print(f"[R2 abort error] {key}: {e}")
+        raise
+
+
+def r2_key_from_url(file_url):
+    if not file_url or not file_url.startswith("http"):
+        return None
+    public_base = os.getenv("R2_PUBLIC_URL_BASE").rstrip("/")
+    return file_url.replace(public_base + "/", "")
+
+
+DELETE_BATCH_SIZE = 1000
+
+
+def r2_delete_keys(keys):
+    # S3 DeleteObjects 一次最多 1000 個 key；回傳每個 key 的結果
+    result = {"deleted": [], "errors": []}
+    keys = list(dict.fromkeys(k for k in keys if k))
+    if not keys:
+        return result
+
+    bucket = os.getenv("R2_BUCKET")
+    s3 = r2_client()
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        try:
+            response = s3.delete_objects(
+                Bucket=bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": False},
+            )
+        except ClientError as e:
+            print(f"[R2 delete error] {e}")
+            result["errors"] += [{"key": key, "code": e.response["Error"].get("Code"), "message": str(e)} for key in batch]
+            continue
+
+        result["deleted"] += [item["Key"] for item in response.get("Deleted", [])]
+        for item in response.get("Errors", []):
+            print(f"[R2 delete error] {item.get('Key')}: {item.get('Code')} {item.get('Message')}")
+            result["errors"].append({"key": item.get("Key"), "code": item.get("Code"), "message": item.get("Message")})
+
+    if result["deleted"]:
+        print(f"[R2 delete success] {len(result['deleted'])} objects deleted")
+        _schedule_verification(result["deleted"])
+    return result
+
+
+def r2_delete_files(file_urls):
+    return r2_delete_keys(r2_key_from_url(url) for url in file_urls)
+
+
+def r2_delete_file(file_url):
+    return r2_delete_files([file_url])
+
+
+# ---------------------------- 刪除抽樣檢查 -----------------------------
+# R2_DELETE_VERIFY_RATE（0~1，預設 0）比例的已刪除 key 在背景 HEAD 一次，
+# 仍然存在就印警告；不影響 request 回應時間。
+
+def _verify_deleted(keys):
+    bucket = os.getenv("R2_BUCKET")
+    s3 = r2_client()
+    for key in keys:
         try:
-            s3.head_object(Bucket=os.getenv("R2_BUCKET"), Key=key)
+            s3.head_object(Bucket=bucket, Key=key)
             print(f"[R2 delete warning] Object still exists: {key}")
         except ClientError as e:
-            if e.response['Error']['Code'] == '404':
-                print(f"[R2 delete success] Object deleted: {key}")
-            else:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
                 print(f"[R2 delete head error] {e}")
-    except ClientError as e:
-        print(f"[R2 delete error] {e}")
+
+
+def _schedule_verification(keys):
+    rate = float(os.getenv("R2_DELETE_VERIFY_RATE", "0"))
+    if rate <= 0:
+        return
+    sample = [key for key in keys if random.random() < rate]
+    if sample:
+        threading.Thread(target=_verify_deleted, args=(sample,), daemon=True).start()
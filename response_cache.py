@@ -0,0 +1,196 @@
+import json
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+import psycopg2
+from flask import request, has_app_context, make_response
+
+from db_pool import build_dsn, db_connection, get_db
+
+# 公開 GET API 的回應快取（每個 gunicorn worker 各自一份）
+#   RESPONSE_CACHE_ENABLED=0 關閉
+#   RESPONSE_CACHE_TTL：預設存活秒數
+#   RESPONSE_CACHE_MAX_ENTRIES：LRU 上限
+# 寫入時 invalidate(tag) 清掉本機快取，並用 Postgres NOTIFY 通知其他 worker；
+# 其他 worker 的 listener 斷線時會整個清空，所以舊資料最多活到重新連上或 TTL 到期。
+CHANNEL = "response_cache"
+LISTEN_POLL_SECONDS = 5
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, tags, body, status, headers)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, ttl, tags, body, status, headers):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, frozenset(tags), body, status, headers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tags):
+        tags = set(tags)
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e[1] & tags]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+cache = ResponseCache(int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")))
+_hooks = []
+
+
+def on_invalidate(callback):
+    # 例如 pagination.invalidate_count，跨 worker 通知時也會一起呼叫
+    _hooks.append(callback)
+    return callback
+
+
+def _apply_local(tags):
+    cache.invalidate(tags)
+    for tag in tags:
+        for hook in _hooks:
+            hook(tag)
+
+
+def _clear_local():
+    cache.clear()
+    for hook in _hooks:
+        hook(None)
+
+
+def invalidate(*tags):
+    _apply_local(tags)
+
+    payload = json.dumps({"pid": os.getpid(), "tags": list(tags)})
+    try:
+        if has_app_context():
+            conn = get_db()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_notify(%s, %s);", (CHANNEL, payload))
+            conn.commit()
+        else:
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_notify(%s, %s);", (CHANNEL, payload))
+                conn.commit()
+    except psycopg2.Error as e:
+        print("[⚠️] cache invalidation notify failed:", e)
+
+
+# ---------------------------- 跨 worker LISTEN -----------------------------
+
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _listen_forever():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(build_dsn())
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL};")
+            # 連上之前可能漏掉通知
+            _clear_local()
+
+            while True:
+                if select.select([conn], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        message = json.loads(notify.payload)
+                    except ValueError:
+                        _clear_local()
+                        continue
+                    if message.get("pid") != os.getpid():
+                        _apply_local(message.get("tags", []))
+        except Exception as e:
+            print("[⚠️] cache listener error:", e)
+            _clear_local()
+            time.sleep(LISTEN_POLL_SECONDS)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def ensure_listener():
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        threading.Thread(target=_listen_forever, name="response-cache-listener", daemon=True).start()
+
+
+# ---------------------------- decorator -----------------------------
+
+def cache_key():
+    # 參數值要 escape：?district=A%26year%3D2024 跟 ?district=A&year=2024 不能變成同一個 key
+    return request.path + "?" + urlencode(sorted(request.args.items(multi=True)))
+
+
+def cached(*tags, ttl=None):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if os.getenv("RESPONSE_CACHE_ENABLED", "1") == "0":
+                return f(*args, **kwargs)
+            ensure_listener()
+
+            key = cache_key()
+            entry = cache.get(key)
+            if entry is not None:
+                _, _, body, status, headers = entry
+                return make_response(body, status, headers)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                cache.set(
+                    key,
+                    ttl if ttl is not None else float(os.getenv("RESPONSE_CACHE_TTL", "60")),
+                    tags,
+                    response.get_data(),
+                    response.status_code,
+                    {"Content-Type": response.headers.get("Content-Type")},
+                )
+            return response
+        return decorated_function
+    return decorator
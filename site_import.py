@@ -0,0 +1,310 @@
+import argparse
+import csv
+import datetime
+import io
+import math
+import os
+import re
+import tempfile
+
+from export import SITE_COLUMNS
+from site_stats import rebuild_table
+
+try:
+    import openpyxl
+except ImportError:  # 只有匯入 .xlsx 才需要
+    openpyxl = None
+
+# 三張基地表的批次匯入（每年一批的試算表）：
+#   1. 逐列驗證 CSV / XLSX，錯誤記下列號，不中斷
+#   2. 通過的列寫成 CSV，COPY ... FROM STDIN 進暫存表（ON COMMIT DROP）
+#   3. 同一個 transaction 內以 (serial, year) 合併：已存在的更新、沒有的新增
+#      只更新檔案裡有的欄位，只填部分欄位的表也可以匯入，不會清掉其他欄位
+# 欄名可用英文欄位名或匯出檔（export.py）的中文欄名，匯出的 CSV 改完可以直接匯回。
+#   python site_import.py green_walls 113年綠牆.xlsx            dry-run（只驗證、算筆數）
+#   python site_import.py green_walls 113年綠牆.xlsx --commit   實際寫入
+IMPORT_TABLES = ("purification_zones", "green_walls", "greenifications")
+
+TEXT_COLUMNS = ("serial", "year", "district", "type", "project_name", "maintain_unit",
+                "adopt_unit", "subsidy_source", "gps", "annotation")
+FLOAT_COLUMNS = ("area", "length")
+DATE_COLUMNS = ("maintain_start_date", "maintain_end_date")
+IMPORT_COLUMNS = [column for column, _ in SITE_COLUMNS
+                  if column in TEXT_COLUMNS + FLOAT_COLUMNS + DATE_COLUMNS]
+
+# 跟 db_init 的 NOT NULL 一致
+REQUIRED = {
+    "purification_zones": ("serial", "year", "district", "type", "project_name"),
+    "green_walls": ("serial", "year", "district", "type", "project_name"),
+    "greenifications": ("serial", "year", "district", "type", "adopt_unit"),
+}
+
+HEADER_ALIASES = {}
+for _column, _label in SITE_COLUMNS:
+    if _column in IMPORT_COLUMNS:
+        HEADER_ALIASES[_column] = _column
+        HEADER_ALIASES[_label] = _column
+
+DATE_PATTERN = re.compile(r"^(\d{2,4})[-/.](\d{1,2})[-/.](\d{1,2})$")
+
+
+class SiteImportError(ValueError):
+    pass
+
+
+# ---------------------------- 讀檔 -----------------------------
+
+def read_csv(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.reader(text)
+    finally:
+        text.detach()
+
+
+def read_xlsx(stream):
+    if openpyxl is None:
+        raise SiteImportError("匯入 .xlsx 需要安裝 openpyxl")
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_rows(stream, filename="", fmt=None):
+    fmt = (fmt or os.path.splitext(filename or "")[1].lstrip(".")).lower()
+    if fmt == "csv":
+        return read_csv(stream)
+    if fmt == "xlsx":
+        return read_xlsx(stream)
+    raise SiteImportError("只支援 .csv 或 .xlsx")
+
+
+# ---------------------------- 驗證 -----------------------------
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Excel 把序號 / 年度存成數字
+    value = str(value).strip()
+    return value or None
+
+
+def _float(value):
+    if value is None:
+        return None
+    if not isinstance(value, (int, float)):
+        value = str(value).strip().replace(",", "")
+        if not value:
+            return None
+    value = float(value)
+    # float() 接受 nan / inf，寫進 area / length 會讓 site_stats 的合計壞掉
+    if not math.isfinite(value):
+        raise ValueError
+    return value
+
+
+def _date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if value is None or isinstance(value, datetime.date):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    match = DATE_PATTERN.match(value)
+    if not match:
+        raise ValueError
+    year, month, day = (int(part) for part in match.groups())
+    if year < 1000:
+        year += 1911  # 民國年
+    return datetime.date(year, month, day)
+
+
+def map_header(header):
+    columns = []
+    ignored = []
+    for cell in header:
+        name = _text(cell)
+        column = HEADER_ALIASES.get(name) if name else None
+        if column and column in columns:
+            raise SiteImportError(f"欄位重複：{name}")
+        if name and column is None:
+            ignored.append(name)
+        columns.append(column)
+    return columns, ignored
+
+
+def validate_row(table, columns, cells):
+    record = dict.fromkeys(IMPORT_COLUMNS)
+    errors = []
+    for column, value in zip(columns, cells):
+        if column is None:
+            continue
+        try:
+            if column in FLOAT_COLUMNS:
+                record[column] = _float(value)
+            elif column in DATE_COLUMNS:
+                record[column] = _date(value)
+            else:
+                record[column] = _text(value)
+        except ValueError:
+            errors.append(f"{column} 格式錯誤：{value}")
+
+    for column in REQUIRED[table]:
+        if record[column] is None and not any(e.startswith(f"{column} ") for e in errors):
+            errors.append(f"{column} 必填")
+    for column in FLOAT_COLUMNS:
+        if record[column] is not None and record[column] < 0:
+            errors.append(f"{column} 不可為負數")
+    start, end = record["maintain_start_date"], record["maintain_end_date"]
+    if start and end and start > end:
+        errors.append("maintain_start_date 晚於 maintain_end_date")
+    return record, errors
+
+
+# ---------------------------- 匯入 -----------------------------
+
+def import_sites(conn, table, rows, commit=True):
+    # rows：第一列是表頭的 cell list。回傳逐列錯誤報告；commit=False 只驗證並回報會新增 / 更新幾筆
+    if table not in IMPORT_TABLES:
+        raise SiteImportError(f"不支援匯入：{table}")
+
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        raise SiteImportError("檔案是空的")
+    columns, ignored = map_header(header)
+    missing = [column for column in REQUIRED[table] if column not in columns]
+    if missing:
+        raise SiteImportError("缺少必要欄位：" + "、".join(missing))
+
+    report = {
+        "table": table,
+        "committed": False,
+        "rows": 0,
+        "valid": 0,
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "ignored_columns": ignored,
+        "errors": [],
+    }
+    seen = {}
+
+    # 通過驗證的列先寫進暫存檔，大檔也不會整份留在記憶體
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode="w+", newline="", encoding="utf-8") as buffer:
+        writer = csv.writer(buffer)
+        for line, cells in enumerate(rows, 2):
+            if not any(_text(cell) for cell in cells):
+                continue
+            report["rows"] += 1
+            record, errors = validate_row(table, columns, cells)
+            key = (record["serial"], record["year"])
+            if not errors and key in seen:
+                errors.append(f"serial + year 與第 {seen[key]} 列重複")
+            if errors:
+                report["errors"].append({"line": line, "serial": record["serial"], "year": record["year"], "errors": errors})
+                continue
+            seen[key] = line
+            report["valid"] += 1
+            writer.writerow([line] + [record[column] for column in IMPORT_COLUMNS])
+
+        if not report["valid"]:
+            return report
+        buffer.seek(0)
+        _merge(conn, table, buffer, report, [column for column in IMPORT_COLUMNS if column in columns])
+
+    if commit:
+        conn.commit()
+        report["committed"] = True
+    else:
+        conn.rollback()
+    return report
+
+
+def _merge(conn, table, buffer, report, present):
+    # present：檔案裡真的有的欄位。已存在的列只更新這些，表頭沒有的欄位（暫存表裡是 NULL）不能蓋掉原本的值
+    column_list = ", ".join(IMPORT_COLUMNS)
+    updates = [column for column in present if column not in ("serial", "year")]
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE site_import_stage (
+                    line INT NOT NULL,
+                    serial TEXT, year TEXT, district TEXT, type TEXT, project_name TEXT,
+                    maintain_unit TEXT, adopt_unit TEXT, area FLOAT, length FLOAT,
+                    subsidy_source TEXT, maintain_start_date DATE, maintain_end_date DATE,
+                    gps TEXT, annotation TEXT
+                ) ON COMMIT DROP;
+            """)
+            cur.copy_expert(f"COPY site_import_stage (line, {column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cur.execute("ANALYZE site_import_stage;")
+
+            # 擋住同時間的新增 / 修改，UPDATE + INSERT 之間不會有人插進同一個 (serial, year)；讀取不受影響
+            cur.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE;")
+            # 逐列的 site_stats trigger 先停掉，合併完整張表重算一次（migration 8）
+            cur.execute("SET LOCAL site_stats.deferred = 'on';")
+            # 舊資料可能有好幾列同一個 (serial, year)，以匯入檔的列數計算
+            report["updated"] = 0
+            if updates:
+                cur.execute(f"""
+                    WITH changed AS (
+                        UPDATE {table} t
+                           SET {", ".join(f"{column} = s.{column}" for column in updates)}
+                          FROM site_import_stage s
+                         WHERE t.serial = s.serial AND t.year = s.year
+                           AND ({", ".join(f"t.{column}" for column in updates)})
+                               IS DISTINCT FROM ({", ".join(f"s.{column}" for column in updates)})
+                        RETURNING s.line
+                    )
+                    SELECT COUNT(DISTINCT line) FROM changed;
+                """)
+                report["updated"] = cur.fetchone()[0]
+            cur.execute(f"""
+                INSERT INTO {table} ({column_list})
+                SELECT {column_list} FROM site_import_stage s
+                 WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.serial = s.serial AND t.year = s.year)
+                 ORDER BY s.line;
+            """)
+            report["inserted"] = cur.rowcount
+            if report["inserted"] or report["updated"]:
+                rebuild_table(cur, table)
+            cur.execute("SET LOCAL site_stats.deferred = 'off';")
+            report["unchanged"] = report["valid"] - report["updated"] - report["inserted"]
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main():
+    from dotenv import load_dotenv
+    from db_pool import db_connection
+    from response_cache import invalidate
+
+    parser = argparse.ArgumentParser(description="批次匯入基地資料（CSV / XLSX），以 serial + year 合併")
+    parser.add_argument("table", choices=IMPORT_TABLES)
+    parser.add_argument("path")
+    parser.add_argument("--commit", action="store_true", help="實際寫入（預設只驗證）")
+    parser.add_argument("--format", choices=("csv", "xlsx"))
+    args = parser.parse_args()
+
+    load_dotenv()
+    with open(args.path, "rb") as stream, db_connection() as conn:
+        report = import_sites(conn, args.table, read_rows(stream, args.path, args.format), commit=args.commit)
+    if report["committed"]:
+        invalidate(args.table)
+
+    print(f"🧾 {args.table} {'已匯入' if report['committed'] else 'dry-run'}：{report['rows']} 列，"
+          f"新增 {report['inserted']}，更新 {report['updated']}，未變更 {report['unchanged']}，"
+          f"錯誤 {len(report['errors'])}")
+    if report["ignored_columns"]:
+        print("  忽略的欄位：" + "、".join(report["ignored_columns"]))
+    for error in report["errors"]:
+        print(f"  第 {error['line']} 列（{error['serial'] or '-'}）：" + "；".join(error["errors"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import math
+import os
+
+from migrations import SITE_TABLES
+from site_search import SearchError, build_filters, parse_categories
+
+# 地圖用的 GeoJSON：三類基地的座標（migration 10 由 gps 解析出 lat / lon），
+# 只回傳目前畫面範圍（bbox）內的點，properties 只放 popup 需要的欄位。
+#   GET /api/sites/geojson?bbox=120.6,23.8,120.8,24.0&category=green_walls&year=2024&district=南投市
+#   bbox = 西,南,東,北（經緯度，跟 Leaflet map.getBounds().toBBoxString() 一樣）
+# 其他篩選參數跟 /api/sites/search 相同。
+#   GEOJSON_MAX_FEATURES：單次最多回傳幾個點（預設 5000），超過時 truncated = true
+#   python site_map.py check   列出 gps 有填但解析不出座標的資料
+#
+# 縮小的地圖改用格網聚合（/api/sites/clusters?zoom=&bbox=）：依 zoom 決定格子大小，
+# SQL 裡 GROUP BY 格子，每格回傳中心（平均座標）、筆數、面積 / 長度合計與各類別筆數。
+# 格子對齊絕對經緯度，平移地圖時同一群不會跳動。只有一筆的格子附上 site（category:id）。
+# 快取跟 ETag 掛在三張基地表上，任何新增 / 修改 / 刪除都會讓結果失效。
+#   CLUSTER_CELL_PX：格子約幾個像素寬（預設 60）
+PROPERTIES = ("id", "serial", "year", "district", "type", "project_name")
+MAX_ZOOM = 22
+
+
+def parse_bbox(value):
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(part) for part in value.split(","))
+    except ValueError:
+        raise SearchError("bbox 需為 西,南,東,北 四個數字")
+    if not all(math.isfinite(v) for v in (west, south, east, north)):
+        raise SearchError("bbox 需為 西,南,東,北 四個數字")
+    if west > east or south > north:
+        raise SearchError("bbox 範圍錯誤")
+    return west, south, east, north
+
+
+def located_filters(args):
+    # 共用篩選 + 有座標 + bbox（point(lon, lat) 的 GiST index）
+    where_sql, params = build_filters(args)
+    where_sql += " AND lat IS NOT NULL"
+    bbox = parse_bbox(args.get("bbox"))
+    if bbox:
+        where_sql += " AND point(lon, lat) <@ box(point(%s, %s), point(%s, %s))"
+        params += list(bbox)
+    return where_sql, params
+
+
+def site_features(cursor, args):
+    categories = parse_categories(args)
+    where_sql, params = located_filters(args)
+    max_features = int(os.getenv("GEOJSON_MAX_FEATURES", "5000"))
+
+    columns = ", ".join(PROPERTIES)
+    cursor.execute(" UNION ALL ".join(
+        f"(SELECT '{table}' AS category, {columns}, lat, lon FROM {table} WHERE {where_sql})"
+        for table in categories
+    ) + " LIMIT %s;", params * len(categories) + [max_features + 1])
+    rows = cursor.fetchall()
+
+    truncated = len(rows) > max_features
+    features = []
+    for row in rows[:max_features]:
+        properties = {name: row[name] for name in PROPERTIES}
+        properties["category"] = row["category"]
+        features.append({
+            "type": "Feature",
+            "id": f"{row['category']}:{row['id']}",
+            "geometry": {"type": "Point", "coordinates": [round(row["lon"], 6), round(row["lat"], 6)]},
+            "properties": properties,
+        })
+    return {"type": "FeatureCollection", "features": features, "truncated": truncated}
+
+
+def cell_size(zoom):
+    # Web Mercator：zoom z 時 256px 的 tile 橫跨 360 / 2^z 度經度
+    return 360 / (2 ** zoom) * float(os.getenv("CLUSTER_CELL_PX", "60")) / 256
+
+
+def site_clusters(cursor, args):
+    try:
+        zoom = int(args.get("zoom", ""))
+    except ValueError:
+        raise SearchError("zoom 需為整數")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise SearchError(f"zoom 需介於 0 ~ {MAX_ZOOM}")
+    categories = parse_categories(args)
+    where_sql, params = located_filters(args)
+    size = cell_size(zoom)
+
+    located = " UNION ALL ".join(
+        f"SELECT '{table}' AS category, id, lat, lon, area, length FROM {table} WHERE {where_sql}"
+        for table in categories
+    )
+    counts = ", ".join(
+        f"COUNT(*) FILTER (WHERE category = '{table}') AS {table}" for table in categories
+    )
+    cursor.execute(f"""
+        SELECT AVG(lat) AS lat, AVG(lon) AS lon, COUNT(*) AS count,
+               COALESCE(SUM(area), 0) AS area, COALESCE(SUM(length), 0) AS length,
+               {counts},
+               CASE WHEN COUNT(*) = 1 THEN MIN(category || ':' || id) END AS site
+        FROM ({located}) s
+        GROUP BY floor(lon / %s), floor(lat / %s);
+    """, params * len(categories) + [size, size])
+
+    features = []
+    for row in cursor.fetchall():
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(row["lon"], 6), round(row["lat"], 6)]},
+            "properties": {
+                "count": row["count"],
+                "area": round(row["area"], 2),
+                "length": round(row["length"], 2),
+                "counts": {table: row[table] for table in categories},
+                "site": row["site"],
+            },
+        })
+    return {"type": "FeatureCollection", "features": features, "zoom": zoom, "cell_size": size}
+
+
+def unparsed(cursor):
+    cursor.execute(" UNION ALL ".join(
+        f"SELECT '{table}', id, serial, gps FROM {table} WHERE btrim(COALESCE(gps, '')) <> '' AND lat IS NULL"
+        for table in SITE_TABLES
+    ) + " ORDER BY 1, 2;")
+    return cursor.fetchall()
+
+
+def main():
+    from dotenv import load_dotenv
+    from db_init import get_db_connection
+
+    parser = argparse.ArgumentParser(description="檢查基地 gps 欄位能否解析成座標")
+    parser.add_argument("command", choices=["check"])
+    parser.parse_args()
+
+    load_dotenv()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            rows = unparsed(cursor)
+    finally:
+        conn.close()
+
+    if not rows:
+        print("[✅] 所有填了 gps 的資料都有座標")
+        return
+    print(f"[⚠️] {len(rows)} 筆 gps 無法解析（格式需為「緯度, 經度」十進位）")
+    for table, row_id, serial, gps in rows:
+        print(f"  {table} #{row_id} {serial}: {gps}")
+
+
+if __name__ == "__main__":
+    main()
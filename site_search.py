@@ -0,0 +1,108 @@
+import datetime
+
+from migrations import SITE_TABLES
+from pagination import parse_limit, parse_page
+
+# basequery.html 的跨表查詢：三張基地表 UNION ALL，篩選 / 排序 / 分頁都在 SQL 做，
+# 同一個 response 附上各類別的筆數（facets，不受 category 篩選影響，下拉選單顯示用）。
+#   GET /api/sites/search?category=green_walls&year=2024&district=南投市&q=國小
+#       &type=&maintain_unit=&adopt_unit=&maintain_from=2024-01-01&maintain_to=2024-12-31
+#       &sort=newest|year|serial&page=1&limit=50
+# 只取列表會顯示的欄位；詳細資料仍走各表的 /api/<table>/<id>
+SEARCH_COLUMNS = "id, serial, year, district, type, project_name, maintain_unit, created_at"
+EXACT_FILTERS = ("year", "district", "type", "maintain_unit", "adopt_unit")
+SORTS = {
+    "newest": "created_at DESC, id DESC, category",
+    "year": "year DESC, serial, category, id",
+    "serial": "serial, year DESC, category, id",
+}
+
+
+class SearchError(ValueError):
+    pass
+
+
+def _date_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise SearchError(f"{name} 需為 YYYY-MM-DD")
+
+
+def parse_categories(args):
+    values = [value for raw in args.getlist("category") for value in raw.split(",") if value]
+    unknown = [value for value in values if value not in SITE_TABLES]
+    if unknown:
+        raise SearchError("category 只能是 " + "、".join(SITE_TABLES))
+    return values or list(SITE_TABLES)
+
+
+def build_filters(args):
+    # 每張表共用同一組 WHERE；使用者輸入只走 params
+    where_sql = "TRUE"
+    params = []
+    for name in EXACT_FILTERS:
+        value = (args.get(name) or "").strip()
+        if value:
+            where_sql += f" AND {name} = %s"
+            params.append(value)
+
+    keyword = (args.get("q") or "").strip()
+    if keyword:
+        pattern = "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where_sql += " AND (project_name ILIKE %s OR serial ILIKE %s)"
+        params += [pattern, pattern]
+
+    # 維護期間跟 [maintain_from, maintain_to] 有重疊就算
+    maintain_from = _date_arg(args, "maintain_from")
+    maintain_to = _date_arg(args, "maintain_to")
+    if maintain_from and maintain_to and maintain_from > maintain_to:
+        raise SearchError("maintain_from 不可晚於 maintain_to")
+    if maintain_from:
+        where_sql += " AND maintain_end_date >= %s"
+        params.append(maintain_from)
+    if maintain_to:
+        where_sql += " AND maintain_start_date <= %s"
+        params.append(maintain_to)
+    return where_sql, params
+
+
+def search_sites(cursor, args):
+    categories = parse_categories(args)
+    sort = args.get("sort") or "newest"
+    if sort not in SORTS:
+        raise SearchError("sort 只能是 " + "、".join(SORTS))
+    page = parse_page(args)
+    limit = parse_limit(args)
+    where_sql, params = build_filters(args)
+
+    # facets：三張表都算，一次 round trip
+    cursor.execute(" UNION ALL ".join(
+        f"SELECT '{table}' AS category, COUNT(*) AS count FROM {table} WHERE {where_sql}"
+        for table in SITE_TABLES
+    ) + ";", params * len(SITE_TABLES))
+    facets = {row["category"]: row["count"] for row in cursor.fetchall()}
+    total = sum(facets[table] for table in categories)
+
+    # 篩選條件推進每張表（走 year/district 等 index），合併後 top-N 排序只取這一頁
+    cursor.execute(f"""
+        SELECT * FROM (
+            {" UNION ALL ".join(
+                f"SELECT '{table}' AS category, {SEARCH_COLUMNS} FROM {table} WHERE {where_sql}"
+                for table in categories
+            )}
+        ) matched
+        ORDER BY {SORTS[sort]}
+        LIMIT %s OFFSET %s;
+    """, params * len(categories) + [limit, (page - 1) * limit])
+
+    return {
+        "items": cursor.fetchall(),
+        "total": total,
+        "page": page,
+        "pages": max(1, -(-total // limit)),
+        "facets": facets,
+    }
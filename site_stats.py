@@ -0,0 +1,92 @@
+import argparse
+
+from migrations import SITE_TABLES
+
+# site_stats 由 migration 3 的 trigger 增量維護；這裡是從頭重算與對帳用
+#   python site_stats.py check     只比對，不修改
+#   python site_stats.py rebuild   重算後再比對一次
+
+LIVE_AGGREGATE_SQL = " UNION ALL ".join(
+    f"""SELECT '{table}' AS tbl, district, year, type,
+               COUNT(*) AS count,
+               COALESCE(SUM(area), 0) AS area,
+               COALESCE(SUM(length), 0) AS length
+        FROM {table} GROUP BY district, year, type"""
+    for table in SITE_TABLES
+)
+
+
+def rebuild(cursor):
+    # SHARE 鎖擋住重算期間的寫入，避免 trigger 跟重算互相覆蓋
+    cursor.execute(f"LOCK TABLE {', '.join(SITE_TABLES)} IN SHARE MODE;")
+    cursor.execute("DELETE FROM site_stats;")
+    cursor.execute(f"""
+        INSERT INTO site_stats (tbl, district, year, type, count, area, length)
+        {LIVE_AGGREGATE_SQL};
+    """)
+    return cursor.rowcount
+
+
+def rebuild_table(cursor, table):
+    # 只重算一張表；呼叫端要先鎖住該表的寫入（例如批次匯入的 SHARE ROW EXCLUSIVE）
+    cursor.execute("DELETE FROM site_stats WHERE tbl = %s;", (table,))
+    cursor.execute(f"""
+        INSERT INTO site_stats (tbl, district, year, type, count, area, length)
+        SELECT %s, district, year, type, COUNT(*), COALESCE(SUM(area), 0), COALESCE(SUM(length), 0)
+        FROM {table} GROUP BY district, year, type;
+    """, (table,))
+
+
+def diff(cursor, tolerance=0.01):
+    # 面積 / 長度是浮點累加，允許微小誤差
+    cursor.execute(f"""
+        SELECT COALESCE(s.tbl, l.tbl) AS tbl,
+               COALESCE(s.district, l.district) AS district,
+               COALESCE(s.year, l.year) AS year,
+               COALESCE(s.type, l.type) AS type,
+               s.count AS stats_count, l.count AS live_count,
+               s.area AS stats_area, l.area AS live_area,
+               s.length AS stats_length, l.length AS live_length
+        FROM site_stats s
+        FULL OUTER JOIN ({LIVE_AGGREGATE_SQL}) l
+          ON s.tbl = l.tbl AND s.district = l.district AND s.year = l.year AND s.type = l.type
+        WHERE s.tbl IS NULL OR l.tbl IS NULL
+           OR s.count <> l.count
+           OR abs(s.area - l.area) > %s
+           OR abs(s.length - l.length) > %s;
+    """, (tolerance, tolerance))
+    return cursor.fetchall()
+
+
+def main():
+    from dotenv import load_dotenv
+    from db_init import get_db_connection
+
+    parser = argparse.ArgumentParser(description="重算 / 檢查 site_stats 統計表")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if args.command == "rebuild":
+            groups = rebuild(cursor)
+            conn.commit()
+            print(f"[✅] site_stats rebuilt: {groups} groups")
+
+        mismatches = diff(cursor)
+        conn.rollback()
+        if mismatches:
+            print(f"[❌] site_stats 與實際資料不一致：{len(mismatches)} 組")
+            for row in mismatches:
+                print("   ", row)
+            raise SystemExit(1)
+        print("[✅] site_stats 與實際資料一致")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
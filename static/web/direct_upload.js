@@ -0,0 +1,71 @@
+// 直接上傳到 R2：presign → PUT → finalize，檔案內容不經過後端
+// 用法：await moveFilesToR2(formData, "images", "green_walls", "uploaded_images");
+const DIRECT_UPLOAD_HASH_LIMIT = 64 * 1024 * 1024; // 超過就不算 sha256（瀏覽器要整份讀進記憶體）
+
+async function sha256Base64(file) {
+  const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+  return btoa(String.fromCharCode(...new Uint8Array(digest)));
+}
+
+async function directUpload(file, folder) {
+  const headers = {
+    "Content-Type": "application/json",
+    Authorization: `Bearer ${localStorage.getItem("token")}`
+  };
+  const body = {
+    folder,
+    filename: file.name,
+    content_type: file.type || "application/octet-stream",
+    size: file.size
+  };
+  if (file.size <= DIRECT_UPLOAD_HASH_LIMIT && window.crypto && crypto.subtle) {
+    body.sha256 = await sha256Base64(file);
+  }
+
+  let res = await fetch("/api/uploads/presign", { method: "POST", headers, body: JSON.stringify(body) });
+  const ticket = await res.json();
+  if (!res.ok) throw new Error(ticket.error || "presign 失敗");
+  if (ticket.url) return ticket.url; // 相同內容已經在 R2 上
+
+  let put;
+  try {
+    put = await fetch(ticket.upload_url, { method: "PUT", headers: ticket.headers, body: file });
+  } catch (err) {
+    // 連不到 R2（通常是 bucket CORS 沒設定），改由後端串流轉傳
+    return streamUpload(file, folder);
+  }
+  if (!put.ok) throw new Error(`上傳到 R2 失敗：HTTP ${put.status}`);
+
+  res = await fetch("/api/uploads/finalize", {
+    method: "POST",
+    headers,
+    body: JSON.stringify({ upload_token: ticket.upload_token })
+  });
+  const result = await res.json();
+  if (!res.ok) throw new Error(result.error || "finalize 失敗");
+  return result.url;
+}
+
+// 經過後端分段轉傳到 R2（後端記憶體用量固定，不會整份讀進來）
+async function streamUpload(file, folder) {
+  const params = new URLSearchParams({ folder, filename: file.name });
+  const res = await fetch(`/api/uploads/stream?${params}`, {
+    method: "POST",
+    headers: {
+      "Content-Type": file.type || "application/octet-stream",
+      Authorization: `Bearer ${localStorage.getItem("token")}`
+    },
+    body: file
+  });
+  const result = await res.json();
+  if (!res.ok) throw new Error(result.error || "上傳失敗");
+  return result.url;
+}
+
+// 把 formData 裡 field 的檔案換成直接上傳後的 URL（放到 targetField）
+async function moveFilesToR2(formData, field, folder, targetField) {
+  const files = formData.getAll(field).filter(f => f instanceof File && f.size > 0);
+  formData.delete(field);
+  const urls = await Promise.all(files.map(f => directUpload(f, folder)));
+  urls.forEach(url => formData.append(targetField, url));
+}
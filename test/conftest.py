@@ -0,0 +1,23 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+
+# 測試直接 import 專案根目錄的模組
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# test_R2_upload.py 是手動執行的 R2 連線腳本（import 時就會上傳），不是 pytest 測試
+collect_ignore = ["test_R2_upload.py"]
+
+
+@pytest.fixture
+def conn():
+    # 需要真的 Postgres（DATABASE_URL，已跑過 db_init + migrations）的測試；連不上就跳過。結束時 rollback
+    try:
+        conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    except (KeyError, psycopg2.Error) as e:
+        pytest.skip(f"no database: {e}")
+    yield conn
+    conn.rollback()
+    conn.close()
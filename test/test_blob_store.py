@@ -0,0 +1,66 @@
+import hashlib
+import io
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+from blob_store import HashingRequest, HashingSpool, UploadExpiredError, claim_uploads, file_digest
+from r2_utils import r2_public_url
+
+
+def _request(files):
+    builder = EnvironBuilder(method="POST", data={name: (io.BytesIO(body), f"{name}.bin") for name, body in files.items()})
+    try:
+        return HashingRequest(builder.get_environ())
+    finally:
+        builder.close()
+
+
+def test_hashing_request_digest_matches_content():
+    # 超過 werkzeug 500 KB 的記憶體門檻，會寫進暫存檔
+    big = bytes(range(256)) * 4096
+    small = b"hello"
+    request = _request({"big": big, "small": small})
+
+    for name, body in (("big", big), ("small", small)):
+        file = request.files[name]
+        assert isinstance(file.stream, HashingSpool)
+        assert file_digest(file) == (hashlib.sha256(body).digest(), len(body))
+        # 雜湊是解析時算的，檔案內容不受影響
+        assert file.read() == body
+
+
+def test_file_digest_falls_back_to_reading():
+    stream = io.BytesIO(b"x" * 3000000)
+    assert file_digest(stream) == (hashlib.sha256(b"x" * 3000000).digest(), 3000000)
+    assert stream.tell() == 0
+
+
+def _refcount(cursor, key):
+    cursor.execute("SELECT refcount FROM blobs WHERE key = %s;", (key,))
+    return cursor.fetchone()[0]
+
+
+def test_claim_uploads_consumes_reservation_or_adds_reference(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO blobs (key, folder, sha256, size) VALUES ('claim-test/a.jpg', 'claim-test', '\\x01', 1);
+        INSERT INTO upload_reservations (key, expires_at) VALUES ('claim-test/a.jpg', now() + interval '1 hour');
+    """)
+    url = r2_public_url("claim-test/a.jpg")
+
+    claim_uploads(cursor, [url])
+    assert _refcount(cursor, "claim-test/a.jpg") == 1
+    cursor.execute("SELECT COUNT(*) FROM upload_reservations WHERE key = 'claim-test/a.jpg';")
+    assert cursor.fetchone()[0] == 0
+
+    # 同一個檔案用在第二筆資料（或保留已被收回）：重新算一次引用
+    claim_uploads(cursor, [url])
+    assert _refcount(cursor, "claim-test/a.jpg") == 2
+
+
+def test_claim_uploads_rejects_collected_upload(conn):
+    # 保留過期、r2_gc.py 已經刪掉 blobs 紀錄和檔案
+    cursor = conn.cursor()
+    with pytest.raises(UploadExpiredError):
+        claim_uploads(cursor, [r2_public_url("claim-test/gone.jpg")])
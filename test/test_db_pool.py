@@ -0,0 +1,127 @@
+import os
+import time
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, healthy=True):
+        self.closed = 0
+        self.healthy = healthy
+        self.queries = 0
+        self.rollbacks = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def get_transaction_status(self):
+        return self.status
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.conn.queries += 1
+        if not self.conn.healthy:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    # 假的連線工廠：記錄建立過的連線
+    made = []
+
+    def connect(self):
+        made.append(FakeConnection())
+        return made[-1]
+
+    monkeypatch.setattr(ConnectionPool, "_connect", connect)
+    return made
+
+
+def test_checkout_reuses_idle_connection(connections):
+    pool = ConnectionPool(minconn=1, maxconn=2, timeout=1)
+    conn = pool.getconn()
+    assert conn is connections[0]
+    assert pool.stats()["in_use"] == 1
+
+    conn.status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1  # 還回來時把沒結束的 transaction rollback
+    assert pool.getconn() is conn
+    assert len(connections) == 1
+
+
+def test_health_check_replaces_dead_idle_connection(connections, monkeypatch):
+    monkeypatch.setenv("DB_HEALTHCHECK_INTERVAL", "0")
+    pool = ConnectionPool(minconn=1, maxconn=2, timeout=1)
+    dead = connections[0]
+    dead.healthy = False
+
+    conn = pool.getconn()
+    assert conn is not dead
+    assert dead.queries == 1 and dead.closed
+    assert len(connections) == 2
+
+
+def test_recently_used_connection_skips_health_check(connections, monkeypatch):
+    monkeypatch.setenv("DB_HEALTHCHECK_INTERVAL", "30")
+    pool = ConnectionPool(minconn=1, maxconn=1, timeout=1)
+    assert pool.getconn().queries == 0
+
+
+def test_checkout_times_out_when_pool_exhausted(connections):
+    pool = ConnectionPool(minconn=0, maxconn=1, timeout=0.05)
+    pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+
+
+def test_failed_connect_releases_slot(monkeypatch):
+    def connect(self):
+        raise psycopg2.OperationalError("could not connect")
+
+    monkeypatch.setattr(ConnectionPool, "_connect", connect)
+    pool = ConnectionPool(minconn=0, maxconn=1, timeout=0.05)
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+    assert pool.stats()["in_use"] == 0
+
+
+def test_fork_keeps_inherited_pool_alive(connections, monkeypatch):
+    monkeypatch.setattr(db_pool, "_pool", None)
+    monkeypatch.setattr(db_pool, "_inherited_pools", [])
+    parent = db_pool.get_pool()
+    assert db_pool.get_pool() is parent
+
+    # 子行程：pid 不同要重建，父行程的 pool 不能 close 也不能被回收
+    parent_pid = os.getpid()
+    monkeypatch.setattr(db_pool.os, "getpid", lambda: parent_pid + 1)
+    child = db_pool.get_pool()
+    assert child is not parent
+    assert child.pid == parent_pid + 1
+    assert db_pool._inherited_pools == [parent]
+    assert not connections[0].closed
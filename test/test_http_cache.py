@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+from flask import Flask
+
+import http_cache
+from http_cache import conditional
+
+UPDATED_AT = datetime.datetime(2025, 3, 1, 8, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # table_versions 用假的版本號，不連 DB
+    stamps = {"sites": (1, UPDATED_AT, 0)}
+    monkeypatch.setattr(http_cache, "get_stamps", lambda tables: {t: stamps[t] for t in tables if t in stamps})
+
+    app = Flask(__name__)
+    calls = []
+
+    @app.get("/sites")
+    @conditional("sites")
+    def sites():
+        calls.append(1)
+        return {"items": []}
+
+    @app.get("/missing")
+    @conditional("sites")
+    def missing():
+        return {"error": "not found"}, 404
+
+    @app.get("/unversioned")
+    @conditional("other")
+    def unversioned():
+        return {"items": []}
+
+    client = app.test_client()
+    client.stamps = stamps
+    client.calls = calls
+    return client
+
+
+def test_first_request_sets_validators(client):
+    response = client.get("/sites")
+    assert response.status_code == 200
+    assert response.headers["ETag"]
+    assert response.last_modified == UPDATED_AT.replace(microsecond=0)
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_matching_etag_returns_304_without_running_view(client):
+    etag = client.get("/sites").headers["ETag"]
+    response = client.get("/sites", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert len(client.calls) == 1
+
+
+def test_etag_changes_with_table_version_and_query(client):
+    etag = client.get("/sites").headers["ETag"]
+    assert client.get("/sites?year=2024").headers["ETag"] != etag
+
+    client.stamps["sites"] = (2, UPDATED_AT, 0)
+    response = client.get("/sites", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_if_modified_since(client):
+    response = client.get("/sites", headers={"If-Modified-Since": "Sat, 01 Mar 2025 08:30:15 GMT"})
+    assert response.status_code == 304
+    response = client.get("/sites", headers={"If-Modified-Since": "Sat, 01 Mar 2025 08:00:00 GMT"})
+    assert response.status_code == 200
+
+
+def test_errors_and_unversioned_tables_have_no_etag(client):
+    response = client.get("/missing")
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
+
+    response = client.get("/unversioned")
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert response.headers["Cache-Control"] == "no-cache"
@@ -0,0 +1,83 @@
+import io
+
+from PIL import Image
+
+import image_utils
+from image_utils import ORIENTATION_TAG, VARIANT_SIZES, process_image
+
+GPS_IFD = 0x8825
+
+
+def _photo(fmt="JPEG", size=(2400, 1200), orientation=None, gps=True):
+    image = Image.new("RGB", size, (30, 120, 60))
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"
+    if orientation:
+        exif[ORIENTATION_TAG] = orientation
+    if gps:
+        exif[GPS_IFD] = {1: "N", 2: (23.0, 54.0, 12.5), 3: "E", 4: (120.0, 41.0, 3.0)}
+    buf = io.BytesIO()
+    image.save(buf, fmt, exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def _open(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def test_render_variants_drop_exif_and_apply_orientation():
+    variants, _ = process_image(_photo(orientation=6))
+    assert set(variants) == set(VARIANT_SIZES)
+
+    for size, (width, height, bodies) in variants.items():
+        # orientation 6 = 轉 90 度，直的圖
+        assert height > width
+        assert max(width, height) <= VARIANT_SIZES[size]
+        for body in bodies.values():
+            image = _open(body)
+            assert (image.width, image.height) == (width, height)
+            assert not image.getexif()
+            assert "exif" not in image.info
+
+
+def test_process_image_not_an_image():
+    assert process_image(b"%PDF-1.7 not an image") == (None, None)
+
+
+def test_process_image_decodes_once(monkeypatch):
+    opened = []
+    real_open = image_utils.Image.open
+    monkeypatch.setattr(image_utils.Image, "open", lambda fp: opened.append(fp) or real_open(fp))
+    variants, clean = process_image(_photo(orientation=6))
+    assert variants and clean
+    assert len(opened) == 1
+
+
+def test_strip_metadata_jpeg_keeps_pixels_and_drops_gps():
+    _, (body, content_type) = process_image(_photo())
+    assert content_type == "image/jpeg"
+    image = _open(body)
+    assert image.size == (2400, 1200)
+    assert not image.getexif()
+
+
+def test_strip_metadata_rotates_before_dropping_orientation():
+    _, (body, _) = process_image(_photo(orientation=6))
+    image = _open(body)
+    assert image.size == (1200, 2400)
+    assert not image.getexif()
+
+
+def test_strip_metadata_png():
+    _, (body, content_type) = process_image(_photo("PNG", size=(64, 32)))
+    assert content_type == "image/png"
+    assert not _open(body).getexif()
+
+
+def test_strip_metadata_skips_clean_files():
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(buf, "JPEG")
+    variants, clean = process_image(buf.getvalue())
+    assert variants and clean is None
@@ -0,0 +1,72 @@
+import pytest
+from psycopg2.extras import RealDictCursor
+
+import jobs
+from jobs import backoff_seconds, claim, enqueue, finish
+
+
+@pytest.fixture
+def cursor(conn):
+    # 整個測試在同一個 transaction 裡，結束時 rollback，不影響佇列裡原本的工作
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute("DELETE FROM jobs;")
+    yield cursor
+    cursor.close()
+
+
+def _job(cursor, job_id):
+    cursor.execute("SELECT status, attempts, last_error, run_at > now() AS delayed FROM jobs WHERE id = %s;", (job_id,))
+    return cursor.fetchone()
+
+
+def test_claim_due_and_stale_jobs(cursor):
+    due = enqueue(cursor, "test", {"n": 1})
+    later = enqueue(cursor, "test", {"n": 2}, delay_seconds=3600)
+    cursor.execute("""
+        INSERT INTO jobs (kind, payload, status, attempts, locked_at) VALUES
+            ('test', '{}', 'running', 1, now() - interval '1 hour'),
+            ('test', '{}', 'running', 1, now())
+        RETURNING id;
+    """)
+    stale, busy = [row["id"] for row in cursor.fetchall()]
+
+    claimed = {job["id"]: job for job in claim(cursor, 10)}
+    assert set(claimed) == {due, stale}
+    assert claimed[due]["payload"] == {"n": 1}
+    assert claimed[due]["attempts"] == 1
+    assert claimed[stale]["attempts"] == 2
+    assert _job(cursor, due)["status"] == "running"
+    assert _job(cursor, later)["status"] == "pending"
+    assert _job(cursor, busy)["attempts"] == 1
+
+
+def test_claim_respects_batch_size(cursor):
+    for n in range(3):
+        enqueue(cursor, "test", {"n": n})
+    assert len(claim(cursor, 2)) == 2
+    assert len(claim(cursor, 2)) == 1
+
+
+def test_finish_deletes_retries_and_dead_letters(cursor):
+    ok = enqueue(cursor, "test", {})
+    retry = enqueue(cursor, "test", {})
+    dead = enqueue(cursor, "test", {}, max_attempts=1)
+    claimed = claim(cursor, 10)
+
+    finish(cursor, claimed, {retry: "timeout", dead: "boom"})
+
+    assert _job(cursor, ok) is None
+    assert _job(cursor, retry) == {"status": "pending", "attempts": 1, "last_error": "timeout", "delayed": True}
+    assert _job(cursor, dead) == {"status": "dead", "attempts": 1, "last_error": "boom", "delayed": False}
+    # 退避中的工作不會馬上再被領取，dead 的永遠不會
+    assert claim(cursor, 10) == []
+
+
+def test_backoff_grows_exponentially_with_jitter_and_cap(monkeypatch):
+    monkeypatch.setenv("JOB_BACKOFF_BASE", "10")
+    monkeypatch.setenv("JOB_BACKOFF_MAX", "300")
+    monkeypatch.setattr(jobs.random, "uniform", lambda low, high: high)
+    assert [backoff_seconds(n) for n in (1, 2, 3, 6, 20)] == [10, 20, 40, 300, 300]
+
+    monkeypatch.setattr(jobs.random, "uniform", lambda low, high: low)
+    assert backoff_seconds(3) == 20
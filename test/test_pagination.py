@@ -0,0 +1,111 @@
+import base64
+import datetime
+import json
+
+import pytest
+
+import pagination
+from pagination import PaginationError, cached_count, decode_cursor, encode_cursor, invalidate_count, wants_keyset
+
+
+class CountCursor:
+    def __init__(self, total=7):
+        self.total = total
+        self.queries = []
+
+    def execute(self, sql, params):
+        self.queries.append((sql, params))
+
+    def fetchone(self):
+        return {"total": self.total}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pagination.time, "monotonic", lambda: now[0])
+    pagination._count_cache.clear()
+    yield now
+    pagination._count_cache.clear()
+
+
+def _token(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2024, 3, 1, 8, 30, 15, 123456)
+    token = encode_cursor({"created_at": created_at, "id": 42})
+    assert "=" not in token
+    assert decode_cursor(token) == (created_at, 42)
+
+
+@pytest.mark.parametrize("token", [
+    "not base64!",
+    _token(["2024-13-45T00:00:00", 1]),
+    _token(["'; DROP TABLE files; --", 1]),
+    _token(["2024-03-01T08:30:15", "abc"]),
+    _token([None, 1]),
+    _token({"created_at": "2024-03-01"}),
+    _token(42),
+])
+def test_bad_cursor_is_pagination_error(token):
+    with pytest.raises(PaginationError):
+        decode_cursor(token)
+
+
+def test_count_cache_hit_then_expire(clock, monkeypatch):
+    monkeypatch.setenv("COUNT_CACHE_TTL", "60")
+    cursor = CountCursor()
+    assert cached_count(cursor, "files") == 7
+    cursor.total = 8
+    assert cached_count(cursor, "files") == 7
+    assert len(cursor.queries) == 1
+
+    clock[0] += 61
+    assert cached_count(cursor, "files") == 8
+    assert len(cursor.queries) == 2
+
+
+def test_count_cache_drops_expired_entry_on_access(clock, monkeypatch):
+    monkeypatch.setenv("COUNT_CACHE_TTL", "60")
+    cursor = CountCursor()
+    cached_count(cursor, "files")
+
+    def broken(sql, params):
+        raise RuntimeError("db down")
+    cursor.execute = broken
+    clock[0] += 61
+    with pytest.raises(RuntimeError):
+        cached_count(cursor, "files")
+    assert not pagination._count_cache
+
+
+def test_count_cache_is_lru_bounded(clock, monkeypatch):
+    monkeypatch.setenv("COUNT_CACHE_MAX_ENTRIES", "3")
+    cursor = CountCursor()
+    for year in ("2021", "2022", "2023"):
+        cached_count(cursor, "green_walls", "year = %s", [year])
+    cached_count(cursor, "green_walls", "year = %s", ["2021"])  # 變成最近使用
+    cached_count(cursor, "green_walls", "year = %s", ["2024"])
+
+    keys = [key[2] for key in pagination._count_cache]
+    assert keys == [("2023",), ("2021",), ("2024",)]
+    assert len(cursor.queries) == 4
+
+
+def test_invalidate_count_by_table(clock):
+    cursor = CountCursor()
+    cached_count(cursor, "files")
+    cached_count(cursor, "result")
+    invalidate_count("files")
+    assert [key[0] for key in pagination._count_cache] == ["result"]
+    invalidate_count()
+    assert not pagination._count_cache
+
+
+def test_site_lists_paginate_unless_all_requested():
+    assert wants_keyset({})
+    assert wants_keyset({"year": "2024"})
+    assert wants_keyset({"all": "0"})
+    assert not wants_keyset({"all": "1"})
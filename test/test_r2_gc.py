@@ -0,0 +1,36 @@
+import pytest
+
+from r2_gc import claim_orphans
+
+KEYS = ["gc-test/old.jpg", "gc-test/reused.jpg", "gc-test/reserved.jpg", "gc-test/untracked.jpg"]
+
+
+@pytest.fixture
+def blobs(conn):
+    # claim_orphans 會 commit，所以測試資料自己清
+    def cleanup():
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM upload_reservations WHERE key = ANY(%s);", (KEYS,))
+            cursor.execute("DELETE FROM blobs WHERE key = ANY(%s);", (KEYS,))
+        conn.commit()
+
+    cleanup()
+    with conn.cursor() as cursor:
+        for key, age in (("gc-test/old.jpg", "3 days"), ("gc-test/reused.jpg", "0 seconds"),
+                         ("gc-test/reserved.jpg", "3 days")):
+            cursor.execute("""
+                INSERT INTO blobs (key, folder, sha256, size, refcount, last_used_at)
+                VALUES (%s, 'gc-test', sha256(convert_to(%s, 'UTF8')), 1, 0, now() - %s::interval);
+            """, (key, key, age))
+        cursor.execute("INSERT INTO upload_reservations (key, expires_at) VALUES (%s, now() + interval '1 hour');",
+                       ("gc-test/reserved.jpg",))
+    conn.commit()
+    yield
+    cleanup()
+
+
+def test_claim_orphans_skips_keys_used_during_scan(conn, blobs):
+    assert claim_orphans(conn, KEYS, grace_hours=24) == ["gc-test/old.jpg", "gc-test/untracked.jpg"]
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT key FROM blobs WHERE key = ANY(%s) ORDER BY key;", (KEYS,))
+        assert [key for (key,) in cursor.fetchall()] == ["gc-test/reserved.jpg", "gc-test/reused.jpg"]
@@ -0,0 +1,105 @@
+import io
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+import r2_utils
+from r2_utils import UploadTooLarge, r2_stream_upload
+
+
+class FakeS3:
+    # 記錄 multipart 呼叫；fail_parts = {part number: 要先失敗幾次}
+    def __init__(self, fail_parts=None):
+        self.fail_parts = dict(fail_parts or {})
+        self.parts = {}
+        self.attempts = {}
+        self.completed = None
+        self.aborted = False
+        self._lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key, **extra):
+        self.content_type = extra.get("ContentType")
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            self.attempts[PartNumber] = self.attempts.get(PartNumber, 0) + 1
+            if self.fail_parts.get(PartNumber, 0) > 0:
+                self.fail_parts[PartNumber] -= 1
+                raise ClientError({"Error": {"Code": "InternalError", "Message": "try again"}}, "UploadPart")
+            self.parts[PartNumber] = Body
+        return {"ETag": f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload["Parts"]
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    # 每段 16 bytes、一次讀 5 bytes，小資料就能切出多段；重試不用真的等
+    monkeypatch.setattr(r2_utils, "MIN_PART_SIZE", 16)
+    monkeypatch.setattr(r2_utils, "READ_CHUNK_SIZE", 5)
+    monkeypatch.setenv("R2_PART_SIZE_MB", "0")
+    monkeypatch.setenv("R2_PART_RETRIES", "2")
+    monkeypatch.setattr(r2_utils.time, "sleep", lambda seconds: None)
+    client = FakeS3()
+    monkeypatch.setattr(r2_utils, "r2_client", lambda: client)
+    return client
+
+
+def test_splits_stream_into_parts(s3):
+    data = bytes(range(40))
+    chunks = []
+    total = r2_stream_upload(io.BytesIO(data).read, "files/a.bin", "application/pdf", on_chunk=chunks.append)
+
+    assert total == 40
+    assert [part["PartNumber"] for part in s3.completed] == [1, 2, 3]
+    assert [len(s3.parts[n]) for n in (1, 2, 3)] == [16, 16, 8]
+    assert b"".join(s3.parts[n] for n in (1, 2, 3)) == data
+    assert b"".join(chunks) == data
+    assert s3.content_type == "application/pdf"
+    assert not s3.aborted
+
+
+def test_empty_stream_uploads_single_empty_part(s3):
+    assert r2_stream_upload(io.BytesIO(b"").read, "files/empty.bin") == 0
+    assert [part["PartNumber"] for part in s3.completed] == [1]
+
+
+def test_retries_only_the_failed_part(s3):
+    s3.fail_parts = {2: 2}
+    r2_stream_upload(io.BytesIO(bytes(40)).read, "files/a.bin")
+    assert s3.attempts == {1: 1, 2: 3, 3: 1}
+    assert len(s3.completed) == 3
+
+
+def test_aborts_when_part_keeps_failing(s3):
+    s3.fail_parts = {1: 5}
+    with pytest.raises(ClientError):
+        r2_stream_upload(io.BytesIO(bytes(40)).read, "files/a.bin")
+    assert s3.attempts[1] == 3
+    assert s3.aborted and s3.completed is None
+
+
+def test_aborts_when_over_max_bytes(s3):
+    with pytest.raises(UploadTooLarge):
+        r2_stream_upload(io.BytesIO(bytes(40)).read, "files/a.bin", max_bytes=20)
+    assert s3.aborted and s3.completed is None
+
+
+def test_aborts_when_client_disconnects(s3):
+    stream = io.BytesIO(bytes(20))
+
+    def read(n):
+        chunk = stream.read(n)
+        if not chunk:
+            raise ConnectionResetError("client disconnected")
+        return chunk
+
+    with pytest.raises(ConnectionResetError):
+        r2_stream_upload(read, "files/a.bin")
+    assert s3.aborted and s3.completed is None
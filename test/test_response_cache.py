@@ -0,0 +1,111 @@
+import contextlib
+import os
+import time
+
+import pytest
+from flask import Flask
+
+import response_cache
+from response_cache import ResponseCache, cache_key
+
+app = Flask(__name__)
+
+
+def _key(url):
+    with app.test_request_context(url):
+        return cache_key()
+
+
+def test_cache_key_escapes_values():
+    smuggled = _key("/api/green_walls?district=A%26year%3D2024")
+    real = _key("/api/green_walls?year=2024&district=A")
+    assert smuggled != real
+    assert real == "/api/green_walls?district=A&year=2024"
+
+
+def test_cache_key_ignores_argument_order_but_keeps_repeats():
+    assert _key("/api/sites/search?b=2&a=1&a=0") == _key("/api/sites/search?a=0&a=1&b=2")
+    assert _key("/api/sites/search?a=1") != _key("/api/sites/search?a=1&a=1")
+    assert _key("/api/files") != _key("/api/file")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 60, ["t"], b"a", 200, {})
+    cache.set("b", 60, ["t"], b"b", 200, {})
+    assert cache.get("a") is not None  # a 變成最近使用
+    cache.set("c", 60, ["t"], b"c", 200, {})
+    assert cache.get("b") is None
+    assert cache.get("a")[2] == b"a"
+    assert cache.get("c")[2] == b"c"
+
+
+def test_expired_entry_is_a_miss(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = ResponseCache()
+    cache.set("a", 5, ["t"], b"a", 200, {})
+    now[0] += 6
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_by_tag():
+    cache = ResponseCache()
+    cache.set("zones", 60, ["purification_zones"], b"", 200, {})
+    cache.set("summary", 60, ["purification_zones", "green_walls"], b"", 200, {})
+    cache.set("walls", 60, ["green_walls"], b"", 200, {})
+    cache.invalidate(["purification_zones"])
+    assert [cache.get(key) is not None for key in ("zones", "summary", "walls")] == [False, False, True]
+
+
+def test_invalidate_notifies_other_workers(monkeypatch):
+    sent = []
+
+    class Cursor:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, sql, params):
+            sent.append(params)
+
+    class Conn:
+        def cursor(self):
+            return Cursor()
+
+        def commit(self):
+            pass
+
+    monkeypatch.setattr(response_cache, "db_connection", contextlib.contextmanager(lambda: (yield Conn())))
+    hooked = []
+    monkeypatch.setattr(response_cache, "_hooks", [hooked.append])
+    response_cache.cache.set("k", 60, ["files"], b"", 200, {})
+
+    response_cache.invalidate("files")
+    assert response_cache.cache.get("k") is None
+    assert hooked == ["files"]
+    channel, payload = sent[0]
+    assert channel == response_cache.CHANNEL
+    assert '"tags": ["files"]' in payload and f'"pid": {os.getpid()}' in payload
+
+
+def test_listener_applies_notify_from_other_worker(conn):
+    response_cache.ensure_listener()
+    conn.autocommit = True
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        # listener 剛連上時會整個清空，所以 b 還在才算是 NOTIFY 生效
+        response_cache.cache.set("a", 60, ["notify_a"], b"", 200, {})
+        response_cache.cache.set("b", 60, ["notify_b"], b"", 200, {})
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, %s);", (response_cache.CHANNEL, '{"pid": 0, "tags": ["notify_a"]}'))
+        for _ in range(20):
+            time.sleep(0.05)
+            if response_cache.cache.get("a") is None:
+                break
+        if response_cache.cache.get("a") is None and response_cache.cache.get("b") is not None:
+            return
+    pytest.fail("notify was not applied")
@@ -0,0 +1,103 @@
+import datetime
+
+import pytest
+
+from site_import import SiteImportError, import_sites, map_header, validate_row
+
+HEADER = ["序號", "設置年度", "鄉鎮別", "類別", "基地/計劃名稱", "基地面積 (平方公尺)", "認養開始日期", "認養結束日期"]
+
+
+def _row(serial="A-1", area="1,234.5", start="113/01/15", end="2025-01-14"):
+    return [serial, "113", "南投市", "綠牆", "國小圍牆", area, start, end]
+
+
+def test_map_header_accepts_labels_and_columns():
+    columns, ignored = map_header(["serial", "設置年度", "", None, "備考欄"])
+    assert columns == ["serial", "year", None, None, None]
+    assert ignored == ["備考欄"]
+    with pytest.raises(SiteImportError):
+        map_header(["serial", "序號"])
+
+
+def test_validate_row_parses_numbers_and_roc_dates():
+    columns, _ = map_header(HEADER)
+    record, errors = validate_row("green_walls", columns, _row())
+    assert errors == []
+    assert record["area"] == 1234.5
+    assert record["maintain_start_date"] == datetime.date(2024, 1, 15)
+    assert record["maintain_end_date"] == datetime.date(2025, 1, 14)
+
+
+@pytest.mark.parametrize("area", ["nan", "NaN", "inf", "-Infinity", float("nan"), float("inf")])
+def test_validate_row_rejects_non_finite_numbers(area):
+    columns, _ = map_header(HEADER)
+    _, errors = validate_row("green_walls", columns, _row(area=area))
+    assert errors == [f"area 格式錯誤：{area}"]
+
+
+def test_validate_row_reports_every_problem():
+    columns, _ = map_header(HEADER)
+    _, errors = validate_row("green_walls", columns, [None, "113", "南投市", "綠牆", "國小", "-3", "2025/2/30", "2024-01-01"])
+    assert errors == ["maintain_start_date 格式錯誤：2025/2/30", "serial 必填", "area 不可為負數"]
+
+
+# ---------------------------- 合併筆數（需要 DATABASE_URL 的 Postgres，conftest 的 conn） -----------------------------
+
+def test_merge_counts_each_import_line_once(conn):
+    with conn.cursor() as cur:
+        # 舊資料同一個 (serial, year) 有兩列
+        for serial, district in (("TEST-IMPORT-1", "埔里鎮"), ("TEST-IMPORT-1", "埔里鎮"), ("TEST-IMPORT-2", "南投市")):
+            cur.execute("""
+                INSERT INTO green_walls (serial, year, district, type, project_name)
+                VALUES (%s, '113', %s, '綠牆', '國小圍牆');
+            """, (serial, district))
+
+    rows = [
+        ["序號", "設置年度", "鄉鎮別", "類別", "基地/計劃名稱"],
+        ["TEST-IMPORT-1", "113", "南投市", "綠牆", "國小圍牆"],
+        ["TEST-IMPORT-2", "113", "南投市", "綠牆", "國小圍牆"],
+        ["TEST-IMPORT-3", "113", "南投市", "綠牆", "國小圍牆"],
+    ]
+    report = import_sites(conn, "green_walls", rows, commit=False)
+    assert report["errors"] == []
+    assert (report["valid"], report["updated"], report["inserted"], report["unchanged"]) == (3, 1, 1, 1)
+    assert report["committed"] is False
+
+
+
+class KeepTransaction:
+    # import_sites(commit=False) 最後會 rollback；測試要在同一個 transaction 裡查結果，由 conn fixture 收尾
+    def __init__(self, conn):
+        self._conn = conn
+
+    def rollback(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def test_partial_header_only_updates_present_columns(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO green_walls (serial, year, district, type, project_name, gps, annotation,
+                                     maintain_unit, maintain_end_date)
+            VALUES ('TEST-IMPORT-P', '113', '埔里鎮', '綠牆', '舊名稱', '23.9, 120.9', '保留',
+                    '維護單位', '2025-06-30')
+            RETURNING id;
+        """)
+        row_id = cur.fetchone()[0]
+
+    rows = [
+        ["序號", "設置年度", "鄉鎮別", "類別", "基地/計劃名稱"],
+        ["TEST-IMPORT-P", "113", "埔里鎮", "綠牆", "新名稱"],
+    ]
+    report = import_sites(KeepTransaction(conn), "green_walls", rows, commit=False)
+    assert (report["updated"], report["inserted"], report["unchanged"]) == (1, 0, 0)
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT project_name, gps, annotation, maintain_unit, maintain_end_date
+            FROM green_walls WHERE id = %s;
+        """, (row_id,))
+        assert cur.fetchone() == ("新名稱", "23.9, 120.9", "保留", "維護單位", datetime.date(2025, 6, 30))
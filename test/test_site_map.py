@@ -0,0 +1,49 @@
+import pytest
+
+from site_map import parse_bbox
+from site_search import SearchError
+
+
+def test_parse_bbox():
+    assert parse_bbox("120.6,23.8,120.8,24.0") == (120.6, 23.8, 120.8, 24.0)
+    assert parse_bbox(" 120.6, 23.8 ,120.8,24") == (120.6, 23.8, 120.8, 24.0)
+    assert parse_bbox("") is None
+    assert parse_bbox(None) is None
+
+
+@pytest.mark.parametrize("value", [
+    "120.6,23.8,120.8",        # 少一個
+    "120.6,23.8,120.8,24,1",   # 多一個
+    "a,23.8,120.8,24",
+    "nan,23.8,120.8,24",
+    "120.6,23.8,inf,24",
+    "120.8,23.8,120.6,24",     # 西 > 東
+    "120.6,24,120.8,23.8",     # 南 > 北
+])
+def test_parse_bbox_rejects_bad_values(value):
+    with pytest.raises(SearchError):
+        parse_bbox(value)
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("23.9, 120.7", [23.9, 120.7]),
+    ("23.9,120.7", [23.9, 120.7]),
+    ("(23.9, 120.7)", [23.9, 120.7]),
+    ("[23.9 120.7]", [23.9, 120.7]),
+    ("23.9，120.7", [23.9, 120.7]),     # 全形逗號
+    ("23.9; 120.7", [23.9, 120.7]),
+    ("120.7, 23.9", [23.9, 120.7]),     # 經度寫在前面
+    ("-33.86, 151.2", [-33.86, 151.2]),
+    ("24, 121", [24.0, 121.0]),
+])
+def test_parse_gps_formats(conn, raw, expected):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT parse_gps(%s);", (raw,))
+        assert cursor.fetchone()[0] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("raw", [None, "", "南投市", "0, 0", "95, 200", "23.9", "23.9, 120.7, 5", "N23.9 E120.7"])
+def test_parse_gps_rejects_unparseable(conn, raw):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT parse_gps(%s);", (raw,))
+        assert cursor.fetchone()[0] is None
@@ -0,0 +1,167 @@
+import argparse
+import html
+import re
+
+import psycopg2
+
+from pagination import parse_limit, parse_page
+from site_search import SearchError
+
+# 樹種 / 成果文章的關鍵字搜尋：pg_trgm 的 GIN trigram index 支援 ILIKE '%關鍵字%'，
+# 中文不需要斷詞（資料庫 locale 要是 UTF-8，CJK 字元才會算進 trigram）。
+#   GET /api/tree_intros/search?q=櫸木&page=1&limit=12
+#   GET /api/result/search?q=植樹&page=1&limit=8
+# 排序：標題命中 > 學名 > 內文，同分再比 word_similarity（學名拼錯幾個字也找得到）。
+# snippet 是已經 escape 過的 HTML，命中的字用 <mark> 包起來。
+# 沒有 pg_trgm 的資料庫（migration 9 會跳過）照樣能查，只是變成循序掃描、沒有模糊比對；
+# 之後裝好 extension 再跑 python text_search.py index 補建 index。
+MAX_QUERY_LENGTH = 100
+SNIPPET_BEFORE = 30
+SNIPPET_LENGTH = 120
+BLOCK_TAG_PATTERN = re.compile(r"</?(?:p|br|div|li|tr|h[1-6])\b[^>]*>", re.IGNORECASE)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# table → (比對欄位與權重, 模糊比對欄位, snippet 欄位, 回傳欄位)
+SEARCH_TABLES = {
+    "tree_intros": (
+        (("title", 4), ("scientific_name", 2), ("features", 1)),
+        ("title", "scientific_name"),
+        "features",
+        ("id", "title", "scientific_name", "image_url", "image_variants"),
+    ),
+    "result": (
+        (("title", 4), ("content", 1)),
+        ("title",),
+        "content",
+        ("id", "title", "date", "image_url", "image_variants"),
+    ),
+}
+
+_has_trgm = None
+
+
+def create_indexes(cursor):
+    # 回傳是否有 pg_trgm；沒有就什麼都不做
+    cursor.execute("SAVEPOINT trgm;")
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT trgm;")
+        print("[⚠️] pg_trgm unavailable, text search will use sequential scans:", str(e).strip())
+        return False
+    cursor.execute("RELEASE SAVEPOINT trgm;")
+
+    for table, (fields, _, _, _) in SEARCH_TABLES.items():
+        for column, _ in fields:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops);")
+    return True
+
+
+def has_trgm(cursor):
+    global _has_trgm
+    if _has_trgm is None:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS installed;")
+        row = cursor.fetchone()
+        _has_trgm = bool(row["installed"] if isinstance(row, dict) else row[0])
+    return _has_trgm
+
+
+def highlight(text, keyword):
+    # 去掉 HTML 標籤，取命中位置附近一段，escape 後把關鍵字包 <mark>
+    text = TAG_PATTERN.sub("", BLOCK_TAG_PATTERN.sub(" ", text or ""))
+    text = " ".join(html.unescape(text).split())
+    start = text.casefold().find(keyword.casefold())
+    if start < 0:
+        snippet = text[:SNIPPET_LENGTH]
+        return html.escape(snippet) + ("…" if len(text) > SNIPPET_LENGTH else "")
+
+    begin = max(0, start - SNIPPET_BEFORE)
+    snippet = text[begin:begin + SNIPPET_LENGTH]
+    pattern = re.compile(re.escape(keyword), re.IGNORECASE)
+    parts = []
+    last = 0
+    for match in pattern.finditer(snippet):
+        parts.append(html.escape(snippet[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        last = match.end()
+    parts.append(html.escape(snippet[last:]))
+    return ("…" if begin else "") + "".join(parts) + ("…" if begin + SNIPPET_LENGTH < len(text) else "")
+
+
+def search_text(cursor, table, args, default_limit=12):
+    fields, fuzzy_fields, snippet_field, columns = SEARCH_TABLES[table]
+    keyword = " ".join((args.get("q") or "").split())
+    if not keyword:
+        raise SearchError("缺少 q")
+    if len(keyword) > MAX_QUERY_LENGTH:
+        raise SearchError(f"q 最多 {MAX_QUERY_LENGTH} 字")
+    page = parse_page(args)
+    limit = parse_limit(args, default=default_limit)
+
+    params = {
+        "q": keyword,
+        "pattern": "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",
+        "limit": limit,
+        "offset": (page - 1) * limit,
+    }
+    matches = [f"{column} ILIKE %(pattern)s" for column, _ in fields]
+    rank = " + ".join(f"({column} ILIKE %(pattern)s)::int * {weight}" for column, weight in fields)
+    if has_trgm(cursor):
+        # %(q)s <%% column：word_similarity 超過 pg_trgm.word_similarity_threshold（預設 0.6）
+        matches += [f"%(q)s <%% {column}" for column in fuzzy_fields]
+        rank += " + " + " + ".join(f"word_similarity(%(q)s, {column})" for column in fuzzy_fields)
+    where_sql = " OR ".join(matches)
+
+    cursor.execute(f"SELECT COUNT(*) AS total FROM {table} WHERE {where_sql};", params)
+    total = cursor.fetchone()["total"]
+
+    # 內層只算分數排序取一頁，外層再取這一頁的欄位
+    cursor.execute(f"""
+        SELECT {", ".join(f"t.{column}" for column in columns)},
+               t.{snippet_field} AS snippet_source, hit.rank
+        FROM (
+            SELECT id, {rank} AS rank
+            FROM {table}
+            WHERE {where_sql}
+            ORDER BY rank DESC, id DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        ) hit
+        JOIN {table} t USING (id)
+        ORDER BY hit.rank DESC, t.id DESC;
+    """, params)
+    items = []
+    for row in cursor.fetchall():
+        row["snippet"] = highlight(row.pop("snippet_source"), keyword)
+        row["rank"] = round(float(row["rank"]), 3)
+        items.append(row)
+
+    return {
+        "items": items,
+        "total": total,
+        "page": page,
+        "pages": max(1, -(-total // limit)),
+        "q": keyword,
+    }
+
+
+def main():
+    from dotenv import load_dotenv
+    from db_init import get_db_connection
+
+    parser = argparse.ArgumentParser(description="建立樹種 / 成果文章搜尋用的 pg_trgm index")
+    parser.add_argument("command", choices=["index"])
+    parser.parse_args()
+
+    load_dotenv()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            ok = create_indexes(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    print("[✅] trigram indexes ready" if ok else "[❌] pg_trgm 無法安裝")
+
+
+if __name__ == "__main__":
+    main()